@@ -0,0 +1,122 @@
+"""
+Benchmark of the address autocomplete latency at full country scale.
+
+A synthetic unified CEP table with about the size of the DNE (~1M CEPs in 5570
+municipios, a few of them with tens of thousands of streets) is indexed, and
+prefixes and misspellings of its streets are suggested, with and without the
+municipio.
+
+    uv run python benchmarks/autocomplete.py [--ceps 1000000] [--queries 2000]
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from edne_correios_loader.autocomplete import AutocompleteIndex
+from edne_correios_loader.uf_filter import UFS
+
+TYPES = ["Rua", "Avenida", "Travessa", "Alameda", "Praça", "Estrada", "Viela"]
+TITLES = ["", "", "", "Doutor", "Professor", "Coronel", "Padre", "Santa", "São"]
+FIRST_NAMES = [
+    "Ana", "Antônio", "Benedito", "Carlos", "Cecília", "Francisco", "Helena",
+    "Ingrid", "João", "José", "Luís", "Maria", "Otávio", "Paulo", "Pedro", "Rita",
+    "Rosa", "Sebastião", "Teresa", "Vicente",
+]  # fmt: skip
+SURNAMES = [
+    "Almeida", "Barbosa", "Cardoso", "Costa", "Ferreira", "Gomes", "Lima",
+    "Machado", "Martins", "Nogueira", "Oliveira", "Pereira", "Ribeiro", "Rocha",
+    "Santos", "Silva", "Souza", "Teixeira", "Vieira", "Xavier",
+]  # fmt: skip
+WORDS = [
+    "Acácias", "Bandeirantes", "Flores", "Girassóis", "Ipês", "Palmeiras",
+    "Paulista", "Pioneiros", "Primavera", "Tiradentes", "Vitória", "Independência",
+]  # fmt: skip
+
+
+def random_street(rnd: random.Random) -> str:
+    if rnd.random() < 0.3:
+        name = f"das {rnd.choice(WORDS)}"
+    else:
+        title = rnd.choice(TITLES)
+        name = " ".join(
+            p for p in (title, rnd.choice(FIRST_NAMES), rnd.choice(SURNAMES)) if p
+        )
+
+    return f"{rnd.choice(TYPES)} {name}"
+
+
+def build_rows(ceps: int, rnd: random.Random):
+    municipios = [(f"Município {i}", UFS[i % len(UFS)]) for i in range(5570)]
+    # a few big cities hold most of the streets
+    weights = [1 / (i + 1) for i in range(len(municipios))]
+
+    for i, (municipio, uf) in enumerate(
+        rnd.choices(municipios, weights=weights, k=ceps)
+    ):
+        yield {
+            "cep": f"{i * 97 % 100_000_000:08d}",
+            "logradouro": random_street(rnd),
+            "bairro": f"Bairro {rnd.randrange(200)}",
+            "municipio": municipio,
+            "uf": uf,
+            "nome": None,
+        }
+
+
+def misspell(text: str, rnd: random.Random) -> str:
+    i = rnd.randrange(len(text) - 1)
+    return text[:i] + text[i + 1] + text[i] + text[i + 2 :]
+
+
+def measure(label, index, queries):
+    timings = []
+
+    for query in queries:
+        started = time.perf_counter()
+        index.suggest(**query)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    timings.sort()
+    print(
+        f"{label:<32} p50 {statistics.median(timings):6.2f}ms  "
+        f"p95 {timings[int(len(timings) * 0.95)]:6.2f}ms  "
+        f"p99 {timings[int(len(timings) * 0.99)]:6.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ceps", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    rows = list(build_rows(args.ceps, rnd))
+
+    started = time.perf_counter()
+    index = AutocompleteIndex(rows)
+    print(
+        f"Indexed {len(index)} addresses of {args.ceps} CEPs "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+
+    samples = rnd.sample(rows, args.queries)
+    prefixes = [row["logradouro"][: rnd.randint(5, 15)] for row in samples]
+    typos = [misspell(row["logradouro"], rnd) for row in samples]
+
+    for label, texts in (("prefix", prefixes), ("misspelled", typos)):
+        measure(
+            f"{label}, in the municipio",
+            index,
+            [
+                {"text": t, "municipio": r["municipio"], "uf": r["uf"]}
+                for t, r in zip(texts, samples, strict=True)
+            ],
+        )
+        measure(f"{label}, in the country", index, [{"text": t} for t in texts])
+
+
+if __name__ == "__main__":
+    main()
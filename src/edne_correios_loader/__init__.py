@@ -1,4 +1,10 @@
+from .autocomplete import AddressAutocomplete  # noqa: F401
+from .caixa_postal import CaixaPostalQuerier  # noqa: F401
+from .cep_bitmap import CepBitmap  # noqa: F401
 from .cep_querier import CepQuerier  # noqa: F401
+from .cep_ranges import CepRangeQuerier, UfClassifier  # noqa: F401
+from .clean_strategy import CleanStrategyEnum  # noqa: F401
 from .loader import DneLoader  # noqa: F401
+from .search import CepSearcher  # noqa: F401
 from .table_set import TableSetEnum  # noqa: F401
 from .tables import TableNameResolver  # noqa: F401
@@ -0,0 +1,406 @@
+import heapq
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from operator import itemgetter
+
+import sqlalchemy as sa
+
+from .search import normalize_text
+from .state import get_loaded_at
+from .tables import TableNameResolver, build_metadata, format_cep, get_table, parse_cep
+
+logger = logging.getLogger(__name__)
+
+
+def word_trigrams(word: str, *, prefix: bool = False) -> set[str]:
+    """
+    Get the trigrams of a word, padded so its start weighs more and short words
+    have trigrams too. With `prefix`, the word may be incomplete, so its end
+    isn't marked.
+    """
+    padded = f"  {word}" if prefix else f"  {word} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """
+    Inverted index of the words of normalized texts, finding the texts with all
+    the words of a query, the last one taken as a prefix. Misspelled words are
+    matched to the similar words of the texts through the trigrams of the words.
+
+    Texts are identified by their position. The posting list of each word is a
+    sorted array of these positions, 4 bytes each, so the texts of a range of
+    positions are found with a binary search. Texts matching all the words as
+    typed are found in the order of their positions, and the search stops as
+    soon as there are enough of them, so the best texts should come first.
+    """
+
+    # words matching too many vocabulary words (e.g. short prefixes) are checked
+    # in the texts found by the other words, instead of merging their postings
+    max_merged_words = 64
+    # misspelled words are only matched to the most similar vocabulary words
+    max_similar_words = 16
+
+    def __init__(self, texts: Sequence[str]):
+        self.texts = texts
+        postings: dict[str, array] = defaultdict(lambda: array("I"))
+
+        for position, text in enumerate(texts):
+            for word in set(text.split()):
+                postings[word].append(position)
+
+        self.words = sorted(postings)
+        self.word_ids = {word: i for i, word in enumerate(self.words)}
+        self.postings = [postings[word] for word in self.words]
+
+        trigrams: dict[str, array] = defaultdict(lambda: array("I"))
+        for i, word in enumerate(self.words):
+            for trigram in word_trigrams(word):
+                trigrams[trigram].append(i)
+
+        self.trigrams = dict(trigrams)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def search(
+        self,
+        text: str,
+        ranges: Iterable[tuple[int, int]] | None = None,
+        *,
+        min_similarity: float = 0.5,
+        limit: int = 10,
+    ) -> list[tuple[int, float]]:
+        """
+        Find the texts with all the words of a normalized query, among the given
+        (start, stop) position ranges.
+
+        Returns (position, similarity) tuples, best first. Texts with all the words
+        as typed have similarity 1 and come first, by position. When they aren't
+        enough, the words are also matched to vocabulary words with at least
+        `min_similarity` of their trigrams, and the similarity of the texts is the
+        average similarity of their words.
+        """
+        words = text.split()
+        ranges = list(ranges) if ranges is not None else [(0, len(self))]
+        found = {}
+
+        if not words:
+            return []
+
+        for fuzzy in (False, True):
+            matchers = [
+                self.match_word(
+                    word,
+                    prefix=i == len(words) - 1,
+                    fuzzy=fuzzy,
+                    min_similarity=min_similarity,
+                )
+                for i, word in enumerate(words)
+            ]
+
+            if all(matchers):
+                for start, stop in ranges:
+                    for position, similarity in self.find(
+                        matchers, start, stop, limit=None if fuzzy else limit
+                    ):
+                        found.setdefault(position, similarity)
+
+            if len(found) >= limit:
+                break
+
+        return heapq.nsmallest(limit, found.items(), key=lambda f: (-f[1], f[0]))
+
+    def match_word(
+        self, word: str, *, prefix: bool, fuzzy: bool, min_similarity: float
+    ) -> dict[int, float]:
+        """
+        Get the ids of the vocabulary words matching a query word, with their
+        similarity to it.
+        """
+        if prefix:
+            first = bisect_left(self.words, word)
+            last = bisect_left(self.words, word + "\uffff", first)
+            matches = dict.fromkeys(range(first, last), 1.0)
+        else:
+            word_id = self.word_ids.get(word)
+            matches = {} if word_id is None else {word_id: 1.0}
+
+        if not fuzzy:
+            return matches
+
+        trigrams = word_trigrams(word, prefix=prefix)
+        counts = Counter()
+        for trigram in trigrams:
+            counts.update(self.trigrams.get(trigram, ()))
+
+        similar = []
+        for word_id, count in counts.items():
+            # padded words have as many trigrams as letters plus one
+            size = max(len(trigrams), 0 if prefix else len(self.words[word_id]) + 1)
+            similarity = count / size
+
+            if similarity >= min_similarity and word_id not in matches:
+                similar.append((similarity, word_id))
+
+        for similarity, word_id in heapq.nlargest(self.max_similar_words, similar):
+            matches[word_id] = similarity
+
+        return matches
+
+    def find(
+        self, matchers: list[dict[int, float]], start: int, stop: int, limit: int | None
+    ) -> Iterator[tuple[int, float]]:
+        """
+        Find the texts matching all the words, by position, with their similarity.
+        The postings of the word with the fewest texts are merged and the other
+        words are checked in each text.
+        """
+        postings = []
+
+        for matcher in matchers:
+            if len(matcher) > self.max_merged_words:
+                continue
+
+            slices = []
+            for word_id in matcher:
+                posting = self.postings[word_id]
+                lo = bisect_left(posting, start)
+                hi = bisect_left(posting, stop, lo)
+                if hi > lo:
+                    slices.append(memoryview(posting)[lo:hi])
+
+            postings.append((sum(map(len, slices)), slices))
+
+        if postings:
+            _, slices = min(postings, key=itemgetter(0))
+            positions = heapq.merge(*slices)
+        elif limit is not None:
+            positions = range(start, stop)
+        else:
+            # too many texts to check them all
+            return
+
+        found = 0
+        previous = None
+
+        for position in positions:
+            if position == previous:
+                continue
+
+            previous = position
+            similarity = self.similarity(position, matchers)
+
+            if similarity:
+                yield position, similarity
+                found += 1
+
+                if found == limit:
+                    return
+
+    def similarity(self, position: int, matchers: list[dict[int, float]]) -> float:
+        word_ids = [self.word_ids[word] for word in self.texts[position].split()]
+        total = 0
+
+        for matcher in matchers:
+            best = max((matcher.get(word_id, 0) for word_id in word_ids), default=0)
+
+            if not best:
+                return 0
+
+            total += best
+
+        return total / len(matchers)
+
+
+class AutocompleteIndex:
+    """
+    Suggestions of addresses (street or name, bairro, municipio and UF) for
+    partially typed texts, from the rows of the unified CEP table.
+
+    The addresses are sorted by UF and municipio, so the addresses of each one
+    are a range of positions of the trigram index, and then by their number of
+    CEPs, so the main streets are suggested first.
+    """
+
+    def __init__(self, rows: Iterable[Mapping], *, min_similarity: float = 0.5):
+        self.min_similarity = min_similarity
+        strings = {}
+
+        def intern(value):
+            return strings.setdefault(value, value)
+
+        ceps = defaultdict(set)
+        for row in rows:
+            name = row["logradouro"] or row["nome"]
+
+            # CEPs without street or name (e.g. of small towns) aren't suggested
+            if not name:
+                continue
+
+            key = (
+                intern(row["uf"]),
+                intern(normalize_text(row["municipio"])),
+                normalize_text(name, row["bairro"]),
+                name,
+                intern(row["bairro"]),
+                intern(row["municipio"]),
+            )
+            ceps[key].add(parse_cep(row["cep"]))
+
+        keys = sorted(ceps, key=lambda k: (k[0], k[1], -len(ceps[k]), len(k[2]), k))
+        # address fields, and its CEPs from ceps[cep_offsets[i]] on
+        self.addresses = [
+            (name, bairro, municipio, uf) for uf, _, _, name, bairro, municipio in keys
+        ]
+        self.ceps = array("I")
+        self.cep_offsets = array("I")
+        # position range of the addresses of each UF and (UF, municipio)
+        self.ranges: dict[tuple[str, ...], tuple[int, int]] = {}
+        self.municipio_ufs: dict[str, list[str]] = defaultdict(list)
+
+        for position, key in enumerate(keys):
+            uf, municipio_key = key[:2]
+            self.cep_offsets.append(len(self.ceps))
+            self.ceps.extend(sorted(ceps.pop(key)))
+
+            for range_key in ((uf,), (uf, municipio_key)):
+                first, _ = self.ranges.get(range_key, (position, position))
+                self.ranges[range_key] = (first, position + 1)
+
+            if self.ranges[uf, municipio_key][0] == position:
+                self.municipio_ufs[municipio_key].append(uf)
+
+        self.cep_offsets.append(len(self.ceps))
+        self.index = TrigramIndex([key[2] for key in keys])
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def suggest(
+        self,
+        text: str,
+        municipio: str | None = None,
+        uf: str | None = None,
+        limit: int = 10,
+    ) -> list[dict]:
+        """
+        Suggest addresses for a partially typed (or misspelled) street or name,
+        optionally followed by its bairro. Suggestions are meant to be restricted
+        to a municipio: without it, the addresses as typed are found by UF and
+        municipio, not by their number of CEPs.
+        """
+        uf = uf.strip().upper() if uf else None
+
+        if municipio:
+            municipio = normalize_text(municipio)
+            ufs = [uf] if uf else self.municipio_ufs.get(municipio, [])
+            range_keys = [(uf, municipio) for uf in ufs]
+        else:
+            range_keys = [(uf,)] if uf else None
+
+        if range_keys is None:
+            ranges = None
+        else:
+            ranges = [self.ranges[k] for k in range_keys if k in self.ranges]
+            if not ranges:
+                return []
+
+        found = self.index.search(
+            normalize_text(text),
+            ranges,
+            min_similarity=self.min_similarity,
+            limit=limit,
+        )
+
+        return [self.build_suggestion(*f) for f in found]
+
+    def build_suggestion(self, position: int, similarity: float) -> dict:
+        name, bairro, municipio, uf = self.addresses[position]
+        ceps = self.ceps[self.cep_offsets[position] : self.cep_offsets[position + 1]]
+
+        return {
+            "logradouro": name,
+            "bairro": bairro,
+            "municipio": municipio,
+            "uf": uf,
+            "ceps": [format_cep(cep) for cep in ceps],
+            "similarity": round(similarity, 3),
+        }
+
+
+class AddressAutocomplete:
+    """
+    Address suggestions from an in-memory index of the unified CEP table (see
+    AutocompleteIndex), built on the first suggestion.
+
+    `refresh` rebuilds the index when the table was loaded again since it was
+    built. Suggestions keep using the previous index while the new one is built.
+    """
+
+    def __init__(
+        self,
+        database_url: str,
+        table_names: TableNameResolver | None = None,
+        *,
+        cep_as_integer: bool = False,
+        min_similarity: float = 0.5,
+    ):
+        """
+        cep_as_integer must match the option used to load the unified CEP table.
+        """
+        self.engine = sa.create_engine(database_url, echo=False)
+        self.cep_table = get_table(
+            build_metadata(table_names, cep_as_integer=cep_as_integer), "cep_unificado"
+        )
+        self.min_similarity = min_similarity
+        self.index: AutocompleteIndex | None = None
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def refresh(self) -> bool:
+        """
+        Rebuild the index if the unified CEP table was loaded since it was built.
+        Returns False if it's up to date.
+        """
+        with self.lock:
+            with self.engine.connect() as conn:
+                loaded_at = get_loaded_at(conn, self.cep_table.name)
+
+                if self.index is not None and loaded_at == self.loaded_at:
+                    return False
+
+                columns = ["cep", "logradouro", "bairro", "municipio", "uf", "nome"]
+                rows = conn.execute(
+                    sa.select(*(self.cep_table.c[c] for c in columns))
+                ).mappings()
+                index = AutocompleteIndex(rows, min_similarity=self.min_similarity)
+
+            self.index, self.loaded_at = index, loaded_at
+
+        logger.info(
+            "Built the autocomplete index of %d addresses",
+            len(index),
+            extra={"indentation": 0},
+        )
+
+        return True
+
+    def suggest(
+        self,
+        text: str,
+        municipio: str | None = None,
+        uf: str | None = None,
+        limit: int = 10,
+    ) -> list[dict]:
+        """
+        See AutocompleteIndex.suggest.
+        """
+        if self.index is None:
+            self.refresh()
+
+        return self.index.suggest(text, municipio=municipio, uf=uf, limit=limit)
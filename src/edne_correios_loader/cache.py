@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+import shutil
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_MAX_SIZE = 4 * 1024 * 1024 * 1024
+
+
+class DneCache:
+    """
+    Persistent cache of extracted DNE releases, shared by all the loads using the
+    same cache directory.
+
+    Releases are content-addressed: each one is stored in a directory named after
+    the SHA-256 of its ZIP file. An index maps the HTTP validators (ETag and
+    Last-Modified) of the downloaded URLs to these hashes, so an unchanged release
+    is found without downloading it again.
+
+    Layout:
+        <cache_dir>/index.json       - URL validators -> release hash
+        <cache_dir>/releases/<hash>/ - extracted DNE files
+        <cache_dir>/downloads/       - downloads in progress (resumable)
+        <cache_dir>/tmp/             - releases being extracted
+
+    When the releases exceed `max_size` bytes, the least recently used ones are
+    removed.
+    """
+
+    def __init__(self, cache_dir: str | Path, max_size: int | None = None):
+        self.cache_dir = Path(cache_dir)
+        self.max_size = DEFAULT_CACHE_MAX_SIZE if max_size is None else max_size
+
+        self.releases_dir = self.cache_dir / "releases"
+        self.downloads_dir = self.cache_dir / "downloads"
+        self.tmp_dir = self.cache_dir / "tmp"
+        self.index_path = self.cache_dir / "index.json"
+
+        for directory in (self.releases_dir, self.downloads_dir, self.tmp_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+    def get(self, content_hash: str) -> Path | None:
+        """
+        Get the directory of a cached release, marking it as recently used.
+        """
+        release_dir = self.releases_dir / content_hash
+
+        if not release_dir.is_dir():
+            return None
+
+        logger.info(
+            "Using cached DNE release %s", content_hash[:12], extra={"indentation": 0}
+        )
+        release_dir.touch()
+        return release_dir
+
+    def get_by_validators(self, url_key: str | None) -> Path | None:
+        if url_key is None or (content_hash := self.read_index().get(url_key)) is None:
+            return None
+
+        return self.get(content_hash)
+
+    def store(self, content_hash: str, extracted_dir: Path) -> Path:
+        """
+        Move an extracted release into the cache. The extracted directory must be
+        in the same filesystem as the cache (e.g. inside `tmp_dir`), so it's
+        atomically renamed.
+        """
+        release_dir = self.releases_dir / content_hash
+
+        try:
+            extracted_dir.rename(release_dir)
+            logger.debug("Stored DNE release in cache: %s", release_dir)
+        except OSError:
+            # another load stored the same release in the meantime
+            if not release_dir.is_dir():
+                raise
+
+        self.evict(keep=content_hash)
+        return release_dir
+
+    def save_validators(self, url_key: str | None, content_hash: str):
+        if url_key is not None:
+            index = self.read_index()
+            index[url_key] = content_hash
+            self.write_index(index)
+
+    def download_path(self, url: str) -> Path:
+        """
+        Downloads of the same URL share a path, so an interrupted download is
+        resumed by the next load.
+        """
+        return self.downloads_dir / f"{hashlib.sha256(url.encode()).hexdigest()}.zip"
+
+    def evict(self, keep: str | None = None):
+        """
+        Remove the least recently used releases until the cache fits `max_size`.
+        """
+        releases = sorted(
+            (r for r in self.releases_dir.iterdir() if r.is_dir()),
+            key=lambda r: r.stat().st_mtime,
+        )
+        sizes = {r: directory_size(r) for r in releases}
+        total_size = sum(sizes.values())
+
+        for release in releases:
+            if total_size <= self.max_size:
+                break
+
+            if release.name == keep:
+                continue
+
+            logger.info(
+                "Removing DNE release %s from cache",
+                release.name[:12],
+                extra={"indentation": 0},
+            )
+            shutil.rmtree(release)
+            total_size -= sizes[release]
+
+        # forget validators pointing to evicted releases
+        index = self.read_index()
+        kept = {k: v for k, v in index.items() if (self.releases_dir / v).is_dir()}
+        if kept != index:
+            self.write_index(kept)
+
+    def read_index(self) -> dict[str, str]:
+        try:
+            return json.loads(self.index_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def write_index(self, index: dict[str, str]):
+        tmp_index = self.index_path.with_suffix(".tmp")
+        tmp_index.write_text(json.dumps(index, indent=2))
+        tmp_index.replace(self.index_path)
+
+
+def url_cache_key(url: str, headers) -> str | None:
+    """
+    Build a key identifying a URL release from its HTTP validators.
+    Returns None if the server doesn't send any validator.
+    """
+    etag = headers.get("ETag")
+    last_modified = headers.get("Last-Modified")
+
+    if not etag and not last_modified:
+        return None
+
+    return f"{url} etag={etag} last-modified={last_modified}"
+
+
+def file_hash(path: Path, buffer_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+
+    with path.open("rb") as file:
+        while block := file.read(buffer_size):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def directory_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
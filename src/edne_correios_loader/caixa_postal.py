@@ -0,0 +1,135 @@
+from collections.abc import Iterable
+
+import sqlalchemy as sa
+
+from .cep_ranges import RangeIndex
+from .tables import TableNameResolver, build_metadata, format_cep, get_table
+
+
+def parse_caixa_postal(caixa_postal: str | int | None) -> int | None:
+    """
+    Convert a caixa postal number (e.g. "1234" or 1234) to an integer.
+    Returns None if it isn't a valid number.
+    """
+    if isinstance(caixa_postal, str):
+        caixa_postal = caixa_postal.strip()
+
+        if not caixa_postal.isdigit():
+            return None
+
+        return int(caixa_postal)
+
+    if isinstance(caixa_postal, int) and caixa_postal >= 0:
+        return caixa_postal
+
+    return None
+
+
+class CaixaPostalQuerier:
+    """
+    Find the unidade operacional (`log_unid_oper`) of a caixa postal from the caixa
+    postal ranges of each unit in `log_faixa_uop`, only kept in the database by the
+    "all" table set.
+
+    The ranges and units are loaded into memory on the first query, so many boxes
+    can be validated quickly. `query_database` runs the equivalent SQL query instead.
+    """
+
+    def __init__(self, database_url: str, table_names: TableNameResolver | None = None):
+        self.engine = sa.create_engine(database_url, echo=False)
+        self.metadata = build_metadata(table_names)
+        # caixa postal ranges and record of each unit, by its key
+        self.indexes: dict[int, RangeIndex] | None = None
+        self.unidades: dict[int, dict] = {}
+
+    def load(self):
+        """
+        Load the caixa postal ranges, and the units having them, into memory.
+        """
+        log_faixa_uop = get_table(self.metadata, "log_faixa_uop")
+        log_unid_oper = get_table(self.metadata, "log_unid_oper")
+        ranges: dict[int, list[tuple[int, int, int]]] = {}
+
+        with self.engine.connect() as conn:
+            for uop_nu, inicial, final in conn.execute(
+                sa.select(
+                    log_faixa_uop.c.upo_nu,
+                    log_faixa_uop.c.fnc_inicial,
+                    log_faixa_uop.c.fnc_final,
+                )
+            ):
+                ranges.setdefault(uop_nu, []).append((inicial, final, uop_nu))
+
+            self.unidades = {
+                row.uop_nu: build_unidade(row)
+                for row in conn.execute(
+                    log_unid_oper.select().where(
+                        log_unid_oper.c.uop_nu.in_(
+                            sa.select(log_faixa_uop.c.upo_nu).scalar_subquery()
+                        )
+                    )
+                )
+            }
+
+        self.indexes = {
+            uop_nu: RangeIndex(unit_ranges) for uop_nu, unit_ranges in ranges.items()
+        }
+
+    def query(self, uop_nu: int, caixa_postal: str | int) -> dict | None:
+        """
+        Get the unit record if the caixa postal is in one of its ranges, or None
+        otherwise.
+        """
+        caixa_postal = parse_caixa_postal(caixa_postal)
+
+        if caixa_postal is None:
+            return None
+
+        if self.indexes is None:
+            self.load()
+
+        index = self.indexes.get(uop_nu)
+
+        if index is None or index.find(caixa_postal) is None:
+            return None
+
+        return dict(self.unidades[uop_nu])
+
+    def query_many(
+        self, caixas_postais: Iterable[tuple[int, str | int]]
+    ) -> list[dict | None]:
+        """
+        Same as `query`, for many (unit key, caixa postal) pairs at once.
+        """
+        return [self.query(uop_nu, cp) for uop_nu, cp in caixas_postais]
+
+    def query_database(self, uop_nu: int, caixa_postal: str | int) -> dict | None:
+        """
+        Same as `query`, without loading the ranges into memory. The primary key
+        of `log_faixa_uop` (unit key, first caixa postal) indexes the query.
+        """
+        caixa_postal = parse_caixa_postal(caixa_postal)
+
+        if caixa_postal is None:
+            return None
+
+        log_faixa_uop = get_table(self.metadata, "log_faixa_uop")
+        log_unid_oper = get_table(self.metadata, "log_unid_oper")
+
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                log_unid_oper.select().where(
+                    log_unid_oper.c.uop_nu == uop_nu,
+                    sa.exists().where(
+                        log_faixa_uop.c.upo_nu == uop_nu,
+                        log_faixa_uop.c.fnc_inicial <= caixa_postal,
+                        log_faixa_uop.c.fnc_final >= caixa_postal,
+                    ),
+                )
+            ).first()
+
+        return build_unidade(row) if row else None
+
+
+def build_unidade(row: sa.Row) -> dict:
+    return {**row._asdict(), "cep": format_cep(row.cep)}
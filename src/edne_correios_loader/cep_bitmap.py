@@ -0,0 +1,179 @@
+import contextlib
+import logging
+import mmap
+import os
+import secrets
+import stat
+from collections.abc import Iterable
+from pathlib import Path
+
+import sqlalchemy as sa
+
+from .tables import CEP_MAX, build_metadata, get_table, parse_cep
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# one bit for each possible CEP, 00000000 to 99999999
+CEP_BITMAP_SIZE = (CEP_MAX + 1 + 7) // 8
+
+
+class CepBitmap:
+    """
+    Set of the existing CEPs, as a bitmap with one bit for each possible CEP
+    (12.5 MB), telling if a CEP exists without querying the database.
+
+    The bitmap is saved as is, so it can be loaded with mmap and shared by many
+    processes without reading the whole file.
+    """
+
+    def __init__(self, data: bytes | bytearray | mmap.mmap):
+        if len(data) != CEP_BITMAP_SIZE:
+            msg = f"A CEP bitmap must have {CEP_BITMAP_SIZE} bytes, got {len(data)}"
+            raise ValueError(msg)
+
+        self.data = data
+
+    @classmethod
+    def from_ceps(cls, ceps: Iterable[str | int]) -> "CepBitmap":
+        """
+        Build the bitmap from a list of CEPs, ignoring the invalid ones.
+        """
+        data = bytearray(CEP_BITMAP_SIZE)
+
+        for cep in map(parse_cep, ceps):
+            if cep is not None:
+                data[cep >> 3] |= 1 << (cep & 7)
+
+        return cls(data)
+
+    @classmethod
+    def from_database(
+        cls,
+        database_url: str,
+        cep_table_name: str | None = None,
+        *,
+        cep_as_integer: bool = False,
+    ) -> "CepBitmap":
+        """
+        Build the bitmap from the CEPs of the unified CEP table.
+        cep_as_integer must match the option used to load it.
+        """
+        if cep_table_name:
+            metadata = build_metadata(
+                {"cep_unificado": cep_table_name}, cep_as_integer=cep_as_integer
+            )
+        else:
+            metadata = build_metadata(cep_as_integer=cep_as_integer)
+
+        cep_unificado = get_table(metadata, "cep_unificado")
+        engine = sa.create_engine(database_url)
+
+        try:
+            with engine.connect() as conn:
+                return cls.from_ceps(
+                    conn.execution_options(yield_per=10000).scalars(
+                        sa.select(cep_unificado.c.cep)
+                    )
+                )
+        finally:
+            engine.dispose()
+
+    @classmethod
+    def load(cls, path: str | Path) -> "CepBitmap":
+        """
+        Map a bitmap file into memory, read only.
+        """
+        with Path(path).open("rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def save(self, path: str | Path):
+        """
+        Save the bitmap to a file. The file is replaced at once, so processes
+        which mapped the previous one keep reading it until they load it again.
+        """
+        path = Path(path)
+        temp_path = path.with_name(f".{path.name}.{secrets.token_hex(8)}")
+        # created like any new file, with the umask applied (unlike mkstemp)
+        fd = os.open(
+            temp_path,
+            os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, "O_BINARY", 0),
+            0o666,
+        )
+
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.data)
+
+            with contextlib.suppress(FileNotFoundError):
+                # the permissions of the replaced file are kept
+                temp_path.chmod(stat.S_IMODE(path.stat().st_mode))
+
+            temp_path.replace(path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+    def contains(self, cep: str | int) -> bool:
+        """
+        Tell if a CEP exists. Invalid CEPs never exist.
+        """
+        cep = parse_cep(cep)
+        return cep is not None and bool(self.data[cep >> 3] & (1 << (cep & 7)))
+
+    __contains__ = contains
+
+    def contains_many(self, ceps: Iterable[str | int]) -> list[bool]:
+        """
+        Tell if many CEPs exist at once. With NumPy, an array of integer CEPs is
+        checked without any Python loop.
+        """
+        if np is None:
+            return [self.contains(cep) for cep in ceps]
+
+        if isinstance(ceps, np.ndarray) and ceps.dtype.kind in "iu":
+            ceps = ceps.astype(np.int64, copy=False)
+        else:
+            # -1 marks the invalid CEPs
+            ceps = np.array(
+                [-1 if (c := parse_cep(cep)) is None else c for cep in ceps],
+                dtype=np.int64,
+            )
+
+        valid = (ceps >= 0) & (ceps <= CEP_MAX)
+        ceps = np.where(valid, ceps, 0)
+        bits = np.frombuffer(self.data, dtype=np.uint8)[ceps >> 3] >> (ceps & 7)
+
+        return (valid & (bits & 1).astype(bool)).tolist()
+
+    def count(self) -> int:
+        """
+        Count the existing CEPs.
+        """
+        return int.from_bytes(self.data, "little").bit_count()
+
+
+def build_cep_bitmap(
+    database_url: str, path: str | Path, metadata: sa.MetaData | None = None
+):
+    """
+    Build the bitmap of the CEPs in the unified CEP table and save it to a file.
+    """
+    cep_unificado = get_table(metadata or build_metadata(), "cep_unificado")
+    bitmap = CepBitmap.from_database(
+        database_url,
+        cep_unificado.name,
+        cep_as_integer=cep_unificado.metadata.info.get("cep_as_integer", False),
+    )
+    bitmap.save(path)
+
+    logger.info(
+        "Saved the bitmap of %d CEPs to %s",
+        bitmap.count(),
+        path,
+        extra={"indentation": 0},
+    )
@@ -1,25 +1,115 @@
+from collections.abc import Iterator
+
 from sqlalchemy import create_engine
 
-from .tables import build_metadata, get_table
+from .tables import build_metadata, format_cep, get_table, parse_cep
 
 
 class CepQuerier:
-    def __init__(self, database_url: str, cep_table_name: str | None = None):
+    def __init__(
+        self,
+        database_url: str,
+        cep_table_name: str | None = None,
+        *,
+        cep_as_integer: bool = False,
+    ):
+        """
+        cep_as_integer must match the option used to load the unified CEP table.
+        """
         self.engine = create_engine(database_url, echo=False)
 
         if cep_table_name:
-            metadata = build_metadata({"cep_unificado": cep_table_name})
+            metadata = build_metadata(
+                {"cep_unificado": cep_table_name}, cep_as_integer=cep_as_integer
+            )
         else:
-            metadata = build_metadata()
+            metadata = build_metadata(cep_as_integer=cep_as_integer)
 
         self.cep_table = get_table(metadata, "cep_unificado")
+        self.cep_as_integer = cep_as_integer
 
     def query(self, cep: str) -> dict | None:
-        cep = cep.replace("-", "").strip()
+        cep = self.normalize_cep(cep)
+
+        if cep is None:
+            return None
 
         with self.engine.connect() as conn:
             cep = conn.execute(
                 self.cep_table.select().where(self.cep_table.c.cep == cep)
             ).first()
 
-            return cep._asdict() if cep else None
+            if not cep:
+                return None
+
+            return {**cep._asdict(), "cep": format_cep(cep.cep)}
+
+    def list_ceps(
+        self,
+        uf: str | None = None,
+        municipio_cod_ibge: int | None = None,
+        bairro: str | None = None,
+        *,
+        after: str | None = None,
+        page_size: int = 1000,
+    ) -> Iterator[dict]:
+        """
+        List the CEPs of an UF, municipio or bairro (all of them, without filters),
+        sorted by CEP, from the CEP following `after` on.
+
+        CEPs are queried in pages of `page_size`, each one starting after the last
+        CEP of the previous page (instead of skipping the previous rows with
+        OFFSET), so every page is a range scan of the indexes of the unified CEP
+        table. No connection is held while the CEPs of a page are consumed.
+        """
+        if page_size < 1:
+            msg = f"The page size must be positive, got {page_size}"
+            raise ValueError(msg)
+
+        cep_table = self.cep_table
+        ceps = cep_table.select().order_by(cep_table.c.cep).limit(page_size)
+
+        if uf:
+            ceps = ceps.where(cep_table.c.uf == uf.strip().upper())
+
+        if municipio_cod_ibge is not None:
+            ceps = ceps.where(cep_table.c.municipio_cod_ibge == municipio_cod_ibge)
+
+        if bairro:
+            ceps = ceps.where(cep_table.c.bairro == bairro)
+
+        last_cep = None
+        if after:
+            last_cep = self.normalize_cep(after)
+
+            if last_cep is None:
+                msg = f"Invalid CEP: {after}"
+                raise ValueError(msg)
+
+        while True:
+            page = ceps
+            if last_cep is not None:
+                page = page.where(cep_table.c.cep > last_cep)
+
+            with self.engine.connect() as conn:
+                rows = conn.execute(page).all()
+
+            for row in rows:
+                yield {**row._asdict(), "cep": format_cep(row.cep)}
+
+            if len(rows) < page_size:
+                return
+
+            last_cep = rows[-1].cep
+
+    def normalize_cep(self, cep: str) -> str | int | None:
+        """
+        Convert a CEP to the type of the unified CEP table column.
+        Returns None if it isn't a valid CEP.
+        """
+        cep = parse_cep(cep)
+
+        if cep is None or self.cep_as_integer:
+            return cep
+
+        return format_cep(cep)
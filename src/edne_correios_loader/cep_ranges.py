@@ -0,0 +1,457 @@
+import heapq
+from bisect import bisect_right
+from collections.abc import Iterable, Sequence
+from itertools import pairwise
+from operator import itemgetter
+from pathlib import Path
+
+import sqlalchemy as sa
+
+from .loader import TableFilesReader
+from .table_set import get_table_files_glob
+from .tables import (
+    TableNameResolver,
+    build_metadata,
+    format_cep,
+    get_table,
+    parse_cep,
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+class RangeIndex:
+    """
+    In-memory index of integer ranges (inclusive), each one with a value, to find
+    the value of the range containing a key with a binary search.
+
+    Nested ranges (e.g. a district range inside its municipality range) are
+    supported: the narrowest range containing the key wins. For that, the ranges
+    are flattened into disjoint segments when the index is built.
+
+    Batch lookups use NumPy, when it's installed, to search all the keys at once.
+    """
+
+    def __init__(self, ranges: Iterable[tuple[int, int, object]]):
+        self.starts, self.ends, self.values = flatten_ranges(ranges)
+        self._arrays = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def find(self, key: int) -> object | None:
+        i = bisect_right(self.starts, key) - 1
+
+        if i >= 0 and key <= self.ends[i]:
+            return self.values[i]
+
+        return None
+
+    def find_many(self, keys: Sequence[int | None]) -> list:
+        """
+        Find the values of many keys at once. Missing keys (None) have no value.
+
+        With NumPy, keys can also be an array of integers, which skips converting
+        them one by one.
+        """
+        if np is None or not self.starts:
+            return [None if k is None else self.find(k) for k in keys]
+
+        starts, ends, values = self.arrays()
+
+        if isinstance(keys, np.ndarray) and keys.dtype.kind in "iu":
+            keys = keys.astype(np.int64, copy=False)
+        else:
+            # the keys are never negative, so -1 is never found
+            keys = np.array([-1 if k is None else k for k in keys], dtype=np.int64)
+
+        i = np.searchsorted(starts, keys, side="right") - 1
+        found = (i >= 0) & (keys <= ends[i])
+
+        return np.where(found, values[i], None).tolist()
+
+    def arrays(self):
+        if self._arrays is None:
+            values = np.empty(len(self.values), dtype=object)
+            values[:] = self.values
+            self._arrays = (
+                np.asarray(self.starts, dtype=np.int64),
+                np.asarray(self.ends, dtype=np.int64),
+                values,
+            )
+
+        return self._arrays
+
+
+def flatten_ranges(
+    ranges: Iterable[tuple[int, int, object]],
+) -> tuple[list[int], list[int], list]:
+    """
+    Split possibly nested ranges into sorted disjoint segments, each one with the
+    value of the narrowest range containing it.
+    """
+    ranges = sorted(
+        ((start, end, value) for start, end, value in ranges if start <= end),
+        key=itemgetter(0, 1),
+    )
+    boundaries = sorted({r[0] for r in ranges} | {r[1] + 1 for r in ranges})
+
+    starts, ends, values = [], [], []
+    # the ranges containing the current segment, narrowest first
+    active = []
+    next_range = 0
+
+    for segment_start, next_boundary in pairwise(boundaries):
+        while next_range < len(ranges) and ranges[next_range][0] <= segment_start:
+            start, end, _ = ranges[next_range]
+            heapq.heappush(active, (end - start, next_range))
+            next_range += 1
+
+        while active and ranges[active[0][1]][1] < segment_start:
+            heapq.heappop(active)
+
+        if not active:
+            continue
+
+        current = active[0][1]
+        segment_end = next_boundary - 1
+
+        if ends and ends[-1] == segment_start - 1 and values[-1][0] == current:
+            # same range as the previous segment
+            ends[-1] = segment_end
+        else:
+            starts.append(segment_start)
+            ends.append(segment_end)
+            values.append((current, ranges[current][2]))
+
+    return starts, ends, [value for _, value in values]
+
+
+class UfClassifier:
+    """
+    Find the UF of a CEP without querying the database, from the CEP ranges of
+    each UF in `log_faixa_uf`.
+    """
+
+    def __init__(self, ranges: Iterable[tuple[str, str | int, str | int]]):
+        """
+        The ranges are (UF, first CEP, last CEP) tuples, as in `log_faixa_uf`.
+        """
+        self.index = RangeIndex((int(start), int(end), uf) for uf, start, end in ranges)
+
+    @classmethod
+    def from_dne(cls, dne_path: str | Path) -> "UfClassifier":
+        """
+        Build the classifier from the LOG_FAIXA_UF.TXT file of a DNE directory.
+        """
+        files = Path(dne_path).glob(get_table_files_glob("log_faixa_uf"))
+        return cls(TableFilesReader(files))
+
+    @classmethod
+    def from_database(
+        cls, database_url: str, table_names: TableNameResolver | None = None
+    ) -> "UfClassifier":
+        """
+        Build the classifier from the `log_faixa_uf` table, only kept in the
+        database by the "all" table set.
+        """
+        log_faixa_uf = get_table(build_metadata(table_names), "log_faixa_uf")
+        engine = sa.create_engine(database_url)
+
+        try:
+            with engine.connect() as conn:
+                return cls(
+                    conn.execute(
+                        sa.select(
+                            log_faixa_uf.c.ufe_sg,
+                            log_faixa_uf.c.ufe_cep_ini,
+                            log_faixa_uf.c.ufe_cep_fim,
+                        )
+                    ).all()
+                )
+        finally:
+            engine.dispose()
+
+    def uf_for_cep(self, cep: str | int) -> str | None:
+        """
+        Get the UF of a CEP, or None if the CEP is invalid or out of the UF ranges.
+        """
+        cep = parse_cep(cep)
+        return None if cep is None else self.index.find(cep)
+
+    def ufs_for_ceps(self, ceps: Iterable[str | int]) -> list[str | None]:
+        """
+        Get the UFs of many CEPs at once, faster than one by one. With NumPy, an
+        array of integer CEPs is classified without any Python loop.
+        """
+        if np is not None and isinstance(ceps, np.ndarray) and ceps.dtype.kind in "iu":
+            return self.index.find_many(ceps)
+
+        return self.index.find_many([parse_cep(cep) for cep in ceps])
+
+
+def select_faixas_bairro(
+    metadata: sa.MetaData,
+    cep: str | int | None = None,
+    max_span: int | None = None,
+):
+    """
+    Select the CEP ranges of the bairros, with the fields of the unified table.
+    If a CEP is given, only the narrowest range containing it is selected (see
+    select_narrowest_range).
+    """
+    log_faixa_bairro = get_table(metadata, "log_faixa_bairro")
+    log_bairro = get_table(metadata, "log_bairro")
+    log_localidade = get_table(metadata, "log_localidade")
+    localidade_subordinada = log_localidade.alias()
+
+    rows = (
+        sa.select(
+            log_faixa_bairro.c.fcb_cep_ini.label("cep_ini"),
+            log_faixa_bairro.c.fcb_cep_fim.label("cep_fim"),
+            log_bairro.c.bai_no.label("bairro"),
+            sa.func.coalesce(
+                localidade_subordinada.c.loc_no,
+                log_localidade.c.loc_no,
+            ).label("municipio"),
+            sa.func.coalesce(
+                localidade_subordinada.c.mun_nu,
+                log_localidade.c.mun_nu,
+            ).label("municipio_cod_ibge"),
+            log_bairro.c.ufe_sg.label("uf"),
+        )
+        .select_from(log_faixa_bairro)
+        .join(log_bairro)
+        .join(log_localidade, onclause=log_bairro.c.loc_nu == log_localidade.c.loc_nu)
+        .outerjoin(
+            localidade_subordinada,
+            onclause=log_localidade.c.loc_nu_sub == localidade_subordinada.c.loc_nu,
+        )
+    )
+
+    if cep is None:
+        return rows
+
+    return select_narrowest_range(
+        rows,
+        log_faixa_bairro.c.fcb_cep_ini,
+        log_faixa_bairro.c.fcb_cep_fim,
+        cep,
+        max_span,
+    )
+
+
+def select_faixas_localidade(
+    metadata: sa.MetaData,
+    cep: str | int | None = None,
+    max_span: int | None = None,
+):
+    """
+    Select the CEP ranges of the localidades, with the fields of the unified table.
+    Distritos and povoados are the bairro of the localidade they are subordinated
+    to. If a CEP is given, only the narrowest range containing it is selected (see
+    select_narrowest_range).
+    """
+    log_faixa_localidade = get_table(metadata, "log_faixa_localidade")
+    log_localidade = get_table(metadata, "log_localidade")
+    localidade_subordinada = log_localidade.alias()
+
+    rows = (
+        sa.select(
+            log_faixa_localidade.c.loc_cep_ini.label("cep_ini"),
+            log_faixa_localidade.c.loc_cep_fim.label("cep_fim"),
+            sa.case(
+                (localidade_subordinada.c.loc_nu.isnot(None), log_localidade.c.loc_no),
+            ).label("bairro"),
+            sa.func.coalesce(
+                localidade_subordinada.c.loc_no,
+                log_localidade.c.loc_no,
+            ).label("municipio"),
+            sa.func.coalesce(
+                localidade_subordinada.c.mun_nu,
+                log_localidade.c.mun_nu,
+            ).label("municipio_cod_ibge"),
+            log_localidade.c.ufe_sg.label("uf"),
+        )
+        .select_from(log_faixa_localidade)
+        .join(
+            log_localidade,
+            onclause=log_faixa_localidade.c.loc_nu == log_localidade.c.loc_nu,
+        )
+        .outerjoin(
+            localidade_subordinada,
+            onclause=log_localidade.c.loc_nu_sub == localidade_subordinada.c.loc_nu,
+        )
+    )
+
+    if cep is None:
+        return rows
+
+    return select_narrowest_range(
+        rows,
+        log_faixa_localidade.c.loc_cep_ini,
+        log_faixa_localidade.c.loc_cep_fim,
+        cep,
+        max_span,
+    )
+
+
+def select_narrowest_range(
+    rows: sa.Select,
+    cep_ini: sa.Column,
+    cep_fim: sa.Column,
+    cep: str | int,
+    max_span: int | None = None,
+) -> sa.Select:
+    """
+    Select the narrowest range containing the CEP: for nested ranges, the one
+    starting last. The index on the first CEP of the ranges is scanned backwards
+    from the CEP.
+
+    Without `max_span`, the length of the longest range (see
+    select_max_range_span), a CEP out of the ranges scans all the ranges starting
+    before it. With it, only the ranges starting close enough to contain the CEP
+    are scanned.
+    """
+    rows = rows.where(cep_ini <= cep, cep_fim >= cep)
+
+    if max_span is not None:
+        lowest = max(parse_cep(cep) - max_span, 0)
+        rows = rows.where(
+            cep_ini >= (format_cep(lowest) if isinstance(cep, str) else lowest)
+        )
+
+    return rows.order_by(cep_ini.desc(), cep_fim).limit(1)
+
+
+def select_max_range_span(rows: sa.Select) -> sa.Select:
+    """
+    Select the length of the longest of the ranges (minus one), None if there are
+    no ranges.
+    """
+    ranges = rows.subquery()
+
+    return sa.select(
+        sa.func.max(
+            sa.cast(ranges.c.cep_fim, sa.Integer)
+            - sa.cast(ranges.c.cep_ini, sa.Integer)
+        )
+    )
+
+
+class CepRangeQuerier:
+    """
+    Find the localidade and bairro of a CEP from the CEP ranges in
+    `log_faixa_bairro` and `log_faixa_localidade`, only kept in the database by
+    the "all" table set.
+
+    It's a fallback for the CEPs missing in the unified table, such as the CEPs of
+    streets not yet in the DNE:
+
+        cep = cep_querier.query(cep) or cep_range_querier.query(cep)
+
+    The ranges are loaded into memory on the first query. `query_database` runs
+    the equivalent SQL query instead.
+    """
+
+    def __init__(
+        self,
+        database_url: str,
+        table_names: TableNameResolver | None = None,
+        *,
+        cep_as_integer: bool = False,
+    ):
+        """
+        cep_as_integer must match the option used to load the tables.
+        """
+        self.engine = sa.create_engine(database_url, echo=False)
+        self.metadata = build_metadata(table_names, cep_as_integer=cep_as_integer)
+        self.cep_as_integer = cep_as_integer
+        self.indexes: list[RangeIndex] | None = None
+        self.max_spans: list[int | None] | None = None
+
+    def load(self):
+        """
+        Load the CEP ranges into memory, bairros first as they are narrower.
+        """
+        with self.engine.connect() as conn:
+            self.indexes = [
+                RangeIndex(
+                    (int(row.cep_ini), int(row.cep_fim), build_cep(row))
+                    for row in conn.execute(select_ranges(self.metadata))
+                )
+                for select_ranges in (select_faixas_bairro, select_faixas_localidade)
+            ]
+
+    def query(self, cep: str | int) -> dict | None:
+        """
+        Get the localidade and bairro of a CEP, in the format of the unified
+        table, or None if the CEP is invalid or out of the ranges.
+        """
+        cep = parse_cep(cep)
+
+        if cep is None:
+            return None
+
+        if self.indexes is None:
+            self.load()
+
+        for index in self.indexes:
+            if (found := index.find(cep)) is not None:
+                return {**found, "cep": format_cep(cep)}
+
+        return None
+
+    def query_database(self, cep: str | int) -> dict | None:
+        """
+        Same as `query`, without loading the ranges into memory. Only the length of
+        the longest range of each table is queried once, to bound the ranges
+        scanned for each CEP.
+        """
+        cep = parse_cep(cep)
+
+        if cep is None:
+            return None
+
+        value = cep if self.cep_as_integer else format_cep(cep)
+        selects = (select_faixas_bairro, select_faixas_localidade)
+
+        with self.engine.connect() as conn:
+            if self.max_spans is None:
+                # queried once, like the ranges loaded by `query`
+                self.max_spans = [
+                    conn.execute(
+                        select_max_range_span(select_ranges(self.metadata))
+                    ).scalar()
+                    for select_ranges in selects
+                ]
+
+            for select_ranges, max_span in zip(selects, self.max_spans, strict=True):
+                if max_span is None:
+                    # there are no ranges
+                    continue
+
+                row = conn.execute(
+                    select_ranges(self.metadata, value, max_span=max_span)
+                ).first()
+
+                if row:
+                    return {**build_cep(row), "cep": format_cep(cep)}
+
+        return None
+
+
+def build_cep(row: sa.Row) -> dict:
+    return {
+        "cep": None,
+        "logradouro": None,
+        "complemento": None,
+        "bairro": row.bairro,
+        "municipio": row.municipio,
+        "municipio_cod_ibge": row.municipio_cod_ibge,
+        "uf": row.uf,
+        "nome": None,
+    }
@@ -0,0 +1,20 @@
+import enum
+
+
+class CleanStrategyEnum(enum.Enum):
+    """
+    Options to control how the rows of a previous import are removed.
+
+    - DELETE: delete the rows inside the import transaction, so other clients keep
+      seeing the previous data until the import is committed.
+    - TRUNCATE: empty the tables using the fastest way supported by the database,
+      which doesn't scan the tables nor leave dead rows behind:
+        - PostgreSQL: TRUNCATE ... RESTART IDENTITY, which locks the tables for
+          reads until the import is committed.
+        - MySQL: TRUNCATE, which commits the removal immediately.
+        - SQLite: DELETE (which SQLite optimizes to a truncate) followed by a VACUUM
+          after the import is committed.
+    """
+
+    DELETE = "delete"
+    TRUNCATE = "truncate"
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import asyncio
+import csv
 import json
 import logging
 import sys
@@ -7,14 +9,23 @@ import sys
 import click
 
 from edne_correios_loader.__about__ import __version__
+from edne_correios_loader.cache import logger as cache_logger
+from edne_correios_loader.cep_bitmap import logger as cep_bitmap_logger
 from edne_correios_loader.cep_querier import CepQuerier
+from edne_correios_loader.clean_strategy import CleanStrategyEnum
 from edne_correios_loader.dbwriter import logger as dbwriter_logger
+from edne_correios_loader.downloader import logger as downloader_logger
 from edne_correios_loader.loader import DneLoader
 from edne_correios_loader.loader import logger as loader_logger
 from edne_correios_loader.resolver import DneResolver
 from edne_correios_loader.resolver import logger as resolver_logger
+from edne_correios_loader.search import CepSearcher
+from edne_correios_loader.search import logger as search_logger
+from edne_correios_loader.server import CepServer
+from edne_correios_loader.server import logger as server_logger
 from edne_correios_loader.table_set import TableSetEnum
 from edne_correios_loader.tables import DEFAULT_TABLE_NAMES
+from edne_correios_loader.uf_filter import parse_ufs
 from edne_correios_loader.unified_table import logger as unified_table_logger
 
 from .logger import add_verbose_option
@@ -84,6 +95,23 @@ class TableNameParamType(click.ParamType):
         return (key, custom)
 
 
+class UfListParamType(click.ParamType):
+    """
+    Click parameter type for --uf comma-separated UFs.
+    """
+
+    name = "uf-list"
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, tuple):
+            return value
+
+        try:
+            return parse_ufs(value.split(","))
+        except ValueError as e:
+            self.fail(str(e), param, ctx)
+
+
 def parse_table_names(table_name):
     """
     Build table name mapping from --table-name pairs.
@@ -129,10 +157,150 @@ def edne_correios_loader(): ...  # pragma: no cover
     help="Rename a table: --table-name original=custom",
     metavar="<original=custom>",
 )
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help="Commit the progress as the load goes and resume a previous failed "
+    "load from its last checkpoint",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    help="Directory where downloaded and extracted DNE releases are cached and "
+    "reused by the next loads",
+    metavar="<path>",
+)
+@click.option(
+    "--cache-max-size",
+    type=int,
+    help="Maximum size of the cache in MB, older releases are removed when it's "
+    "exceeded  [default: 4096]",
+    metavar="<MB>",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Load the DNE even if the same release was already loaded",
+)
+@click.option(
+    "--clean-strategy",
+    type=click.Choice(
+        [option.value for option in list(CleanStrategyEnum)],
+        case_sensitive=False,
+    ),
+    help="How to remove the rows of a previous load: delete them in the load "
+    "transaction, or truncate the tables, which is faster on big tables",
+    default="delete",
+)
+@click.option(
+    "--relax-foreign-keys",
+    is_flag=True,
+    default=False,
+    help="Don't enforce foreign keys while populating the tables, verifying "
+    "them all at once at the end",
+)
+@click.option(
+    "--sqlite-bulk",
+    is_flag=True,
+    default=False,
+    help="Build the SQLite database apart with bulk load settings and replace the "
+    "database file when done",
+)
+@click.option(
+    "--unlogged-staging",
+    is_flag=True,
+    default=False,
+    help="On PostgreSQL, create the tables dropped after the load as UNLOGGED, "
+    "skipping the WAL",
+)
+@click.option(
+    "--pipelined",
+    is_flag=True,
+    default=False,
+    help="Parse the DNE files in a separate thread while inserting the rows",
+)
+@click.option(
+    "--project-columns",
+    is_flag=True,
+    default=False,
+    help="With --tables unified-cep-only, load only the columns used to "
+    "populate the unified CEP table",
+)
+@click.option(
+    "--uf",
+    type=UfListParamType(),
+    help="Load only the DNE data of these UFs, e.g. SP,RJ",
+    metavar="<UF,...>",
+)
+@click.option(
+    "--materialized-view",
+    is_flag=True,
+    default=False,
+    help="On PostgreSQL, keep the unified CEP table as a materialized view of the "
+    "CEP tables, refreshed concurrently by each load",
+)
+@click.option(
+    "--cep-as-integer",
+    is_flag=True,
+    default=False,
+    help="Store the CEPs as integers, making their indexes smaller and faster",
+)
+@click.option(
+    "--partition-unified-table",
+    is_flag=True,
+    default=False,
+    help="On PostgreSQL, partition the unified CEP table by the CEP first digit",
+)
+@click.option(
+    "--cep-bitmap",
+    type=click.Path(dir_okay=False),
+    help="Save the bitmap of the loaded CEPs to this file, for fast existence checks",
+    metavar="<path>",
+)
+@click.option(
+    "--search-index",
+    is_flag=True,
+    default=False,
+    help="Build the search table used to find CEPs by street name",
+)
 @add_verbose_option(
-    [logger, loader_logger, resolver_logger, dbwriter_logger, unified_table_logger]
+    [
+        logger,
+        loader_logger,
+        resolver_logger,
+        downloader_logger,
+        cache_logger,
+        dbwriter_logger,
+        unified_table_logger,
+        cep_bitmap_logger,
+        search_logger,
+    ]
 )
-def load(dne_source, database_url, tables, table_name, verbose):
+def load(
+    dne_source,
+    database_url,
+    tables,
+    table_name,
+    resume,
+    cache_dir,
+    cache_max_size,
+    force,
+    clean_strategy,
+    relax_foreign_keys,
+    sqlite_bulk,
+    unlogged_staging,
+    pipelined,
+    project_columns,
+    uf,
+    materialized_view,
+    cep_as_integer,
+    partition_unified_table,
+    cep_bitmap,
+    search_index,
+    verbose,
+):
     """
     Load DNE data into a database.
     """
@@ -143,8 +311,30 @@ def load(dne_source, database_url, tables, table_name, verbose):
         table_names = parse_table_names(table_name)
 
         DneLoaderWithProgress(
-            database_url, dne_source=dne_source, table_names=table_names
-        ).load(table_set=TableSetEnum(tables))
+            database_url,
+            dne_source=dne_source,
+            table_names=table_names,
+            cache_dir=cache_dir,
+            cache_max_size=(
+                cache_max_size * 1024 * 1024 if cache_max_size is not None else None
+            ),
+            cep_as_integer=cep_as_integer,
+            partition_unified_table=partition_unified_table,
+        ).load(
+            table_set=TableSetEnum(tables),
+            resume=resume,
+            force=force,
+            clean_strategy=CleanStrategyEnum(clean_strategy),
+            relax_foreign_keys=relax_foreign_keys,
+            sqlite_bulk=sqlite_bulk,
+            unlogged_staging=unlogged_staging,
+            pipelined=pipelined,
+            project_columns=project_columns,
+            ufs=uf,
+            materialized_view=materialized_view,
+            cep_bitmap_path=cep_bitmap,
+            search_index=search_index,
+        )
     except Exception as e:
         if verbose:
             logger.exception(e)  # noqa: TRY401
@@ -166,14 +356,24 @@ def load(dne_source, database_url, tables, table_name, verbose):
     help="Custom name for the unified CEP table",
     metavar="<name>",
 )
+@click.option(
+    "--cep-as-integer",
+    is_flag=True,
+    default=False,
+    help="The CEPs were loaded as integers",
+)
 @click.argument("cep")
 @edne_correios_loader.command()
-def query_cep(database_url, cep_table_name, cep):
+def query_cep(database_url, cep_table_name, cep_as_integer, cep):
     """
     Query a CEP from the database to ensure it was correctly populated.
     """
     try:
-        cep_address = CepQuerier(database_url, cep_table_name=cep_table_name).query(cep)
+        cep_address = CepQuerier(
+            database_url,
+            cep_table_name=cep_table_name,
+            cep_as_integer=cep_as_integer,
+        ).query(cep)
     except Exception as e:
         logger.error(e)  # noqa: TRY400
         sys.exit(1)
@@ -187,3 +387,221 @@ def query_cep(database_url, cep_table_name, cep):
     else:
         click.echo(click.style("CEP not found", fg="blue"), err=True)
         sys.exit(3)
+
+
+@click.option(
+    "-db",
+    "--database-url",
+    help="Database URL where the DNE data was imported to",
+    required=True,
+    metavar="<url>",
+)
+@click.option(
+    "--cep-table-name",
+    help="Custom name for the unified CEP table",
+    metavar="<name>",
+)
+@click.option(
+    "--cep-as-integer",
+    is_flag=True,
+    default=False,
+    help="The CEPs were loaded as integers",
+)
+@click.option(
+    "--municipio",
+    help="Only search the CEPs of this municipality",
+    metavar="<name>",
+)
+@click.option("--uf", help="Only search the CEPs of this UF", metavar="<UF>")
+@click.option(
+    "--limit",
+    type=click.IntRange(min=1),
+    default=10,
+    show_default=True,
+    help="Maximum number of CEPs to show",
+)
+@click.argument("street")
+@edne_correios_loader.command()
+def search(database_url, cep_table_name, cep_as_integer, municipio, uf, limit, street):
+    """
+    Search CEPs by street name, in databases loaded with --search-index.
+    """
+    try:
+        ceps = CepSearcher(
+            database_url,
+            table_names={"cep_unificado": cep_table_name} if cep_table_name else None,
+            cep_as_integer=cep_as_integer,
+        ).search(street, municipio=municipio, uf=uf, limit=limit)
+    except Exception as e:
+        logger.error(e)  # noqa: TRY400
+        sys.exit(1)
+
+    if ceps:
+        click.echo(
+            click.style(json.dumps(ceps, ensure_ascii=False, indent=2), fg="green")
+        )
+    else:
+        click.echo(click.style("No CEPs found", fg="blue"), err=True)
+        sys.exit(3)
+
+
+@click.option(
+    "-db",
+    "--database-url",
+    help="Database URL where the DNE data was imported to",
+    required=True,
+    metavar="<url>",
+)
+@click.option(
+    "--cep-table-name",
+    help="Custom name for the unified CEP table",
+    metavar="<name>",
+)
+@click.option(
+    "--cep-as-integer",
+    is_flag=True,
+    default=False,
+    help="The CEPs were loaded as integers",
+)
+@click.option("--uf", help="Only export the CEPs of this UF", metavar="<UF>")
+@click.option(
+    "--municipio-cod-ibge",
+    type=int,
+    help="Only export the CEPs of the municipality with this IBGE code",
+    metavar="<code>",
+)
+@click.option("--bairro", help="Only export the CEPs of this bairro", metavar="<name>")
+@click.option(
+    "--after",
+    help="Only export the CEPs after this one, to resume an export",
+    metavar="<CEP>",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["csv", "jsonl"]),
+    default="csv",
+    show_default=True,
+    help="Output format: CSV with a header, or one JSON object per line",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.File("w", encoding="utf-8", lazy=True),
+    default="-",
+    help="File to write the CEPs to (default: standard output)",
+    metavar="<path>",
+)
+@edne_correios_loader.command()
+def export(
+    database_url,
+    cep_table_name,
+    cep_as_integer,
+    uf,
+    municipio_cod_ibge,
+    bairro,
+    after,
+    output_format,
+    output,
+):
+    """
+    Export the CEPs of an UF, municipality or bairro, sorted by CEP.
+    """
+    try:
+        querier = CepQuerier(
+            database_url,
+            cep_table_name=cep_table_name,
+            cep_as_integer=cep_as_integer,
+        )
+        ceps = querier.list_ceps(
+            uf=uf, municipio_cod_ibge=municipio_cod_ibge, bairro=bairro, after=after
+        )
+
+        if output_format == "csv":
+            writer = csv.DictWriter(output, fieldnames=querier.cep_table.c.keys())
+            writer.writeheader()
+            writer.writerows(ceps)
+        else:
+            for cep in ceps:
+                output.write(json.dumps(cep, ensure_ascii=False) + "\n")
+    except Exception as e:
+        logger.error(e)  # noqa: TRY400
+        sys.exit(1)
+
+
+@click.option(
+    "-db",
+    "--database-url",
+    help="Database URL where the DNE data was imported to",
+    required=True,
+    metavar="<url>",
+)
+@click.option(
+    "--cep-table-name",
+    help="Custom name for the unified CEP table",
+    metavar="<name>",
+)
+@click.option(
+    "--cep-as-integer",
+    is_flag=True,
+    default=False,
+    help="The CEPs were loaded as integers",
+)
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False),
+    help="Listen on this Unix socket instead of a TCP port",
+    metavar="<path>",
+)
+@click.option(
+    "--host",
+    default="127.0.0.1",
+    show_default=True,
+    help="Address to listen on",
+    metavar="<host>",
+)
+@click.option(
+    "--port",
+    type=click.IntRange(min=0, max=65535),
+    default=8765,
+    show_default=True,
+    help="TCP port to listen on",
+)
+@click.option(
+    "--cache-size",
+    type=click.IntRange(min=0),
+    default=100_000,
+    show_default=True,
+    help="Number of CEPs whose addresses are kept in memory (0 disables the cache)",
+)
+@edne_correios_loader.command()
+@add_verbose_option([logger, server_logger])
+def serve(
+    database_url,
+    cep_table_name,
+    cep_as_integer,
+    socket_path,
+    host,
+    port,
+    cache_size,
+    verbose,  # noqa: ARG001
+):
+    """
+    Answer CEP lookups over a Unix socket or TCP port, one JSON line per CEP.
+    """
+    try:
+        server = CepServer(
+            CepQuerier(
+                database_url,
+                cep_table_name=cep_table_name,
+                cep_as_integer=cep_as_integer,
+            ),
+            cache_size=cache_size,
+        )
+        asyncio.run(server.serve_forever(socket_path=socket_path, host=host, port=port))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        logger.info("Stopped", extra={"indentation": 0})
+    except Exception as e:
+        logger.error(e)  # noqa: TRY400
+        sys.exit(1)
@@ -1,11 +1,21 @@
+import contextlib
 import logging
-from collections.abc import Iterable
+import os
+import sqlite3
+from collections.abc import Callable, Iterable
+from datetime import datetime, timezone
 from graphlib import TopologicalSorter
+from pathlib import Path
 
 import sqlalchemy as sa
 
+from .clean_strategy import CleanStrategyEnum
+from .exc import DneIntegrityError
+from .search import build_search_table, populate_search_table
+from .state import checkpoint_table, load_info_table, state_metadata
+from .tables import get_table
 from .tables import metadata as default_metadata
-from .unified_table import populate_unified_table
+from .unified_table import populate_unified_table, select_unified_ceps
 
 logger = logging.getLogger(__name__)
 
@@ -14,10 +24,15 @@ class DneDatabaseWriter:
     engine: sa.Engine
     connection: sa.Connection
     insert_buffer_size = 1000
+    # number of insert batches between two checkpoints of a resumable load
+    checkpoint_batches = 100
 
     def __init__(self, database_url: str, metadata: sa.MetaData = default_metadata):
         self.engine = sa.create_engine(database_url, echo=False)
         self.metadata = metadata
+        self.vacuum_on_exit = False
+        self.foreign_keys_relaxed = False
+        self.abandoned = False
 
     def __enter__(self):
         logger.info("Connecting to database...", extra={"indentation": 0})
@@ -25,39 +40,138 @@ class DneDatabaseWriter:
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if exc_val:
+        if exc_val or self.abandoned:
             # if something went wrong, rollback all the changes
             self.connection.rollback()
 
         else:
             self.connection.commit()
 
+            if self.vacuum_on_exit:
+                self.vacuum()
+
+        if self.foreign_keys_relaxed:
+            self.restore_foreign_keys()
+            self.connection.commit()
+
         self.connection.close()
 
+    def commit(self):
+        self.connection.commit()
+
+    def abandon(self):
+        """
+        Leave the database as it was when the load is skipped: the changes aren't
+        committed and nothing else is done on exit.
+        """
+        self.abandoned = True
+
     def create_tables(self, tables: list[str]):
         metadata_tables = [self.metadata.tables[t] for t in tables]
         tables_names = "\n".join([f"- {t}" for t in tables])
 
+        if any(t.info.get("unified_table") for t in metadata_tables):
+            self.drop_unified_view()
+
         logger.info("Creating tables:\n%s", tables_names, extra={"indentation": 0})
+        inspector = sa.inspect(self.engine)
+        existing_tables = [t for t in metadata_tables if inspector.has_table(t.name)]
         self.metadata.create_all(self.engine, tables=metadata_tables)
 
-    def clean_tables(self, tables: list[str]):
+        # existing tables are skipped, along with the indexes added to them since
+        with self.engine.begin() as connection:
+            for table in existing_tables:
+                for index in table.indexes:
+                    index.create(connection, checkfirst=True)
+
+    def make_tables_unlogged(self, tables: list[str]):
+        """
+        Stop writing the changes of the tables to the PostgreSQL WAL, which makes
+        populating them much cheaper, but they are emptied if the server crashes
+        and aren't replicated. Only suited for staging tables, dropped at the end of
+        the load. Other databases are not affected.
+        """
+        if not tables or self.engine.dialect.name != "postgresql":
+            return
+
+        logger.info(
+            "Making %s staging tables unlogged", len(tables), extra={"indentation": 0}
+        )
+        quote = self.engine.dialect.identifier_preparer.format_table
+
+        # logged tables can't reference unlogged ones, start by the referencing ones
+        for table_name in reversed(tables):
+            table = quote(self.metadata.tables[table_name])
+            self.connection.execute(sa.text(f"ALTER TABLE {table} SET UNLOGGED"))
+
+    def clean_tables(
+        self,
+        tables: list[str],
+        strategy: CleanStrategyEnum = CleanStrategyEnum.DELETE,
+    ):
         logger.info("Cleaning tables", extra={"indentation": 0})
 
+        if strategy == CleanStrategyEnum.TRUNCATE:
+            dialect = self.engine.dialect.name
+
+            if dialect == "postgresql":
+                self.truncate_postgresql_tables(tables)
+                return
+
+            if dialect == "mysql":
+                self.truncate_mysql_tables(tables)
+                return
+
+            # other databases have no TRUNCATE, just reclaim the space afterwards
+            self.vacuum_on_exit = dialect == "sqlite"
+
         # delete rows in reverse order to avoid foreign key constraint violations
         for table_name in reversed(tables):
             table = self.metadata.tables[table_name]
 
-            if num_rows := self.connection.execute(
-                sa.select(sa.func.count()).select_from(table)
-            ).scalar():
+            if num_rows := self.connection.execute(table.delete()).rowcount:
                 logger.info(
-                    "Deleting %s rows from table %s",
+                    "Deleted %s rows from table %s",
                     num_rows,
                     table.name,
                     extra={"indentation": 1},
                 )
-                self.connection.execute(table.delete())
+
+    def truncate_postgresql_tables(self, tables: list[str]):
+        # truncating all the tables at once satisfies the foreign keys between
+        # them, without CASCADE wiping any external table referencing them
+        quote = self.engine.dialect.identifier_preparer.format_table
+        tables_names = ", ".join(quote(self.metadata.tables[t]) for t in tables)
+
+        logger.info("Truncating %s tables", len(tables), extra={"indentation": 1})
+        self.connection.execute(
+            sa.text(f"TRUNCATE TABLE {tables_names} RESTART IDENTITY")
+        )
+
+    def truncate_mysql_tables(self, tables: list[str]):
+        quote = self.engine.dialect.identifier_preparer.format_table
+
+        # MySQL refuses to truncate tables referenced by foreign keys
+        self.connection.execute(sa.text("SET FOREIGN_KEY_CHECKS = 0"))
+        try:
+            for table_name in reversed(tables):
+                logger.info("Truncating table %s", table_name, extra={"indentation": 1})
+                self.connection.execute(
+                    sa.text(f"TRUNCATE TABLE {quote(self.metadata.tables[table_name])}")
+                )
+        finally:
+            if not self.foreign_keys_relaxed:
+                self.connection.execute(sa.text("SET FOREIGN_KEY_CHECKS = 1"))
+
+    def vacuum(self):
+        """
+        Rebuild the SQLite database file, releasing the space of the deleted rows.
+        It can't run inside a transaction, so it must be called after committing.
+        """
+        logger.info("Vacuuming database", extra={"indentation": 0})
+        self.connection.execution_options(isolation_level="AUTOCOMMIT").execute(
+            sa.text("VACUUM")
+        )
 
     def drop_tables(self, tables: list[str]):
         if tables:
@@ -67,19 +181,51 @@ class DneDatabaseWriter:
                 logger.info("Dropping table %s", table, extra={"indentation": 1})
                 self.metadata.tables[table].drop(self.connection, checkfirst=True)
 
-    def populate_table(self, table_name: str, lines: Iterable[list[str]]):
+    def drop_all_tables(self):
+        """
+        Drop all the tables of the DNE, along with the unified CEP materialized view
+        and search table, and commit, so they can be created again with another
+        schema (e.g. with CEPs stored as integers).
+        """
+        logger.info(
+            "Dropping tables created with other schema options",
+            extra={"indentation": 0},
+        )
+        # the view depends on the tables, it must be dropped first
+        self.drop_unified_view()
+        build_search_table(self.metadata).drop(self.connection, checkfirst=True)
+        self.drop_tables([t.name for t in self.metadata.sorted_tables])
+        self.commit()
+
+    def populate_table(
+        self,
+        table_name: str,
+        lines: Iterable[list[str]],
+        *,
+        checkpoint: Callable[[], None] | None = None,
+    ):
+        """
+        Insert the lines into the table in batches.
+
+        When a checkpoint callable is provided, it's called every
+        `checkpoint_batches` inserted batches, so the progress can be persisted.
+        """
         logger.info("Populating table %s", table_name, extra={"indentation": 0})
         table = self.metadata.tables[table_name]
         columns = [c.name for c in table.columns]
 
         self_referencing_fk = self.find_self_referencing_fks(table)
 
-        if self_referencing_fk:
+        if self_referencing_fk and not self.foreign_keys_relaxed:
             # if the table has a self-referencing foreign key, the rows
             # need to be sorted in a way the ancestors are inserted first
             lines = self.sort_topologically(lines, self_referencing_fk, columns)
+            # the insertion order doesn't match the files order anymore, so
+            # partial progress can't be checkpointed
+            checkpoint = None
 
         buffer = []
+        batches = count = 0
 
         for count, line in enumerate(lines, start=1):  # noqa: B007
             buffer.append(dict(zip(columns, line, strict=False)))
@@ -87,6 +233,10 @@ class DneDatabaseWriter:
             if len(buffer) >= self.insert_buffer_size:
                 self.connection.execute(table.insert(), buffer)
                 buffer = []
+                batches += 1
+
+                if checkpoint and batches % self.checkpoint_batches == 0:
+                    checkpoint()
 
         if buffer:
             self.connection.execute(table.insert(), buffer)
@@ -98,10 +248,319 @@ class DneDatabaseWriter:
             extra={"indentation": 1},
         )
 
+    def relax_foreign_keys(self):
+        """
+        Stop enforcing foreign keys in this connection, so rows can be inserted in
+        any order and without checking each of them. The references must be checked
+        afterwards with `verify_foreign_keys`.
+        """
+        dialect = self.engine.dialect.name
+
+        if dialect == "postgresql":
+            try:
+                # disables the triggers enforcing the foreign keys, needs superuser
+                with self.connection.begin_nested():
+                    self.connection.execute(
+                        sa.text("SET session_replication_role = replica")
+                    )
+            except sa.exc.DBAPIError as e:
+                logger.warning(
+                    "Foreign keys can't be relaxed, they'll be enforced: %s",
+                    e.orig,
+                    extra={"indentation": 0},
+                )
+                return
+
+        elif dialect == "mysql":
+            self.connection.execute(sa.text("SET FOREIGN_KEY_CHECKS = 0"))
+
+        elif dialect == "sqlite":
+            self.connection.execute(sa.text("PRAGMA foreign_keys = OFF"))
+
+        else:
+            logger.warning(
+                "Foreign keys can't be relaxed on %s, they'll be enforced",
+                dialect,
+                extra={"indentation": 0},
+            )
+            return
+
+        logger.info("Foreign keys enforcement relaxed", extra={"indentation": 0})
+        self.foreign_keys_relaxed = True
+
+    def restore_foreign_keys(self):
+        dialect = self.engine.dialect.name
+
+        if dialect == "postgresql":
+            self.connection.execute(sa.text("SET session_replication_role = DEFAULT"))
+        elif dialect == "mysql":
+            self.connection.execute(sa.text("SET FOREIGN_KEY_CHECKS = 1"))
+
+        # SQLite only enforces foreign keys when asked to, leave them disabled
+        self.foreign_keys_relaxed = False
+
+    def verify_foreign_keys(self, tables: list[str]):
+        """
+        Find the rows referencing missing rows, checking each foreign key with a
+        single query. Raises DneIntegrityError reporting the orphan rows found.
+        """
+        logger.info("Verifying foreign keys", extra={"indentation": 0})
+        errors = []
+
+        for table_name in tables:
+            table = self.metadata.tables[table_name]
+
+            for fk in table.foreign_key_constraints:
+                if orphans := self.count_orphans(fk):
+                    columns = ", ".join(c.name for c in fk.columns)
+                    errors.append(
+                        f"{orphans} rows of {table.name} ({columns}) reference "
+                        f"missing rows of {fk.referred_table.name}"
+                    )
+
+        if errors:
+            msg = "Foreign keys violated:\n" + "\n".join(f"- {e}" for e in errors)
+            raise DneIntegrityError(msg)
+
+    def count_orphans(self, fk: sa.ForeignKeyConstraint) -> int:
+        """
+        Count the rows whose references are not found, ignoring null references.
+        """
+        table = fk.parent
+        # the referred table may be the same (self-referencing)
+        referred_table = fk.referred_table.alias("referred")
+        elements = list(fk.elements)
+
+        stmt = (
+            sa.select(sa.func.count())
+            .select_from(
+                table.outerjoin(
+                    referred_table,
+                    sa.and_(
+                        *(e.parent == referred_table.c[e.column.name] for e in elements)
+                    ),
+                )
+            )
+            .where(
+                *(e.parent.is_not(None) for e in elements),
+                referred_table.c[elements[0].column.name].is_(None),
+            )
+        )
+
+        return self.connection.execute(stmt).scalar()
+
+    def get_column_values(self, table_name: str, column_name: str) -> set:
+        """
+        Get the distinct values of a table column.
+        """
+        column = self.metadata.tables[table_name].c[column_name]
+
+        return set(self.connection.execute(sa.select(column).distinct()).scalars())
+
     def populate_unified_table(self):
         logger.info("Populating unified CEP table", extra={"indentation": 0})
         populate_unified_table(self.connection, self.metadata)
 
+    def populate_search_table(self):
+        logger.info("Populating CEP search table", extra={"indentation": 0})
+        populate_search_table(self.connection, self.metadata)
+
+    def populate_unified_view(self):
+        """
+        Keep the unified CEP table as a PostgreSQL materialized view of the CEP
+        tables, with a unique index on the CEP.
+
+        The view is created by the first load, replacing the unified table, and
+        refreshed concurrently by the next ones: the rows are rebuilt by the server
+        while readers keep querying the previous ones.
+        """
+        cep_unificado = get_table(self.metadata, "cep_unificado")
+        preparer = self.engine.dialect.identifier_preparer
+        view = preparer.format_table(cep_unificado)
+
+        if self.is_materialized_view(cep_unificado.name):
+            logger.info(
+                "Refreshing unified CEP materialized view", extra={"indentation": 0}
+            )
+            self.connection.execute(
+                sa.text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}")
+            )
+            return
+
+        logger.info("Creating unified CEP materialized view", extra={"indentation": 0})
+        # the unified table of previous loads is replaced by the view
+        cep_unificado.drop(self.connection, checkfirst=True)
+
+        select = select_unified_ceps(self.metadata).compile(
+            self.connection, compile_kwargs={"literal_binds": True}
+        )
+        index = preparer.quote(f"{cep_unificado.name}_cep_key")
+        self.connection.execute(sa.text(f"CREATE MATERIALIZED VIEW {view} AS {select}"))
+        # needed to refresh the view concurrently
+        self.connection.execute(sa.text(f"CREATE UNIQUE INDEX {index} ON {view} (cep)"))
+
+        for table_index in cep_unificado.indexes:
+            table_index.create(self.connection)
+
+    def drop_unified_view(self):
+        """
+        Drop the unified CEP materialized view of previous loads, so it's replaced
+        by the unified table.
+        """
+        cep_unificado = get_table(self.metadata, "cep_unificado")
+
+        if self.is_materialized_view(cep_unificado.name):
+            logger.info(
+                "Dropping unified CEP materialized view", extra={"indentation": 0}
+            )
+            view = self.engine.dialect.identifier_preparer.format_table(cep_unificado)
+
+            # tables are created by the engine, the view must be gone before that
+            with self.engine.begin() as connection:
+                connection.execute(sa.text(f"DROP MATERIALIZED VIEW {view}"))
+
+    def is_materialized_view(self, name: str) -> bool:
+        if self.engine.dialect.name != "postgresql":
+            return False
+
+        return name in sa.inspect(self.connection).get_materialized_view_names()
+
+    def get_checkpoints(
+        self,
+        table_set: str,
+        ufs: str | None = None,
+        dne_version: int | None = None,
+    ) -> dict[str, dict]:
+        """
+        Get the progress saved by a previous resumable load of the same table set,
+        UFs and DNE release, indexed by table name.
+        """
+        state_metadata.create_all(self.connection, tables=[checkpoint_table])
+
+        checkpoints = {
+            row.table_name: row._asdict()
+            for row in self.connection.execute(checkpoint_table.select())
+        }
+
+        if any(
+            (c["table_set"], c["ufs"], c["dne_version"])
+            != (table_set, ufs, dne_version)
+            for c in checkpoints.values()
+        ):
+            logger.info(
+                "Ignoring checkpoints saved for a different table set, UFs or DNE "
+                "release",
+                extra={"indentation": 0},
+            )
+            self.connection.execute(checkpoint_table.delete())
+            return {}
+
+        return checkpoints
+
+    def save_checkpoint(
+        self,
+        table_name: str,
+        table_set: str,
+        file_name: str | None = None,
+        line: int = 0,
+        *,
+        completed: bool = False,
+        ufs: str | None = None,
+        dne_version: int | None = None,
+    ):
+        """
+        Record the progress of a table population and commit it along with
+        all the rows inserted so far.
+        """
+        logger.debug(
+            "Saving checkpoint for table %s: %s",
+            table_name,
+            "completed" if completed else f"{file_name}:{line}",
+            extra={"indentation": 1},
+        )
+        self.connection.execute(
+            checkpoint_table.delete().where(checkpoint_table.c.table_name == table_name)
+        )
+        self.connection.execute(
+            checkpoint_table.insert().values(
+                table_name=table_name,
+                table_set=table_set,
+                ufs=ufs,
+                dne_version=dne_version,
+                file_name=file_name,
+                line=line,
+                completed=completed,
+            )
+        )
+        self.commit()
+
+    def clear_checkpoints(self):
+        """
+        Remove the checkpoints table once the load is finished.
+        """
+        checkpoint_table.drop(self.connection, checkfirst=True)
+
+    def get_load_info(self) -> dict | None:
+        """
+        Get the information saved by the last complete load of the unified CEP table.
+        """
+        if not sa.inspect(self.connection).has_table(load_info_table.name):
+            return None
+
+        cep_table = get_table(self.metadata, "cep_unificado").name
+        row = self.connection.execute(
+            load_info_table.select().where(load_info_table.c.cep_table == cep_table)
+        ).first()
+
+        return row._asdict() if row else None
+
+    def clear_load_info(self):
+        """
+        Forget the release of the last complete load of the unified CEP table, whose
+        rows are about to be removed, so it isn't skipped as already loaded if this
+        load fails. The schema options are kept, as the tables still have them.
+        """
+        if not sa.inspect(self.connection).has_table(load_info_table.name):
+            return
+
+        cep_table = get_table(self.metadata, "cep_unificado").name
+        self.connection.execute(
+            load_info_table.update()
+            .where(load_info_table.c.cep_table == cep_table)
+            .values(dne_version=None, etag=None, last_modified=None)
+        )
+
+    def save_load_info(
+        self,
+        table_set: str,
+        dne_version: int | None,
+        validators: dict,
+        ufs: str | None = None,
+        options: dict | None = None,
+    ):
+        """
+        Record the DNE release loaded, so unchanged releases can be skipped later,
+        along with the schema options of the load (see load_info_table).
+        """
+        state_metadata.create_all(self.connection, tables=[load_info_table])
+
+        cep_table = get_table(self.metadata, "cep_unificado").name
+        self.connection.execute(
+            load_info_table.delete().where(load_info_table.c.cep_table == cep_table)
+        )
+        self.connection.execute(
+            load_info_table.insert().values(
+                cep_table=cep_table,
+                table_set=table_set,
+                ufs=ufs,
+                dne_version=dne_version,
+                etag=validators.get("etag"),
+                last_modified=validators.get("last_modified"),
+                **(options or {}),
+                loaded_at=datetime.now(tz=timezone.utc),
+            )
+        )
+
     @staticmethod
     def find_self_referencing_fks(table) -> str | None:
         """
@@ -129,3 +588,144 @@ class DneDatabaseWriter:
 
         sorted_map = tuple(TopologicalSorter(topological_graph).static_order())
         return sorted(lines, key=lambda line: sorted_map.index(line[0]))
+
+
+class SqliteBulkDatabaseWriter(DneDatabaseWriter):
+    """
+    Writer tuned for bulk loading SQLite database files.
+
+    The load is built into a copy of the target database, with journaling and
+    syncing disabled, a large page cache and an exclusive lock. The indexes of the
+    populated tables are only created after their rows are inserted. At the end,
+    the copy is analyzed, vacuumed and atomically renamed over the target file, so
+    readers never see a partially built database.
+
+    Without a journal the changes can't be rolled back, so the copy is just
+    discarded when the load fails, leaving the target file untouched.
+    """
+
+    # page cache size, in KiB
+    cache_size = 512 * 1024
+
+    def __init__(self, database_url: str, metadata: sa.MetaData = default_metadata):
+        url = sa.make_url(database_url)
+
+        if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+            msg = f"SQLite bulk load needs a SQLite database file: {database_url}"
+            raise ValueError(msg)
+
+        self.target_path = Path(url.database)
+        # in the same directory, so it can be renamed over the target
+        self.build_path = self.target_path.with_name(
+            f".{self.target_path.name}.{os.getpid()}.building"
+        )
+        self.deferred_indexes: list[sa.Index] = []
+
+        super().__init__(
+            url.set(database=str(self.build_path)).render_as_string(
+                hide_password=False
+            ),
+            metadata,
+        )
+        sa.event.listen(self.engine, "connect", self.set_bulk_pragmas)
+
+    def __enter__(self):
+        self.build_path.unlink(missing_ok=True)
+
+        if self.target_path.exists():
+            # keep the tables which aren't populated by the loader
+            logger.info(
+                "Copying %s to build the new database",
+                self.target_path,
+                extra={"indentation": 0},
+            )
+            with (
+                contextlib.closing(sqlite3.connect(self.target_path)) as target,
+                contextlib.closing(sqlite3.connect(self.build_path)) as build,
+            ):
+                target.backup(build)
+
+        try:
+            return super().__enter__()
+        except Exception:
+            self.build_path.unlink(missing_ok=True)
+            raise
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_val:
+            logger.warning(
+                "Something went wrong. Discarding %s...",
+                self.build_path,
+                extra={"indentation": 0},
+            )
+            self.close()
+            self.build_path.unlink(missing_ok=True)
+            return
+
+        if self.abandoned:
+            # the target is left untouched, so its readers keep their file
+            self.close()
+            self.build_path.unlink(missing_ok=True)
+            return
+
+        self.create_deferred_indexes()
+
+        logger.info("Analyzing database", extra={"indentation": 0})
+        self.connection.execute(sa.text("ANALYZE"))
+        self.connection.commit()
+        self.vacuum()
+        self.close()
+
+        self.build_path.replace(self.target_path)
+        logger.info(
+            "Database %s replaced by the new one",
+            self.target_path,
+            extra={"indentation": 0},
+        )
+
+    def close(self):
+        self.connection.close()
+        # release the exclusive lock held by the pooled connection
+        self.engine.dispose()
+
+    def set_bulk_pragmas(self, dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+
+        for pragma in (
+            "journal_mode = OFF",
+            "synchronous = OFF",
+            f"cache_size = -{self.cache_size}",
+            "locking_mode = EXCLUSIVE",
+            "temp_store = MEMORY",
+        ):
+            cursor.execute(f"PRAGMA {pragma}")
+
+        cursor.close()
+
+    def create_tables(self, tables: list[str]):
+        metadata_tables = [self.metadata.tables[t] for t in tables]
+        tables_names = "\n".join([f"- {t}" for t in tables])
+
+        logger.info("Creating tables:\n%s", tables_names, extra={"indentation": 0})
+
+        # the exclusive lock is held by the writer connection, so it must be used
+        # for everything, and the indexes are only created after populating
+        for table in metadata_tables:
+            if not sa.inspect(self.connection).has_table(table.name):
+                self.connection.execute(sa.schema.CreateTable(table))
+
+            for index in table.indexes:
+                self.connection.execute(sa.schema.DropIndex(index, if_exists=True))
+                self.deferred_indexes.append(index)
+
+    def create_deferred_indexes(self):
+        inspector = sa.inspect(self.connection)
+        indexes = [
+            i for i in self.deferred_indexes if inspector.has_table(i.table.name)
+        ]
+
+        if indexes:
+            logger.info("Creating %s indexes", len(indexes), extra={"indentation": 0})
+
+        for index in indexes:
+            index.create(self.connection, checkfirst=True)
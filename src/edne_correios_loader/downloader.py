@@ -0,0 +1,368 @@
+import glob
+import http.client
+import json
+import logging
+import shutil
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from pathlib import Path
+
+from .exc import DneDownloadError
+
+logger = logging.getLogger(__name__)
+
+ReportHook = Callable[[int, int, str], None]
+
+
+class IncompleteDownloadError(DneDownloadError):
+    """
+    The transfer ended before all the expected bytes were received
+    """
+
+
+# errors which may go away by trying again
+RETRYABLE_ERRORS = (
+    IncompleteDownloadError,
+    urllib.error.URLError,
+    http.client.HTTPException,
+    OSError,
+)
+
+
+class DneDownloader:
+    """
+    Downloads a file over HTTP(S) using large buffers.
+
+    When the server supports range requests, the file is split in segments which are
+    downloaded in parallel. Interrupted transfers are retried from where they
+    stopped, and each segment is kept in a `.partN` file next to the destination,
+    so a download left incomplete in the same destination is also resumed.
+
+    The validators (ETag, Last-Modified and size) of the file being downloaded are
+    kept in a `.resume` file next to the destination, so leftovers of a download
+    are only resumed if they belong to the same version of the file. Range requests
+    are also sent with If-Range, so the server sends the whole file if it changed.
+
+    The downloaded size is verified against the Content-Length sent by the server.
+    """
+
+    buffer_size = 1024 * 1024
+    segments = 4
+    min_segment_size = 16 * 1024 * 1024
+    max_retries = 3
+    retry_delay = 1.0
+    timeout = 60
+
+    def __init__(
+        self,
+        url: str,
+        report_hook: ReportHook | None = None,
+        request_headers: dict | None = None,
+    ):
+        """
+        The request_headers are sent in the first request only, and can make it
+        conditional (e.g. If-None-Match), in which case a 304 response is raised
+        as an HTTPError.
+        """
+        self.url = url
+        self.report_hook = report_hook
+        self.request_headers = request_headers
+        self.response_headers: http.client.HTTPMessage | None = None
+        self.total_size = -1
+        self.validators: dict = {}
+        self._report_lock = threading.Lock()
+
+    def download(self, destination: Path) -> Path:
+        with self.open(self.request_headers) as response:
+            self.response_headers = response.headers
+            self.total_size = int(response.headers.get("Content-Length", -1))
+            accepts_ranges = response.headers.get("Accept-Ranges", "") == "bytes"
+            self.validators = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "total_size": self.total_size,
+            }
+            self.discard_stale_leftovers(destination)
+            self.report(0, "start")
+
+            if accepts_ranges and self.total_size >= self.min_segment_size * 2:
+                # segments will be requested in parallel, the response isn't needed
+                response.close()
+                self.download_segments(destination)
+
+            else:
+                self.download_stream(destination, response, accepts_ranges)
+
+        size = destination.stat().st_size
+        if self.total_size not in (-1, size):
+            msg = f"Downloaded {size} bytes from {self.url}, expected {self.total_size}"
+            raise DneDownloadError(msg)
+
+        resume_path(destination).unlink(missing_ok=True)
+        self.report(0, "finish")
+        return destination
+
+    def discard_stale_leftovers(self, destination: Path):
+        """
+        Remove the files left by a previous download into the same destination,
+        unless they're from the same version of the file, and record the version
+        being downloaded.
+        """
+        resume_file = resume_path(destination)
+
+        try:
+            previous = json.loads(resume_file.read_text())
+        except (OSError, ValueError):
+            previous = None
+
+        # without validators, the version of the leftovers can't be told
+        if previous != self.validators or not self.if_range():
+            for leftover in (
+                destination,
+                *destination.parent.glob(f"{glob.escape(destination.name)}.part*"),
+            ):
+                leftover.unlink(missing_ok=True)
+
+        resume_file.write_text(json.dumps(self.validators))
+
+    def if_range(self) -> str | None:
+        """
+        Get the validator to send in If-Range. Weak ETags can't be used.
+        """
+        etag = self.validators.get("etag")
+
+        if etag and not etag.startswith("W/"):
+            return etag
+
+        return self.validators.get("last_modified")
+
+    def open_range(self, byte_range: str) -> http.client.HTTPResponse:
+        headers = {"Range": f"bytes={byte_range}"}
+
+        if if_range := self.if_range():
+            headers["If-Range"] = if_range
+
+        return self.open(headers)
+
+    def probe(self) -> http.client.HTTPMessage:
+        """
+        Get the file response headers without downloading it.
+        """
+        request = urllib.request.Request(self.url, method="HEAD")  # noqa: S310
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:  # noqa: S310
+            return response.headers
+
+    def open(self, headers: dict | None = None) -> http.client.HTTPResponse:
+        request = urllib.request.Request(self.url, headers=headers or {})  # noqa: S310
+        return urllib.request.urlopen(request, timeout=self.timeout)  # noqa: S310
+
+    def download_stream(
+        self,
+        destination: Path,
+        response: http.client.HTTPResponse | None,
+        accepts_ranges: bool,  # noqa: FBT001
+    ):
+        """
+        Download the whole file sequentially, reusing the already open response.
+
+        If the transfer is interrupted, it's resumed from the last received byte
+        when the server supports range requests, or restarted otherwise.
+        """
+        logger.debug("Downloading %s sequentially", self.url)
+
+        downloaded = destination.stat().st_size if destination.exists() else 0
+
+        if downloaded and downloaded == self.total_size:
+            # left complete by a previous download of the same version
+            self.report(downloaded, "progress")
+            return
+
+        if (
+            accepts_ranges
+            and downloaded
+            and (self.total_size == -1 or downloaded < self.total_size)
+        ):
+            # continue the previous download instead of using the new response
+            self.report(downloaded, "progress")
+            response = None
+        else:
+            destination.write_bytes(b"")
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                if response is None:
+                    response = self.reopen_stream(destination, accepts_ranges)
+
+                with destination.open("ab") as file:
+                    self.copy_response(response, file)
+
+                if self.total_size in (-1, destination.stat().st_size):
+                    return
+
+                msg = f"Transfer of {self.url} ended before the expected size"
+                raise IncompleteDownloadError(msg)
+
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+
+                logger.warning(
+                    "Download interrupted (%s), retrying...",
+                    e,
+                    extra={"indentation": 1},
+                )
+                response = None
+                time.sleep(self.retry_delay * (attempt + 1))
+
+    def reopen_stream(
+        self,
+        destination: Path,
+        accepts_ranges: bool,  # noqa: FBT001
+    ) -> http.client.HTTPResponse:
+        downloaded = destination.stat().st_size
+
+        if accepts_ranges and downloaded:
+            try:
+                response = self.open_range(f"{downloaded}-")
+            except urllib.error.HTTPError as e:
+                # the file is smaller than what was downloaded, it isn't the same
+                if e.code != HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
+                    raise
+            else:
+                # a full response means the file changed (see If-Range)
+                if response.status == HTTPStatus.PARTIAL_CONTENT:
+                    return response
+                response.close()
+
+        # the server can't continue the transfer, start it over
+        self.report(-downloaded, "progress")
+        destination.write_bytes(b"")
+        return self.open()
+
+    def download_segments(self, destination: Path):
+        """
+        Download the file in parallel segments using range requests, then join
+        the segments into the destination file.
+        """
+        segment_size = max(-(-self.total_size // self.segments), self.min_segment_size)
+        ranges = [
+            (start, min(start + segment_size, self.total_size) - 1)
+            for start in range(0, self.total_size, segment_size)
+        ]
+        parts = [
+            destination.with_name(f"{destination.name}.part{i}")
+            for i in range(len(ranges))
+        ]
+
+        logger.debug("Downloading %s in %s parallel segments", self.url, len(ranges))
+
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [
+                executor.submit(self.download_range, part, start, end)
+                for part, (start, end) in zip(parts, ranges, strict=True)
+            ]
+            for future in futures:
+                future.result()
+
+        with destination.open("wb") as file:
+            for part in parts:
+                with part.open("rb") as part_file:
+                    shutil.copyfileobj(part_file, file, self.buffer_size)
+                part.unlink()
+
+    def download_range(self, part: Path, start: int, end: int):
+        """
+        Download the bytes from start to end (inclusive) into the part file,
+        continuing from what the part file already has.
+        """
+        expected_size = end - start + 1
+
+        if part.exists():
+            if part.stat().st_size > expected_size:
+                # leftover from an unrelated download
+                part.unlink()
+            else:
+                self.report(part.stat().st_size, "progress")
+
+        for attempt in range(self.max_retries + 1):
+            downloaded = part.stat().st_size if part.exists() else 0
+
+            if downloaded == expected_size:
+                return
+
+            try:
+                with self.open_range(f"{start + downloaded}-{end}") as response:
+                    if response.status != HTTPStatus.PARTIAL_CONTENT:
+                        msg = (
+                            f"Server ignored the range request for {self.url}, "
+                            "or the file changed during the download"
+                        )
+                        raise DneDownloadError(msg)
+
+                    with part.open("ab") as file:
+                        self.copy_response(response, file)
+
+                if part.stat().st_size != expected_size:
+                    msg = f"Transfer of {part.name} ended before the expected size"
+                    raise IncompleteDownloadError(msg)
+
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+
+                if is_range_not_satisfiable(e):
+                    # the part doesn't belong to this file, start it over
+                    part.unlink(missing_ok=True)
+
+                logger.warning(
+                    "Download of %s interrupted (%s), retrying...",
+                    part.name,
+                    e,
+                    extra={"indentation": 1},
+                )
+                time.sleep(self.retry_delay * (attempt + 1))
+
+    def copy_response(self, response: http.client.HTTPResponse, file):
+        while block := response.read(self.buffer_size):
+            file.write(block)
+            self.report(len(block), "progress")
+
+    def report(self, read: int, hook_type: str):
+        if self.report_hook:
+            # segments are downloaded by multiple threads
+            with self._report_lock:
+                self.report_hook(read, self.total_size, hook_type)
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Client errors (like 404) won't go away by trying again, except for ranges
+    beyond the end of the file, requested from partial files which are then
+    downloaded again from the start.
+    """
+    if isinstance(error, urllib.error.HTTPError):
+        return (
+            error.code >= HTTPStatus.INTERNAL_SERVER_ERROR
+            or is_range_not_satisfiable(error)
+        )
+
+    return True
+
+
+def is_range_not_satisfiable(error: Exception) -> bool:
+    return (
+        isinstance(error, urllib.error.HTTPError)
+        and error.code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+    )
+
+
+def resume_path(destination: Path) -> Path:
+    """
+    Get the file with the validators of the download into the destination.
+    """
+    return destination.with_name(f"{destination.name}.resume")
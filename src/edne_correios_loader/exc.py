@@ -8,3 +8,21 @@ class DneResolverError(BaseDneLoaderError):
     """
     Error resolving DNE source
     """
+
+
+class DneDownloadError(DneResolverError):
+    """
+    Error downloading the DNE file
+    """
+
+
+class DneNotModifiedError(BaseDneLoaderError):
+    """
+    The DNE source didn't change since it was last loaded
+    """
+
+
+class DneIntegrityError(BaseDneLoaderError):
+    """
+    Loaded rows reference rows which don't exist
+    """
@@ -1,18 +1,35 @@
+import contextlib
 import logging
-from collections.abc import Iterable
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterable
 from pathlib import Path
 
-from .dbwriter import DneDatabaseWriter
+import sqlalchemy as sa
+from sqlalchemy import MetaData
+
+from .cep_bitmap import build_cep_bitmap
+from .clean_strategy import CleanStrategyEnum
+from .dbwriter import DneDatabaseWriter, SqliteBulkDatabaseWriter
+from .exc import DneNotModifiedError
 from .resolver import DneResolver
-from .table_set import TableSetEnum, get_table_files_glob
+from .table_set import TableSetEnum, get_table_files_globs
 from .tables import TableNameResolver, build_metadata
+from .uf_filter import UfFilter, format_ufs, parse_ufs
+from .unified_table import project_metadata
 
 logger = logging.getLogger(__name__)
 
+# load options changing the schema of the tables, which are dropped and created
+# again when they change
+SCHEMA_OPTIONS = ("cep_as_integer", "partition_unified_table")
+
 
 class DneLoader:
     DneResolver: type[DneResolver] = DneResolver
     DneDatabaseWriter: type[DneDatabaseWriter] = DneDatabaseWriter
+    SqliteBulkDatabaseWriter: type[DneDatabaseWriter] = SqliteBulkDatabaseWriter
 
     database_url: str
     dne_source: str
@@ -25,56 +42,471 @@ class DneLoader:
         *,
         dne_source: str | None = None,
         table_names: TableNameResolver | None = None,
+        cache_dir: str | Path | None = None,
+        cache_max_size: int | None = None,
+        cep_as_integer: bool = False,
+        partition_unified_table: bool = False,
     ):
         self.database_url = database_url
         self.dne_source = dne_source
-        self.metadata = build_metadata(table_names)
+        self.cache_dir = cache_dir
+        self.cache_max_size = cache_max_size
+        # CEPs are converted to integers while reading (see build_row_converter)
+        self.metadata = build_metadata(
+            table_names,
+            cep_as_integer=cep_as_integer,
+            partition_unified_table=partition_unified_table,
+        )
+
+    def load(
+        self,
+        table_set: TableSetEnum = TableSetEnum.UNIFIED_CEP_ONLY,
+        *,
+        resume: bool = False,
+        force: bool = False,
+        clean_strategy: CleanStrategyEnum = CleanStrategyEnum.DELETE,
+        relax_foreign_keys: bool = False,
+        sqlite_bulk: bool = False,
+        unlogged_staging: bool = False,
+        pipelined: bool = False,
+        project_columns: bool = False,
+        ufs: Iterable[str] | None = None,
+        materialized_view: bool = False,
+        cep_bitmap_path: str | Path | None = None,
+        search_index: bool = False,
+    ) -> bool:
+        """
+        Load the DNE into the database.
+
+        By default, everything runs in a single transaction. When `resume` is True,
+        the progress is committed table by table (and periodically inside big
+        tables), so a failed load can be continued from where it stopped by
+        calling `load(resume=True)` again.
+
+        The loaded release is recorded in the database, and the load is skipped
+        if the DNE source didn't change since then (same HTTP validators or same
+        DNE version), unless `force` is True or the tables, UFs or schema options
+        (e.g. `cep_as_integer`) loaded differ. The tables created with other schema
+        options are dropped and created again (see SCHEMA_OPTIONS).
+
+        The rows of a previous load are removed according to `clean_strategy`
+        (see CleanStrategyEnum).
+
+        When `relax_foreign_keys` is True, the foreign keys aren't enforced while
+        the tables are populated, so the rows are inserted as they are read, and
+        all the references are verified at once at the end.
+
+        When `sqlite_bulk` is True, the SQLite database file is built apart and
+        swapped in once loaded (see SqliteBulkDatabaseWriter). Such loads can't be
+        resumed, as failed builds are discarded.
+
+        When `unlogged_staging` is True, the tables dropped at the end of the load
+        are made UNLOGGED on PostgreSQL, skipping the WAL. Unlogged tables are
+        emptied by a server crash, so such loads can't be resumed either.
+
+        When `pipelined` is True, the DNE files are parsed in a separate thread
+        while the rows are inserted (see PipelinedReader).
+
+        When `project_columns` is True and only the unified CEP table is kept, the
+        other tables are created with just the columns used to populate it, and
+        the remaining fields of the DNE files are skipped.
+
+        When `ufs` are provided (e.g. ["SP", "RJ"]), only the DNE data of these UFs
+        is loaded: the per-UF files of the other UFs aren't read, and the rows of the
+        other tables are filtered by UF (see UfFilter).
+
+        When `materialized_view` is True, the unified CEP table is kept as a
+        PostgreSQL materialized view of the CEP tables, refreshed concurrently by
+        each load, so it can't be used along with the unified-cep-only table set.
+
+        When `cep_bitmap_path` is provided, the bitmap of the loaded CEPs is rebuilt
+        and saved to it at the end of the load (see CepBitmap).
+
+        When `search_index` is True, the CEP search table is rebuilt from the
+        unified CEP table, so CEPs can be found by street name (see CepSearcher).
+
+        Returns False if the load was skipped.
+        """
+        if sqlite_bulk and resume:
+            msg = "SQLite bulk loads can't be resumed"
+            raise ValueError(msg)
+
+        if unlogged_staging and resume:
+            msg = "Loads with unlogged staging tables can't be resumed"
+            raise ValueError(msg)
+
+        if materialized_view and table_set == TableSetEnum.UNIFIED_CEP_ONLY:
+            msg = "The unified CEP materialized view needs the CEP tables to be kept"
+            raise ValueError(msg)
+
+        if ufs is not None:
+            ufs = parse_ufs(ufs)
+            logger.info(
+                "Loading only the DNE data of %s",
+                ", ".join(ufs),
+                extra={"indentation": 0},
+            )
+
+        writer_class = (
+            self.SqliteBulkDatabaseWriter if sqlite_bulk else self.DneDatabaseWriter
+        )
+
+        write_metadata = self.metadata
+        if project_columns:
+            if table_set == TableSetEnum.UNIFIED_CEP_ONLY:
+                write_metadata = project_metadata(self.metadata)
+            else:
+                logger.warning(
+                    "Columns are only projected when just the unified CEP table is "
+                    "kept, loading all of them",
+                    extra={"indentation": 0},
+                )
 
-    def load(self, table_set: TableSetEnum = TableSetEnum.UNIFIED_CEP_ONLY):
         # connect to database to ensure the URL is valid
         # connection will be closed when the context manager exits
-        with self.DneDatabaseWriter(
-            self.database_url, self.metadata
-        ) as database_writer:
+        with writer_class(self.database_url, write_metadata) as database_writer:
+            if (
+                materialized_view
+                and database_writer.engine.dialect.name != "postgresql"
+            ):
+                msg = (
+                    "The unified CEP materialized view is only supported on PostgreSQL"
+                )
+                raise ValueError(msg)
+
+            last_load = database_writer.get_load_info()
+            options = {
+                "cep_as_integer": self.metadata.info["cep_as_integer"],
+                "partition_unified_table": self.metadata.info[
+                    "partition_unified_table"
+                ],
+                "materialized_view": materialized_view,
+            }
+            # the tables of the last load have the schema of its options
+            recreate_tables = last_load is not None and any(
+                last_load[name] != options[name] for name in SCHEMA_OPTIONS
+            )
+
+            if last_load and (
+                force
+                or (last_load["table_set"], last_load["ufs"])
+                != (table_set.value, format_ufs(ufs))
+                or any(last_load[name] != value for name, value in options.items())
+            ):
+                # the last load populated other tables or UFs, or with other
+                # options, it must be loaded again
+                last_load = None
+
+            validators = {}
+            if last_load:
+                validators = {
+                    "etag": last_load["etag"],
+                    "last_modified": last_load["last_modified"],
+                }
+
             # now that we know the URL is valid, download/extract the DNE file
             # temp files will be removed when the context manager exits
-            with self.DneResolver(self.dne_source) as dne_path:
-                # all good, let's start by ensuring the tables exist and are empty
-                tables_to_populate = table_set.to_populate(self.metadata)
-                tables_to_drop = table_set.to_drop(self.metadata)
+            resolver = self.DneResolver(
+                self.dne_source,
+                cache_dir=self.cache_dir,
+                cache_max_size=self.cache_max_size,
+                validators=validators,
+                table_set=table_set,
+                ufs=ufs,
+            )
 
-                database_writer.create_tables(tables_to_populate)
-                database_writer.clean_tables(tables_to_populate)
+            try:
+                with resolver as dne_path:
+                    if (
+                        last_load
+                        and resolver.dne_version is not None
+                        and (resolver.dne_version == last_load["dne_version"])
+                    ):
+                        logger.info(
+                            "DNE version %s is already loaded, nothing to do",
+                            resolver.dne_version,
+                            extra={"indentation": 0},
+                        )
+                        database_writer.abandon()
+                        return False
 
-                for table in tables_to_populate:
-                    files_glob = get_table_files_glob(table, self.metadata)
+                    self.populate_tables(
+                        database_writer,
+                        dne_path,
+                        table_set,
+                        resume=resume,
+                        clean_strategy=clean_strategy,
+                        relax_foreign_keys=relax_foreign_keys,
+                        unlogged_staging=unlogged_staging,
+                        pipelined=pipelined,
+                        write_metadata=write_metadata,
+                        ufs=ufs,
+                        materialized_view=materialized_view,
+                        recreate_tables=recreate_tables,
+                        dne_version=resolver.dne_version,
+                    )
 
-                    if files_glob:
-                        files = dne_path.glob(files_glob)
-                        data = TableFilesReader(
-                            files, buffer_size=self.read_buffer_size
-                        )
-                        database_writer.populate_table(table, data)
+            except DneNotModifiedError:
+                logger.info(
+                    "DNE source didn't change since the last load, nothing to do",
+                    extra={"indentation": 0},
+                )
+                database_writer.abandon()
+                return False
+
+            if materialized_view:
+                database_writer.populate_unified_view()
+            else:
+                database_writer.populate_unified_table()
 
-            database_writer.populate_unified_table()
-            database_writer.drop_tables(tables_to_drop)
+            if search_index:
+                database_writer.populate_search_table()
+
+            database_writer.drop_tables(table_set.to_drop(self.metadata))
+
+            if resume:
+                database_writer.clear_checkpoints()
+
+            database_writer.save_load_info(
+                table_set.value,
+                resolver.dne_version,
+                resolver.source_validators,
+                ufs=format_ufs(ufs),
+                options=options,
+            )
+
+        if cep_bitmap_path is not None:
+            build_cep_bitmap(self.database_url, cep_bitmap_path, self.metadata)
+
+        return True
+
+    def populate_tables(
+        self,
+        database_writer: DneDatabaseWriter,
+        dne_path: Path,
+        table_set: TableSetEnum,
+        *,
+        resume: bool,
+        clean_strategy: CleanStrategyEnum,
+        relax_foreign_keys: bool,
+        unlogged_staging: bool,
+        pipelined: bool,
+        write_metadata: MetaData,
+        ufs: tuple[str, ...] | None = None,
+        materialized_view: bool = False,
+        recreate_tables: bool = False,
+        dne_version: int | None = None,
+    ):
+        # all good, let's start by ensuring the tables exist and are empty
+        tables_to_populate = table_set.to_populate(self.metadata)
+        tables_to_create = [
+            t
+            for t in tables_to_populate
+            # the unified materialized view is created after populating the others
+            if not (
+                materialized_view and self.metadata.tables[t].info.get("unified_table")
+            )
+        ]
+
+        if recreate_tables:
+            # the progress saved for the dropped tables is lost with them
+            database_writer.clear_checkpoints()
+            database_writer.drop_all_tables()
+
+        if relax_foreign_keys:
+            database_writer.relax_foreign_keys()
+
+        checkpoints = (
+            database_writer.get_checkpoints(
+                table_set.value, ufs=format_ufs(ufs), dne_version=dne_version
+            )
+            if resume
+            else {}
+        )
+
+        if write_metadata is not self.metadata and not checkpoints:
+            # tables left by a previous load may have all the columns
+            database_writer.drop_tables(table_set.to_drop(self.metadata))
+
+        database_writer.create_tables(tables_to_create)
+
+        if checkpoints:
+            logger.info(
+                "Resuming the previous load from its last checkpoint",
+                extra={"indentation": 0},
+            )
+        else:
+            database_writer.clean_tables(tables_to_create, clean_strategy)
+
+            if resume:
+                # the cleaning is committed, the loaded release is gone with it
+                database_writer.clear_load_info()
+                database_writer.commit()
+
+        if unlogged_staging:
+            # once emptied, so the rows left by the previous load aren't rewritten
+            # through the WAL
+            database_writer.make_tables_unlogged(table_set.to_drop(self.metadata))
+
+        uf_filter = UfFilter(ufs) if ufs else None
+
+        for table in tables_to_populate:
+            files_globs = get_table_files_globs(table, self.metadata, ufs)
+
+            if files_globs:
+                files = [
+                    f for files_glob in files_globs for f in dne_path.glob(files_glob)
+                ]
+                row_filter = None
+
+                if uf_filter is not None:
+                    row_filter = uf_filter.build_row_filter(self.metadata.tables[table])
+
+                    if table in checkpoints:
+                        # rows loaded before the checkpoint aren't read again
+                        for column in uf_filter.get_kept_columns(table):
+                            uf_filter.add_kept_keys(
+                                table,
+                                column,
+                                database_writer.get_column_values(table, column),
+                            )
+
+                if resume:
+                    self.populate_table_with_checkpoints(
+                        database_writer,
+                        table,
+                        files,
+                        table_set,
+                        checkpoints.get(table),
+                        pipelined=pipelined,
+                        write_table=write_metadata.tables[table],
+                        row_filter=row_filter,
+                        ufs=ufs,
+                        dne_version=dne_version,
+                    )
+                else:
+                    data = TableFilesReader(
+                        files,
+                        buffer_size=self.read_buffer_size,
+                        row_converter=build_row_converter(
+                            self.metadata.tables[table], write_metadata.tables[table]
+                        ),
+                        row_filter=row_filter,
+                    )
+
+                    if pipelined:
+                        data = PipelinedReader(data)
+
+                    database_writer.populate_table(table, data)
+
+        if database_writer.foreign_keys_relaxed:
+            database_writer.verify_foreign_keys(tables_to_create)
+
+    def populate_table_with_checkpoints(
+        self,
+        database_writer: DneDatabaseWriter,
+        table: str,
+        files: Iterable[Path],
+        table_set: TableSetEnum,
+        checkpoint: dict | None,
+        *,
+        pipelined: bool = False,
+        write_table: sa.Table | None = None,
+        row_filter: Callable[[list], bool] | None = None,
+        ufs: tuple[str, ...] | None = None,
+        dne_version: int | None = None,
+    ):
+        """
+        Populate the table committing its progress, skipping what was already
+        loaded according to the table checkpoint.
+        """
+        if checkpoint and checkpoint["completed"]:
+            logger.info(
+                "Table %s was already populated, skipping it",
+                table,
+                extra={"indentation": 0},
+            )
+            return
+
+        resume_from = None
+        if checkpoint and checkpoint["file_name"]:
+            resume_from = (checkpoint["file_name"], checkpoint["line"])
+
+        data = TableFilesReader(
+            files,
+            buffer_size=self.read_buffer_size,
+            resume_from=resume_from,
+            row_converter=build_row_converter(self.metadata.tables[table], write_table),
+            row_filter=row_filter,
+        )
+
+        if pipelined:
+            data = PipelinedReader(data)
+
+        def save_progress():
+            database_writer.save_checkpoint(
+                table,
+                table_set.value,
+                *data.position,
+                ufs=format_ufs(ufs),
+                dne_version=dne_version,
+            )
+
+        database_writer.populate_table(table, data, checkpoint=save_progress)
+        database_writer.save_checkpoint(
+            table,
+            table_set.value,
+            completed=True,
+            ufs=format_ufs(ufs),
+            dne_version=dne_version,
+        )
 
 
 class TableFilesReader:
     """
     Memory-efficient reader for DNE files targeting a single table.
     Read files sequentially in chunks of lines and yield each line
+
+    Files are read in name order, so the reading can be resumed from a given
+    (file name, line number) position, skipping everything before it.
+
+    Fields are yielded as strings, unless a row_converter (see build_row_converter)
+    is provided to convert them to the types of the table columns. Lines rejected
+    by the row_filter, if provided, are skipped.
     """
 
-    def __init__(self, files: Iterable[Path], buffer_size=1000000):
+    def __init__(
+        self,
+        files: Iterable[Path],
+        buffer_size=1000000,
+        resume_from: tuple[str, int] | None = None,
+        row_converter: Callable[[list], tuple] | None = None,
+        row_filter: Callable[[list], bool] | None = None,
+    ):
         self.files = files
         self.buffer_size = buffer_size
+        self.resume_from = resume_from
+        self.row_converter = row_converter
+        self.row_filter = row_filter
+        self.position: tuple[str | None, int] = (None, 0)
 
     def __iter__(self):
-        for file in self.files:
+        resume_file, resume_line = self.resume_from or (None, 0)
+        convert = self.row_converter is not None
+
+        for file in sorted(self.files, key=lambda f: f.name):
+            if resume_file and file.name < resume_file:
+                logger.debug(
+                    "Skipping %s, already loaded", file.name, extra={"indentation": 1}
+                )
+                continue
+
+            skip_lines = resume_line if file.name == resume_file else 0
+
             with file.open(encoding="latin1") as fp:
                 logger.info("Reading %s", file.name, extra={"indentation": 1})
                 lines_buffer = fp.readlines(self.buffer_size)
+                line_number = 0
 
                 while lines_buffer:
                     logger.debug(
@@ -84,6 +516,178 @@ class TableFilesReader:
                         extra={"indentation": 2},
                     )
                     for line in lines_buffer:
-                        yield [f.strip() or None for f in line.split("@")]
+                        line_number += 1
+
+                        if line_number <= skip_lines:
+                            continue
+
+                        self.position = (file.name, line_number)
+                        fields = [f.strip() or None for f in line.split("@")]
+
+                        if self.row_filter is not None and not self.row_filter(fields):
+                            continue
+
+                        yield self.row_converter(fields) if convert else fields
 
                     lines_buffer = fp.readlines(self.buffer_size)
+
+
+def build_row_converter(
+    table: sa.Table, projected_table: sa.Table | None = None
+) -> Callable[[list], tuple]:
+    """
+    Build a function converting the string fields of a DNE file line to the types
+    of the table columns, so the database driver receives them ready to be stored.
+    The converters are computed once per table, not for each line.
+
+    When a projected table (with a subset of the table columns) is provided, only
+    the fields of its columns are kept.
+    """
+    if projected_table is None or len(projected_table.columns) == len(table.columns):
+        converters = [get_column_converter(column) for column in table.columns]
+
+        def convert(fields: list) -> tuple:
+            return tuple(
+                value if converter is None or value is None else converter(value)
+                for converter, value in zip(converters, fields, strict=False)
+            )
+
+        return convert
+
+    file_columns = list(table.columns.keys())
+    projection = [
+        (file_columns.index(column.name), get_column_converter(column))
+        for column in projected_table.columns
+    ]
+
+    def convert_projection(fields: list) -> tuple:
+        row = []
+
+        for i, converter in projection:
+            value = fields[i] if i < len(fields) else None
+            row.append(
+                value if converter is None or value is None else converter(value)
+            )
+
+        return tuple(row)
+
+    return convert_projection
+
+
+def get_column_converter(column: sa.Column) -> Callable[[str], object] | None:
+    column_type = column.type
+
+    if isinstance(column_type, sa.Enum) and column_type.enum_class:
+        # map the stored values to the enum members
+        members = dict(zip(column_type.enums, column_type.enum_class, strict=True))
+        return members.__getitem__
+
+    if isinstance(column_type, sa.Integer):
+        return int
+
+    # strings are kept as they are
+    return None
+
+
+class PipelinedReader:
+    """
+    Reads the lines of a TableFilesReader in a separate thread, so the files are
+    parsed while the previous lines are being written to the database.
+
+    The lines are passed in chunks through a bounded queue: when the writer falls
+    behind, the reading thread waits for room in the queue. Errors raised while
+    reading are re-raised by the iteration, and the reading thread is stopped when
+    the iteration stops before the end (e.g. when the writing fails).
+
+    Each line carries the reader position, so `position` always matches the last
+    line yielded, as in TableFilesReader.
+    """
+
+    def __init__(
+        self, reader: "TableFilesReader", chunk_size: int = 1000, max_chunks: int = 10
+    ):
+        self.reader = reader
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.position: tuple[str | None, int] = reader.position
+
+    def __iter__(self):
+        chunks = queue.Queue(maxsize=self.max_chunks)
+        stop = threading.Event()
+        read_time = 0.0
+        wait_time = 0.0
+        start = time.perf_counter()
+
+        def put(item) -> bool:
+            # wait for room in the queue, unless the iteration was stopped
+            while not stop.is_set():
+                with contextlib.suppress(queue.Full):
+                    chunks.put(item, timeout=0.1)
+                    return True
+            return False
+
+        def read():
+            nonlocal read_time
+            chunk = []
+            chunk_start = time.perf_counter()
+
+            try:
+                for line in self.reader:
+                    chunk.append((line, self.reader.position))
+
+                    if len(chunk) >= self.chunk_size:
+                        read_time += time.perf_counter() - chunk_start
+                        if not put(chunk):
+                            return
+                        chunk = []
+                        chunk_start = time.perf_counter()
+
+                read_time += time.perf_counter() - chunk_start
+                if chunk and not put(chunk):
+                    return
+                put(None)
+
+            except BaseException as e:
+                put(e)
+
+        thread = threading.Thread(target=read, name="dne-reader", daemon=True)
+        thread.start()
+
+        try:
+            while True:
+                wait_start = time.perf_counter()
+                chunk = chunks.get()
+                wait_time += time.perf_counter() - wait_start
+
+                if chunk is None:
+                    break
+
+                if isinstance(chunk, BaseException):
+                    raise chunk
+
+                for line, self.position in chunk:
+                    yield line
+
+        finally:
+            stop.set()
+            thread.join()
+
+        self.log_overlap(time.perf_counter() - start, read_time, wait_time)
+
+    @staticmethod
+    def log_overlap(total_time: float, read_time: float, wait_time: float):
+        """
+        Log how much of the reading happened while the lines were being written.
+        """
+        write_time = total_time - wait_time
+        overlap = max(read_time + write_time - total_time, 0)
+        overlap_ratio = overlap / min(read_time, write_time) if overlap else 0
+
+        logger.info(
+            "Read for %.1fs and wrote for %.1fs in %.1fs (%.0f%% overlapped)",
+            read_time,
+            write_time,
+            total_time,
+            overlap_ratio * 100,
+            extra={"indentation": 1},
+        )
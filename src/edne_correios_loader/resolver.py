@@ -1,16 +1,24 @@
+import http.client
 import logging
+import re
 import tempfile
 import urllib.error
-import urllib.request
 import zipfile
-from pathlib import Path
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from http import HTTPStatus
+from pathlib import Path, PurePosixPath
 from typing import TYPE_CHECKING
 from urllib.parse import urlparse
 
-from .exc import DneResolverError
-from .table_set import TableSetEnum, get_table_files_glob
+from .cache import DneCache, file_hash, url_cache_key
+from .downloader import DneDownloader
+from .exc import DneNotModifiedError, DneResolverError
+from .table_set import TableSetEnum, get_table_files_globs
 
 if TYPE_CHECKING:
+    from http.client import HTTPMessage
     from zipfile import ZipFile
 
 logger = logging.getLogger(__name__)
@@ -33,13 +41,44 @@ class DneResolver:
         - A local ZIP file: Then the file will be extracted
         - A local folder: Then the folder will be validated and used as the DNE source
 
+    When a cache_dir is provided, downloaded and extracted releases are kept there
+    and reused by the next loads of the same release (see DneCache).
+
+    When the validators (ETag/Last-Modified) of a previous download are provided,
+    URLs are requested conditionally and DneNotModifiedError is raised if the
+    release didn't change.
+
+    Only the files needed to populate the tables of the provided table_set are
+    extracted from ZIP files (all of them by default), restricted to the files of
+    the provided ufs when the data is split by UF.
+
     Returns the path to the resolved DNE folder.
     """
 
-    dne_source: str | None
+    DneDownloader: type[DneDownloader] = DneDownloader
 
-    def __init__(self, dne_source: str | None = None):
+    dne_source: str | None
+    # number of threads extracting the DNE files from a ZIP file
+    extract_workers = 8
+
+    def __init__(
+        self,
+        dne_source: str | None = None,
+        *,
+        cache_dir: str | Path | None = None,
+        cache_max_size: int | None = None,
+        validators: dict | None = None,
+        table_set: TableSetEnum = TableSetEnum.ALL_TABLES,
+        ufs: Iterable[str] | None = None,
+    ):
         self.dne_source = dne_source
+        self.table_set = table_set
+        self.ufs = ufs
+        self.cache = DneCache(cache_dir, cache_max_size) if cache_dir else None
+        self.validators = {k: v for k, v in (validators or {}).items() if v}
+        # filled while resolving the source
+        self.source_validators = {}
+        self.dne_version = None
         self._temp_dir = None
 
     @property
@@ -48,17 +87,29 @@ class DneResolver:
         Lazily create temp dir when necessary
         """
         if self._temp_dir is None:
-            self._temp_dir = tempfile.TemporaryDirectory()
+            # when caching, extract in the cache filesystem, so the extracted
+            # files can be moved into the cache by just renaming them
+            self._temp_dir = tempfile.TemporaryDirectory(
+                dir=self.cache.tmp_dir if self.cache else None
+            )
         return self._temp_dir.name
 
     def __enter__(self):
         try:
             logger.info("Resolving DNE source...", extra={"indentation": 0})
-            return self.resolve_dne_source(self.dne_source)
+
+            if self.cache is not None:
+                dne_path = self.resolve_cached_dne_source(self.dne_source)
+            else:
+                dne_path = self.resolve_dne_source(self.dne_source)
+
+            self.dne_version = extract_dne_version(dne_path)
         except Exception:
             self.cleanup()
             raise
 
+        return dne_path
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         if exc_val and self._temp_dir is not None:
             logger.warning(
@@ -68,13 +119,7 @@ class DneResolver:
         self.cleanup()
 
     def resolve_dne_source(self, dne_source: str | None) -> Path:
-        if dne_source is None:
-            logger.info(
-                "No DNE source provided, the latest DNE will be downloaded from "
-                "Correios website",
-                extra={"indentation": 0},
-            )
-            dne_source = LATEST_DNE_DOWNLOAD_URL
+        dne_source = self.default_dne_source(dne_source)
 
         # if the provided source looks like a URL, download it
         if looks_like_a_url(dne_source):
@@ -123,29 +168,38 @@ class DneResolver:
                     )
                     extracted_zip = archive.extract(dne_basico_filename, temp_dir)
 
-                    # start the resolver again with the extracted ZIP file as source
-                    return self.resolve_dne_source(extracted_zip)
+                    # extract the DNE Basico files from the extracted ZIP file
+                    return self.resolve_file_source(Path(extracted_zip))
 
                 # the ZIP file isn't a ZIP file containing other ZIP files,
                 # so let's check if it's a DNE Basico ZIP file
 
                 valid_dne_files = [
-                    f for f in archive.namelist() if filename_is_a_dne_basico_file(f)
+                    f
+                    for f in archive.infolist()
+                    if filename_is_a_dne_basico_file(f.filename)
                 ]
 
                 if valid_dne_files:
                     temp_dir = Path(self.temp_dir) / "extracted_dne_files"
                     temp_dir.mkdir()
 
+                    files_globs = self.get_needed_files_globs()
+                    needed_files = [
+                        f
+                        for f in valid_dne_files
+                        if filename_matches_globs(f.filename, files_globs)
+                    ]
+
                     logger.debug(
-                        "Source is a DNE Basico ZIP file, extracting %s files to %s",
+                        "Source is a DNE Basico ZIP file, extracting %s of its %s "
+                        "files to %s",
+                        len(needed_files),
                         len(valid_dne_files),
                         temp_dir,
                     )
 
-                    for file in valid_dne_files:
-                        archive.extract(file, temp_dir)
-
+                    self.extract_files(dne_source, needed_files, temp_dir)
                     return temp_dir
 
                 msg = "ZIP file does not contain DNE Basico files"
@@ -155,46 +209,178 @@ class DneResolver:
             msg = f"Source is not a valid ZIP file: {dne_source}"
             raise DneResolverError(msg) from e
 
+    def get_needed_files_globs(self) -> list[str]:
+        """
+        Get the globs of the DNE files used to populate the tables of the table set.
+        Cached releases are shared by loads of any table set, so they have them all.
+        """
+        if self.cache:
+            return [
+                files_glob
+                for table in TableSetEnum.ALL_TABLES.to_populate()
+                for files_glob in get_table_files_globs(table)
+            ]
+
+        return [
+            files_glob
+            for table in self.table_set.to_populate()
+            for files_glob in get_table_files_globs(table, ufs=self.ufs)
+        ]
+
+    def extract_files(
+        self, zip_path: Path, files: list[zipfile.ZipInfo], destination: Path
+    ):
+        """
+        Extract the files from the ZIP file in parallel.
+
+        A ZipFile object can't be shared between threads, so each worker opens its
+        own handle and extracts a group of files, balanced by their sizes.
+        """
+        groups = [[] for _ in range(min(self.extract_workers, len(files)))]
+        for i, file in enumerate(sorted(files, key=lambda f: -f.file_size)):
+            groups[i % len(groups)].append(file.filename)
+
+        # create the directories beforehand, so the workers don't race to do it
+        for file in files:
+            (destination / file.filename).parent.mkdir(parents=True, exist_ok=True)
+
+        def extract_group(filenames: list[str]):
+            with zipfile.ZipFile(zip_path, mode="r") as archive:
+                for filename in filenames:
+                    archive.extract(filename, destination)
+
+        with ThreadPoolExecutor(max_workers=len(groups) or 1) as executor:
+            for future in [executor.submit(extract_group, g) for g in groups]:
+                future.result()
+
+    def resolve_cached_dne_source(self, dne_source: str | None) -> Path:
+        """
+        Resolve the DNE source reusing the releases already in the cache.
+
+        URLs are first looked up by their HTTP validators, skipping the download.
+        Then, downloaded or local ZIP files are looked up by their content hash,
+        skipping the extraction.
+        """
+        dne_source = self.default_dne_source(dne_source)
+        url_key = None
+        downloaded = looks_like_a_url(dne_source)
+
+        if downloaded:
+            headers = self.probe_url(dne_source)
+            url_key = url_cache_key(dne_source, headers) if headers else None
+
+            if cached := self.cache.get_by_validators(url_key):
+                return self.resolve_dir_source(cached)
+
+            zip_path = self.cache.download_path(dne_source)
+            self.download_dne(dne_source, zip_path)
+
+        elif (zip_path := Path(dne_source)).is_file():
+            logger.debug("Hashing %s to look it up in the cache", zip_path)
+
+        else:
+            # directories are used in place, there's nothing to cache
+            return self.resolve_dne_source(dne_source)
+
+        content_hash = file_hash(zip_path)
+
+        if (cached := self.cache.get(content_hash)) is None:
+            extracted = self.resolve_file_source(zip_path)
+            cached = self.cache.store(content_hash, extracted)
+
+        self.cache.save_validators(url_key, content_hash)
+
+        if downloaded:
+            # the extracted files are cached, the download isn't needed anymore
+            zip_path.unlink()
+
+        return self.resolve_dir_source(cached)
+
+    def probe_url(self, url: str) -> "HTTPMessage | None":
+        """
+        Get the URL response headers, raising DneNotModifiedError if its validators
+        match the ones provided.
+        """
+        try:
+            headers = self.DneDownloader(url).probe()
+        except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+            logger.debug("Failed to probe %s: %s", url, e)
+            return None
+
+        self.source_validators = get_validators(headers)
+
+        if self.validators and self.source_validators == self.validators:
+            msg = f"DNE at {url} didn't change since it was last loaded"
+            raise DneNotModifiedError(msg)
+
+        return headers
+
     def resolve_dir_source(self, dne_dir: Path) -> Path:
         # assert all the data files are present
-        for table in TableSetEnum.ALL_TABLES.to_populate():
+        for table in self.table_set.to_populate():
             # check if there are source files for all tables to be created
-            if (file_glob := get_table_files_glob(table)) and not any(
-                dne_dir.glob(file_glob)
-            ):
-                if (delimited_subdir := (dne_dir / DELIMITED_SUBDIR)).is_dir():
-                    return self.resolve_dne_source(str(delimited_subdir))
+            for file_glob in get_table_files_globs(table, ufs=self.ufs):
+                if not any(dne_dir.glob(file_glob)):
+                    if (delimited_subdir := (dne_dir / DELIMITED_SUBDIR)).is_dir():
+                        return self.resolve_dne_source(str(delimited_subdir))
 
-                msg = f"DNE data file not found: {dne_dir / file_glob}"
-                raise DneResolverError(msg)
+                    msg = f"DNE data file not found: {dne_dir / file_glob}"
+                    raise DneResolverError(msg)
 
         return dne_dir
 
-    def download_dne(self, url: str) -> str:
+    def download_dne(self, url: str, download_path: Path | None = None) -> str:
         """
         Download zipped DNE and returns the path to the downloaded file.
         """
-        bs = 1024 * 8
-        download_path = Path(self.temp_dir) / "download.zip"
+        download_path = download_path or Path(self.temp_dir) / "download.zip"
+        downloader = self.DneDownloader(
+            url,
+            report_hook=self.download_report_hook,
+            request_headers=self.conditional_headers(),
+        )
 
         try:
-            with urllib.request.urlopen(url) as response:  # noqa: S310
-                total_size = int(response.headers.get("Content-Length", -1))
-                self.download_report_hook(0, total_size, "start")
+            downloader.download(download_path)
+            self.source_validators = get_validators(downloader.response_headers)
 
-                with download_path.open("wb") as tmp_file:
-                    while block := response.read(bs):
-                        tmp_file.write(block)
-                        self.download_report_hook(len(block), total_size, "progress")
+        except urllib.error.HTTPError as e:
+            if e.code == HTTPStatus.NOT_MODIFIED:
+                msg = f"DNE at {url} didn't change since it was last loaded"
+                raise DneNotModifiedError(msg) from e
 
-                    self.download_report_hook(0, total_size, "finish")
+            msg = f"Failed to download DNE from {url}"
+            raise DneResolverError(msg) from e
 
-        except urllib.error.URLError as e:
+        except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
             msg = f"Failed to download DNE from {url}"
             raise DneResolverError(msg) from e
 
         return str(download_path)
 
+    def conditional_headers(self) -> dict:
+        headers = {}
+
+        if etag := self.validators.get("etag"):
+            headers["If-None-Match"] = etag
+
+        if last_modified := self.validators.get("last_modified"):
+            headers["If-Modified-Since"] = last_modified
+
+        return headers
+
+    @staticmethod
+    def default_dne_source(dne_source: str | None) -> str:
+        if dne_source is None:
+            logger.info(
+                "No DNE source provided, the latest DNE will be downloaded from "
+                "Correios website",
+                extra={"indentation": 0},
+            )
+            return LATEST_DNE_DOWNLOAD_URL
+
+        return dne_source
+
     def download_report_hook(self, read: int, total: int, hook_type: str):
         pass
 
@@ -239,22 +425,45 @@ def filename_is_a_dne_basico_file(filename: str) -> bool:
     )
 
 
-# def extract_dne_version(dne_path: Path) -> int:
-#     """
-#     Extracts the DNE version from the provided path
-#     by reading it from the LEIAME.TXT file
-#     """
-#     leiame_file = dne_path / Path("LEIAME.TXT")
-#
-#     if not leiame_file.is_file():
-#         msg = f"Failed to extract DNE version. File not found: {leiame_file}"
-#         raise DneResolverError(msg)
-#
-#     content = leiame_file.open(encoding="latin1").read()
-#     match = re.compile(r"DNE versão (?P<version>\d{5})").search(content)
-#
-#     if not match:
-#         msg = f"Failed to extract DNE version. Version not found in {leiame_file}"
-#         raise DneResolverError(msg)
-#
-#     return int(match.group("version"))
+def filename_matches_globs(filename: str, files_globs: list[str]) -> bool:
+    """
+    Check if the DNE Basico file matches any of the globs.
+    LEIAME.TXT is always kept, as it contains the DNE version.
+    """
+    name = PurePosixPath(filename).name.upper()
+    return name == "LEIAME.TXT" or any(fnmatchcase(name, g) for g in files_globs)
+
+
+def get_validators(headers) -> dict:
+    """
+    Get the validators identifying the version of an HTTP resource, if any.
+    """
+    validators = {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+    }
+    return {k: v for k, v in validators.items() if v}
+
+
+def extract_dne_version(dne_path: Path) -> int | None:
+    """
+    Extracts the DNE version from the provided path
+    by reading it from the LEIAME.TXT file, which is placed
+    next to the DNE files directory.
+    """
+    for leiame_file in (dne_path / "LEIAME.TXT", dne_path.parent / "LEIAME.TXT"):
+        if leiame_file.is_file():
+            break
+    else:
+        logger.debug("LEIAME.TXT not found, DNE version is unknown")
+        return None
+
+    content = leiame_file.read_text(encoding="latin1")
+    match = re.compile(r"DNE versão (?P<version>\d{5})").search(content)
+
+    if not match:
+        logger.debug("DNE version not found in %s", leiame_file)
+        return None
+
+    logger.debug("DNE version: %s", match.group("version"))
+    return int(match.group("version"))
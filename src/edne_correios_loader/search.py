@@ -0,0 +1,441 @@
+import logging
+import re
+import unicodedata
+from collections.abc import Iterable, Iterator
+
+import sqlalchemy as sa
+from sqlalchemy import MetaData
+
+from .tables import TableNameResolver, build_metadata, format_cep, get_table
+from .tables import metadata as default_metadata
+
+logger = logging.getLogger(__name__)
+
+# abbreviations of street types and titles commonly found in addresses
+ABBREVIATIONS = {
+    "al": "alameda",
+    "av": "avenida",
+    "bc": "beco",
+    "cap": "capitao",
+    "cel": "coronel",
+    "cj": "conjunto",
+    "conj": "conjunto",
+    "dep": "deputado",
+    "des": "desembargador",
+    "dr": "doutor",
+    "dra": "doutora",
+    "eng": "engenheiro",
+    "est": "estrada",
+    "estr": "estrada",
+    "gal": "galeria",
+    "gen": "general",
+    "gov": "governador",
+    "jd": "jardim",
+    "lad": "ladeira",
+    "lg": "largo",
+    "lgo": "largo",
+    "maj": "major",
+    "mal": "marechal",
+    "pc": "praca",
+    "pca": "praca",
+    "pq": "parque",
+    "pres": "presidente",
+    "prof": "professor",
+    "profa": "professora",
+    "qd": "quadra",
+    "r": "rua",
+    "rod": "rodovia",
+    "sen": "senador",
+    "sta": "santa",
+    "sto": "santo",
+    "ten": "tenente",
+    "trav": "travessa",
+    "tv": "travessa",
+    "vd": "viaduto",
+    "vl": "vila",
+}
+
+# tables of other denominations (e.g. popular or previous names) of the streets,
+# bairros and localidades, with their searched columns
+ALIAS_TABLES = {
+    "log_var_log": ("tlo_tx", "vlo_tx"),
+    "log_var_bai": ("vdb_tx",),
+    "log_var_loc": ("val_tx",),
+}
+
+
+def normalize_text(*texts: str | None) -> str:
+    """
+    Normalize texts to be searched: accents are removed, letters are lowercased,
+    punctuation is dropped and abbreviations are expanded. Repeated words are
+    kept once.
+    """
+    words = {}
+
+    for text in texts:
+        if not text:
+            continue
+
+        decomposed = unicodedata.normalize("NFKD", text)
+        folded = "".join(c for c in decomposed if not unicodedata.combining(c))
+
+        for word in re.findall(r"[a-z0-9]+", folded.lower()):
+            words.setdefault(ABBREVIATIONS.get(word, word), None)
+
+    return " ".join(words)
+
+
+def build_search_table(metadata: MetaData = default_metadata) -> sa.Table:
+    """
+    Build the definition of the search table of the unified CEP table, named
+    after it, with the normalized texts of each CEP.
+    """
+    cep_unificado = get_table(metadata, "cep_unificado")
+
+    return sa.Table(
+        f"{cep_unificado.name}_busca",
+        sa.MetaData(),
+        sa.Column("cep", cep_unificado.c.cep.type, primary_key=True),
+        sa.Column("texto", sa.Text, nullable=False),
+        sa.Column("municipio", sa.String(72), nullable=False),
+        sa.Column("uf", sa.String(2), nullable=False),
+    )
+
+
+def create_search_table(conn: sa.Connection, search_table: sa.Table):
+    """
+    Create the search table with the full text index of the database: a FTS5
+    table on SQLite, a GIN index of the text words on PostgreSQL and a FULLTEXT
+    index on MySQL. Other databases search with LIKE.
+    """
+    dialect = conn.dialect.name
+    preparer = conn.dialect.identifier_preparer
+    table = preparer.format_table(search_table)
+    index = preparer.quote(f"{search_table.name}_texto_idx")
+
+    if dialect == "sqlite":
+        conn.execute(
+            sa.text(
+                f"CREATE VIRTUAL TABLE {table} USING fts5("
+                "cep UNINDEXED, texto, municipio UNINDEXED, uf UNINDEXED)"
+            )
+        )
+        return
+
+    search_table.create(conn)
+
+    if dialect == "postgresql":
+        conn.execute(
+            sa.text(
+                f"CREATE INDEX {index} ON {table} "
+                "USING gin (to_tsvector('simple', texto))"
+            )
+        )
+    elif dialect in ("mysql", "mariadb"):
+        conn.execute(sa.text(f"CREATE FULLTEXT INDEX {index} ON {table} (texto)"))
+
+
+def select_search_texts(
+    metadata: MetaData = default_metadata,
+    *,
+    with_logradouros: bool = False,
+    alias_tables: Iterable[str] = (),
+) -> "sa.Select":
+    """
+    Select the texts of each CEP to be searched, sorted by CEP. With
+    `with_logradouros`, the street type and the abbreviated street name in
+    `log_logradouro` are searched too.
+
+    `alias_tables` are the tables of other denominations (see ALIAS_TABLES) whose
+    names are searched too, so CEPs are also found by old or popular names. The
+    official names of the bairros and localidades are then searched too, so they
+    aren't outmatched by their other denominations.
+    """
+    cep_unificado = get_table(metadata, "cep_unificado")
+    texts = [
+        cep_unificado.c.logradouro,
+        cep_unificado.c.complemento,
+        cep_unificado.c.nome,
+    ]
+
+    rows = sa.select(
+        cep_unificado.c.cep,
+        cep_unificado.c.municipio,
+        cep_unificado.c.uf,
+    )
+
+    if with_logradouros:
+        log_logradouro = get_table(metadata, "log_logradouro")
+        texts += [log_logradouro.c.tlo_tx, log_logradouro.c.log_no_abrev]
+        rows = rows.outerjoin(
+            log_logradouro, onclause=log_logradouro.c.cep == cep_unificado.c.cep
+        )
+
+    if "log_var_bai" in alias_tables:
+        texts.append(cep_unificado.c.bairro)
+
+    rows = rows.add_columns(*texts)
+    alias_rows = [
+        select_alias_texts(metadata, table_name, len(texts))
+        for table_name in alias_tables
+    ]
+
+    if not alias_rows:
+        return rows.order_by(cep_unificado.c.cep)
+
+    rows = sa.union_all(rows, *alias_rows).subquery()
+    return sa.select(rows).order_by(rows.c.cep)
+
+
+def select_alias_texts(
+    metadata: MetaData, table_name: str, texts_count: int
+) -> "sa.Select":
+    """
+    Select the CEPs of the other denominations in a table of ALIAS_TABLES, with the
+    same columns as select_search_texts: the names of streets (`log_var_log`) and
+    bairros (`log_var_bai`) belong to the CEPs of the streets, and the names of
+    localidades (`log_var_loc`) to all the CEPs of their municipio, or to their own
+    CEP (e.g. for districts), along with their official name.
+    """
+    cep_unificado = get_table(metadata, "cep_unificado")
+    aliases = get_table(metadata, table_name)
+    texts = [aliases.c[c] for c in ALIAS_TABLES[table_name]]
+
+    if table_name == "log_var_loc":
+        ceps = get_table(metadata, "log_localidade")
+        onclause = ceps.c.loc_nu == aliases.c.loc_nu
+        ceps_onclause = sa.or_(
+            cep_unificado.c.municipio_cod_ibge == ceps.c.mun_nu,
+            cep_unificado.c.cep == ceps.c.cep,
+        )
+        texts.append(ceps.c.loc_no)
+    else:
+        ceps = get_table(metadata, "log_logradouro")
+        if table_name == "log_var_log":
+            onclause = ceps.c.log_nu == aliases.c.log_nu
+        else:
+            onclause = ceps.c.bai_nu_ini == aliases.c.bai_nu
+        ceps_onclause = cep_unificado.c.cep == ceps.c.cep
+
+    texts += [sa.null()] * (texts_count - len(texts))
+
+    return sa.select(
+        cep_unificado.c.cep,
+        cep_unificado.c.municipio,
+        cep_unificado.c.uf,
+        *texts,
+    ).select_from(
+        aliases.join(ceps, onclause=onclause).join(
+            cep_unificado, onclause=ceps_onclause
+        )
+    )
+
+
+def build_search_rows(rows: Iterable[sa.Row]) -> Iterator[dict]:
+    """
+    Normalize the texts of each CEP, merging the texts of CEPs with many rows.
+    The rows must be sorted by CEP.
+    """
+    current = None
+    texts = []
+
+    for cep, municipio, uf, *row_texts in rows:
+        if current is not None and current["cep"] != cep:
+            yield {**current, "texto": normalize_text(*texts)}
+            texts = []
+
+        current = {"cep": cep, "municipio": normalize_text(municipio), "uf": uf}
+        texts += row_texts
+
+    if current is not None:
+        yield {**current, "texto": normalize_text(*texts)}
+
+
+def populate_search_table(
+    conn: sa.Connection,
+    metadata: MetaData = default_metadata,
+    insert_batch_size: int = 1000,
+):
+    """
+    Rebuild the search table from the unified CEP table.
+    """
+    search_table = build_search_table(metadata)
+
+    search_table.drop(conn, checkfirst=True)
+    create_search_table(conn, search_table)
+
+    rows = select_search_texts(
+        metadata,
+        with_logradouros=has_logradouro_texts(conn, metadata),
+        alias_tables=get_alias_tables(conn, metadata),
+    )
+    inserted = 0
+    batch = []
+
+    for row in build_search_rows(conn.execute(rows)):
+        batch.append(row)
+
+        if len(batch) == insert_batch_size:
+            conn.execute(search_table.insert(), batch)
+            inserted += len(batch)
+            batch = []
+
+    if batch:
+        conn.execute(search_table.insert(), batch)
+        inserted += len(batch)
+
+    logger.info(
+        "Inserted %s CEPs into table %s",
+        inserted,
+        search_table.name,
+        extra={"indentation": 1},
+    )
+
+
+def has_logradouro_texts(conn: sa.Connection, metadata: MetaData) -> bool:
+    """
+    Tell if `log_logradouro` is in the database (it's dropped at the end of
+    unified-cep-only loads) with the searched columns (not kept by projected
+    loads).
+    """
+    log_logradouro = get_table(metadata, "log_logradouro")
+
+    return {"tlo_tx", "log_no_abrev"} <= set(log_logradouro.c.keys()) and sa.inspect(
+        conn
+    ).has_table(log_logradouro.name)
+
+
+def get_alias_tables(conn: sa.Connection, metadata: MetaData) -> list[str]:
+    """
+    Get the tables of other denominations in the database (they're only kept by
+    the "all" table set) which can be searched, along with the tables joining them
+    to the CEPs.
+    """
+    inspector = sa.inspect(conn)
+    alias_tables = []
+
+    for original_name, columns in ALIAS_TABLES.items():
+        aliases = get_table(metadata, original_name)
+
+        if original_name == "log_var_loc":
+            ceps = get_table(metadata, "log_localidade")
+            ceps_columns = {"cep", "mun_nu", "loc_no"}
+        else:
+            ceps = get_table(metadata, "log_logradouro")
+            ceps_columns = {"cep"}
+
+        if (
+            set(columns) <= set(aliases.c.keys())
+            and ceps_columns <= set(ceps.c.keys())
+            and inspector.has_table(aliases.name)
+            and inspector.has_table(ceps.name)
+        ):
+            alias_tables.append(original_name)
+
+    return alias_tables
+
+
+class CepSearcher:
+    """
+    Find CEPs by street name, accents and abbreviations aside, using the full
+    text index of the search table (see populate_search_table), built by loads
+    with the `search_index` option.
+    """
+
+    def __init__(
+        self,
+        database_url: str,
+        table_names: TableNameResolver | None = None,
+        *,
+        cep_as_integer: bool = False,
+    ):
+        """
+        cep_as_integer must match the option used to load the unified CEP table.
+        """
+        self.engine = sa.create_engine(database_url, echo=False)
+        self.metadata = build_metadata(table_names, cep_as_integer=cep_as_integer)
+        self.cep_table = get_table(self.metadata, "cep_unificado")
+        self.search_table = build_search_table(self.metadata)
+
+    def build_index(self):
+        """
+        Rebuild the search table from the unified CEP table.
+        """
+        with self.engine.begin() as conn:
+            populate_search_table(conn, self.metadata)
+
+    def search(
+        self,
+        street: str,
+        municipio: str | None = None,
+        uf: str | None = None,
+        limit: int = 10,
+    ) -> list[dict]:
+        """
+        Search the CEPs whose street (or name, for big users and the like) has
+        all the words of the given one, words being matched by their start. The
+        best matches come first.
+        """
+        words = normalize_text(street).split()
+
+        if not words:
+            return []
+
+        search_table = self.search_table
+        match, rank = self.match_words(words)
+        rows = (
+            sa.select(self.cep_table)
+            .join(search_table, onclause=search_table.c.cep == self.cep_table.c.cep)
+            .where(match)
+            .order_by(rank, self.cep_table.c.cep)
+            .limit(limit)
+        )
+
+        if municipio:
+            rows = rows.where(search_table.c.municipio == normalize_text(municipio))
+
+        if uf:
+            rows = rows.where(search_table.c.uf == uf.strip().upper())
+
+        with self.engine.connect() as conn:
+            return [
+                {**row._asdict(), "cep": format_cep(row.cep)}
+                for row in conn.execute(rows)
+            ]
+
+    def match_words(self, words: list[str]) -> tuple:
+        """
+        Build the condition matching the search table rows with all the words,
+        and the order of the best matches, for the database full text index.
+        """
+        dialect = self.engine.dialect.name
+        texto = self.search_table.c.texto
+
+        if dialect == "sqlite":
+            table = self.engine.dialect.identifier_preparer.format_table(
+                self.search_table
+            )
+            query = " ".join(f'"{word}"*' for word in words)
+            return (
+                sa.text(f"{table} MATCH :query").bindparams(query=query),
+                sa.text(f"{table}.rank"),
+            )
+
+        if dialect == "postgresql":
+            document = sa.func.to_tsvector(sa.literal_column("'simple'"), texto)
+            query = sa.func.to_tsquery(
+                sa.literal_column("'simple'"),
+                " & ".join(f"{word}:*" for word in words),
+            )
+            return document.op("@@")(query), sa.func.ts_rank(document, query).desc()
+
+        if dialect in ("mysql", "mariadb"):
+            score = sa.text(
+                "MATCH (texto) AGAINST (:query IN BOOLEAN MODE)"
+            ).bindparams(query=" ".join(f"+{word}*" for word in words))
+            return score, sa.desc(score)
+
+        return (
+            sa.and_(*(texto.contains(word) for word in words)),
+            sa.func.length(texto),
+        )
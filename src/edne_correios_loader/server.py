@@ -0,0 +1,224 @@
+import asyncio
+import contextlib
+import json
+import logging
+import signal
+from collections import OrderedDict
+from pathlib import Path
+
+from .cep_querier import CepQuerier
+from .state import get_loaded_at
+
+logger = logging.getLogger(__name__)
+
+# longest request line accepted, in bytes
+MAX_REQUEST_SIZE = 1024
+
+
+class CepServer:
+    """
+    Answer CEP lookups from many clients over a local socket, keeping a CepQuerier
+    (and its database connections) warm, along with the addresses of the latest
+    CEPs looked up.
+
+    Requests and responses are JSON lines: each request line is a CEP, either
+    bare (e.g. `01001000`) or as a JSON object (`{"cep": "01001-000"}`), and is
+    answered by a line with the address of the CEP, as returned by
+    CepQuerier.query, or an object with an `error` message (e.g. when the
+    database can't be queried).
+
+    Cached addresses are dropped when the unified CEP table is loaded again, which
+    is checked every `refresh_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        querier: CepQuerier,
+        *,
+        cache_size: int = 100_000,
+        refresh_interval: float = 60,
+    ):
+        if cache_size < 0:
+            msg = f"The cache size can't be negative, got {cache_size}"
+            raise ValueError(msg)
+
+        self.querier = querier
+        self.cache_size = cache_size
+        self.refresh_interval = refresh_interval
+        # accessed only by the event loop, so it needs no lock
+        self.cache: OrderedDict[str, dict | None] = OrderedDict()
+        self.loaded_at = None
+
+    async def lookup(self, cep: str) -> dict | None:
+        """
+        Get the address of a CEP from the cache, or from the database in a worker
+        thread, so other clients are answered meanwhile.
+        """
+        cep = cep.replace("-", "").strip()
+
+        if cep in self.cache:
+            self.cache.move_to_end(cep)
+            return self.cache[cep]
+
+        loaded_at = self.loaded_at
+        address = await asyncio.to_thread(self.querier.query, cep)
+
+        # if the cache was cleared meanwhile, the address may be of the previous load
+        if self.cache_size and loaded_at == self.loaded_at:
+            self.cache[cep] = address
+
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        return address
+
+    async def answer(self, line: bytes) -> dict:
+        """
+        Answer a request line.
+        """
+        try:
+            request = line.decode().strip()
+
+            if request.startswith("{"):
+                request = json.loads(request)["cep"]
+        except (UnicodeDecodeError, ValueError, KeyError, TypeError):
+            return {"error": "Invalid request"}
+
+        if not isinstance(request, str):
+            return {"error": "Invalid request"}
+
+        try:
+            address = await self.lookup(request)
+        except Exception:
+            logger.exception(
+                "Failed to look up CEP %s", request, extra={"indentation": 0}
+            )
+            return {"cep": request, "error": "Lookup failed"}
+
+        if address is None:
+            return {"cep": request, "error": "CEP not found"}
+
+        return address
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        """
+        Answer the requests of a client, in order, until it closes the connection.
+        """
+        try:
+            while line := await reader.readline():
+                if not line.strip():
+                    continue
+
+                response = await self.answer(line)
+                writer.write(json.dumps(response, ensure_ascii=False).encode() + b"\n")
+                await writer.drain()
+        except ValueError:
+            # the request line is longer than the stream limit
+            writer.write(b'{"error": "Request too long"}\n')
+        except ConnectionError:
+            pass
+        except Exception:
+            logger.exception("Failed to answer a client", extra={"indentation": 0})
+        finally:
+            writer.close()
+
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def refresh(self) -> bool:
+        """
+        Drop the cached addresses if the unified CEP table was loaded since they
+        were cached. Returns False if they're up to date.
+        """
+
+        def query_loaded_at():
+            with self.querier.engine.connect() as conn:
+                return get_loaded_at(conn, self.querier.cep_table.name)
+
+        loaded_at = await asyncio.to_thread(query_loaded_at)
+
+        if loaded_at == self.loaded_at:
+            return False
+
+        self.cache.clear()
+        self.loaded_at = loaded_at
+
+        logger.info(
+            "Unified CEP table loaded at %s, cache cleared",
+            loaded_at,
+            extra={"indentation": 0},
+        )
+
+        return True
+
+    async def refresh_periodically(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(
+                    "Could not check the last load: %s", e, extra={"indentation": 0}
+                )
+
+    async def start(
+        self,
+        *,
+        socket_path: str | Path | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> asyncio.Server:
+        """
+        Start listening on a Unix socket or, without `socket_path`, on a TCP port
+        (a random free one with port 0), after connecting to the database.
+        """
+        await self.refresh()
+
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(
+                self.handle_client, path=socket_path, limit=MAX_REQUEST_SIZE
+            )
+        else:
+            server = await asyncio.start_server(
+                self.handle_client, host, port, limit=MAX_REQUEST_SIZE
+            )
+
+        for sock in server.sockets:
+            logger.info(
+                "Answering CEP lookups on %s",
+                sock.getsockname(),
+                extra={"indentation": 0},
+            )
+
+        return server
+
+    async def serve_forever(
+        self,
+        *,
+        socket_path: str | Path | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """
+        Answer CEP lookups until cancelled, e.g. by SIGTERM. See `start`.
+        """
+        server = await self.start(socket_path=socket_path, host=host, port=port)
+        refresher = asyncio.create_task(self.refresh_periodically())
+
+        # not supported on Windows, where the process is just terminated
+        with contextlib.suppress(NotImplementedError):
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGTERM, asyncio.current_task().cancel
+            )
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            refresher.cancel()
+
+            if socket_path is not None:
+                Path(socket_path).unlink(missing_ok=True)
@@ -0,0 +1,62 @@
+import sqlalchemy as sa
+
+"""
+Tables used by the loader to keep track of its own state in the database.
+
+They are kept apart from the DNE tables metadata as they are not part of the DNE
+and must not be affected by the table sets.
+"""
+state_metadata = sa.MetaData()
+
+"""
+Progress of a resumable load: which tables were already fully populated and, for the
+table being populated, the last file and line committed to the database. Loads
+restricted to some UFs record them, along with the DNE release loaded, so their
+progress isn't mixed with other loads.
+"""
+checkpoint_table = sa.Table(
+    "dne_load_checkpoint",
+    state_metadata,
+    sa.Column("table_name", sa.String(64), primary_key=True),
+    sa.Column("table_set", sa.String(20), nullable=False),
+    sa.Column("ufs", sa.String(84)),
+    sa.Column("dne_version", sa.Integer),
+    sa.Column("file_name", sa.String(64)),
+    sa.Column("line", sa.Integer, nullable=False, default=0),
+    sa.Column("completed", sa.Boolean, nullable=False, default=False),
+)
+
+"""
+Information about the last complete load of each unified CEP table, used to detect
+when the DNE source hasn't changed since then. The options changing the schema of
+the tables are recorded too, as loading them again is needed when they change.
+"""
+load_info_table = sa.Table(
+    "dne_load_info",
+    state_metadata,
+    sa.Column("cep_table", sa.String(64), primary_key=True),
+    sa.Column("table_set", sa.String(20), nullable=False),
+    sa.Column("ufs", sa.String(84)),
+    sa.Column("dne_version", sa.Integer),
+    sa.Column("etag", sa.String(255)),
+    sa.Column("last_modified", sa.String(64)),
+    sa.Column("cep_as_integer", sa.Boolean, nullable=False, default=False),
+    sa.Column("partition_unified_table", sa.Boolean, nullable=False, default=False),
+    sa.Column("materialized_view", sa.Boolean, nullable=False, default=False),
+    sa.Column("loaded_at", sa.DateTime(timezone=True), nullable=False),
+)
+
+
+def get_loaded_at(conn: sa.Connection, cep_table_name: str):
+    """
+    Get when the unified CEP table was last loaded, or None if it's unknown (e.g.
+    the table was loaded by an older version).
+    """
+    if not sa.inspect(conn).has_table(load_info_table.name):
+        return None
+
+    return conn.execute(
+        sa.select(load_info_table.c.loaded_at).where(
+            load_info_table.c.cep_table == cep_table_name
+        )
+    ).scalar()
@@ -1,4 +1,5 @@
 import enum
+from collections.abc import Iterable
 
 from sqlalchemy import MetaData
 
@@ -62,3 +63,24 @@ def get_table_files_glob(
 
     original_name = table.info.get("original_name", table.name)
     return table.info.get("file_glob", f"{original_name.upper()}.TXT")
+
+
+def get_table_files_globs(
+    table_name: str,
+    metadata: MetaData = default_metadata,
+    ufs: Iterable[str] | None = None,
+) -> list[str]:
+    """
+    Get the file globs for a table, restricted to the files of the given UFs
+    when the table data is split in one file per UF.
+    """
+    files_glob = get_table_files_glob(table_name, metadata)
+
+    if files_glob is None:
+        return []
+
+    uf_file_glob = metadata.tables[table_name].info.get("uf_file_glob")
+    if ufs is None or uf_file_glob is None:
+        return [files_glob]
+
+    return [uf_file_glob.format(uf=uf) for uf in ufs]
@@ -5,10 +5,13 @@ from sqlalchemy import (
     Column,
     Enum,
     ForeignKey,
+    Index,
     Integer,
     MetaData,
     String,
     Table,
+    event,
+    text,
 )
 
 """
@@ -108,19 +111,40 @@ class SeccionamentoLadoEnum(enum.Enum):
     ESQUERDO = "E"
 
 
-def build_metadata(table_names: TableNameResolver | None = None) -> MetaData:
+def build_metadata(
+    table_names: TableNameResolver | None = None,
+    *,
+    cep_as_integer: bool = False,
+    partition_unified_table: bool = False,
+) -> MetaData:
     """
     Build a SQLAlchemy MetaData with all DNE table definitions.
 
     Optionally accepts a TableNameResolver to customize table names.
     When not provided, tables use their default names.
+
+    When cep_as_integer is True, the CEP columns are stored as integers instead of
+    8 chars strings, making their indexes smaller and comparisons faster. Their
+    leading zeros are lost, use format_cep to restore them.
+
+    When partition_unified_table is True, the unified CEP table is created on
+    PostgreSQL as a table partitioned by the CEP first digit (see
+    create_cep_partitions). Other databases create a regular table.
     """
     n = make_table_name_fn(table_names)
-    metadata = MetaData()
+    metadata = MetaData(
+        info={
+            "cep_as_integer": cep_as_integer,
+            "partition_unified_table": partition_unified_table,
+        }
+    )
 
     def info(original_name, **extra):
         return {"original_name": original_name, **extra}
 
+    def cep_type():
+        return Integer() if cep_as_integer else String(8)
+
     """
     Faixa de CEP de UF
     """
@@ -136,12 +160,12 @@ def build_metadata(table_names: TableNameResolver | None = None) -> MetaData:
         ),
         Column(
             "ufe_cep_ini",
-            String(8),
+            cep_type(),
             primary_key=True,
             comment="CEP inicial da UF",
             nullable=False,
         ),
-        Column("ufe_cep_fim", String(8), comment="CEP final da UF", nullable=False),
+        Column("ufe_cep_fim", cep_type(), comment="CEP final da UF", nullable=False),
         info=info("log_faixa_uf"),
     )
 
@@ -175,7 +199,7 @@ def build_metadata(table_names: TableNameResolver | None = None) -> MetaData:
             nullable=False,
         ),
         Column("loc_no", String(72), comment="Nome da localidade", nullable=False),
-        Column("cep", String(8), index=True, comment="CEP da localidade"),
+        Column("cep", cep_type(), index=True, comment="CEP da localidade"),
         Column(
             "loc_in_sit",
             Enum(
@@ -245,11 +269,12 @@ def build_metadata(table_names: TableNameResolver | None = None) -> MetaData:
         ),
         Column(
             "loc_cep_ini",
-            String(8),
+            cep_type(),
             primary_key=True,
+            index=True,
             comment="CEP inicial da localidade",
         ),
-        Column("loc_cep_fim", String(8), comment="CEP final da localidade"),
+        Column("loc_cep_fim", cep_type(), comment="CEP final da localidade"),
         Column(
             "loc_tipo_faixa",
             Enum(
@@ -322,13 +347,14 @@ def build_metadata(table_names: TableNameResolver | None = None) -> MetaData:
         ),
         Column(
             "fcb_cep_ini",
-            String(8),
+            cep_type(),
             primary_key=True,
+            index=True,
             comment="CEP inicial do bairro",
         ),
         Column(
             "fcb_cep_fim",
-            String(8),
+            cep_type(),
             comment="CEP final do bairro",
             nullable=False,
         ),
@@ -364,7 +390,7 @@ def build_metadata(table_names: TableNameResolver | None = None) -> MetaData:
         ),
         Column(
             "cep",
-            String(8),
+            cep_type(),
             index=True,
             comment="CEP da CPC",
             nullable=False,
@@ -442,7 +468,7 @@ def build_metadata(table_names: TableNameResolver | None = None) -> MetaData:
         Column("log_complemento", String(100), comment="Complemento"),
         Column(
             "cep",
-            String(8),
+            cep_type(),
             index=True,
             comment="CEP do logradouro",
             nullable=False,
@@ -464,7 +490,11 @@ def build_metadata(table_names: TableNameResolver | None = None) -> MetaData:
             String(36),
             comment="Abreviatura do nome do logradouro",
         ),
-        info=info("log_logradouro", file_glob="LOG_LOGRADOURO_*.TXT"),
+        info=info(
+            "log_logradouro",
+            file_glob="LOG_LOGRADOURO_*.TXT",
+            uf_file_glob="LOG_LOGRADOURO_{uf}.TXT",
+        ),
     )
 
     """
@@ -578,7 +608,7 @@ def build_metadata(table_names: TableNameResolver | None = None) -> MetaData:
         ),
         Column(
             "cep",
-            String(8),
+            cep_type(),
             index=True,
             comment="CEP do grande usuário",
             nullable=False,
@@ -638,7 +668,7 @@ def build_metadata(table_names: TableNameResolver | None = None) -> MetaData:
         ),
         Column(
             "cep",
-            String(8),
+            cep_type(),
             index=True,
             comment="CEP da unidade operacional",
             nullable=False,
@@ -713,10 +743,10 @@ def build_metadata(table_names: TableNameResolver | None = None) -> MetaData:
     """
     Tabela unificada de CEP
     """
-    Table(
+    cep_unificado = Table(
         n("cep_unificado"),
         metadata,
-        Column("cep", String(8), primary_key=True),
+        Column("cep", cep_type(), primary_key=True),
         Column("logradouro", String(100)),
         Column("complemento", String(100)),
         Column("bairro", String(72)),
@@ -724,9 +754,18 @@ def build_metadata(table_names: TableNameResolver | None = None) -> MetaData:
         Column("municipio_cod_ibge", Integer, nullable=False),
         Column("uf", String(2), nullable=False),
         Column("nome", String(100)),
+        # listings of the CEPs of an UF, municipio or bairro, sorted by CEP
+        Index(f"ix_{n('cep_unificado')}_uf_cep", "uf", "cep"),
+        Index(f"ix_{n('cep_unificado')}_municipio_cep", "municipio_cod_ibge", "cep"),
+        Index(f"ix_{n('cep_unificado')}_bairro_cep", "bairro", "cep"),
         info=info("cep_unificado", unified_table=True),
+        # the primary key must include the partition key, so it's the CEP
+        postgresql_partition_by="RANGE (cep)" if partition_unified_table else None,
     )
 
+    if partition_unified_table:
+        event.listen(cep_unificado, "after_create", create_cep_partitions)
+
     metadata.info["original_name_map"] = {
         t.info["original_name"]: t.name for t in metadata.sorted_tables
     }
@@ -734,6 +773,69 @@ def build_metadata(table_names: TableNameResolver | None = None) -> MetaData:
     return metadata
 
 
+def create_cep_partitions(table: Table, connection, **_kw):
+    """
+    Create a partition of the table for each CEP first digit, which matches the
+    CEP postal regions (e.g. 0 and 1 for São Paulo). Lookups by CEP only scan its
+    partition, and each partition has its own, smaller, primary key index.
+    """
+    if connection.dialect.name != "postgresql":
+        return
+
+    preparer = connection.dialect.identifier_preparer
+    is_integer = isinstance(table.c.cep.type, Integer)
+
+    def bound(digit: int) -> str:
+        if digit == 0:
+            return "MINVALUE"
+
+        if digit == 10:  # noqa: PLR2004
+            return "MAXVALUE"
+
+        return str(digit * 10_000_000) if is_integer else f"'{digit}'"
+
+    for digit in range(10):
+        partition = preparer.quote(f"{table.name}_{digit}")
+        connection.execute(
+            text(
+                f"CREATE TABLE {partition} PARTITION OF {preparer.format_table(table)} "
+                f"FOR VALUES FROM ({bound(digit)}) TO ({bound(digit + 1)})"
+            )
+        )
+
+
+def format_cep(cep: int | str | None) -> str | None:
+    """
+    Restore the leading zeros of a CEP stored as integer.
+    """
+    if isinstance(cep, int):
+        return f"{cep:08d}"
+
+    return cep
+
+
+CEP_MAX = 99_999_999
+
+
+def parse_cep(cep: str | int | None) -> int | None:
+    """
+    Convert a CEP (e.g. "01001-000", "01001000" or 1001000) to an integer.
+    Returns None if it isn't a valid CEP.
+    """
+    if isinstance(cep, str):
+        cep = cep.replace("-", "").strip()
+
+        if len(cep) != 8 or not cep.isdigit():  # noqa: PLR2004
+            return None
+
+        return int(cep)
+
+    if isinstance(cep, int) and 0 <= cep <= CEP_MAX:
+        return cep
+
+    return None
+
+
 def get_table(metadata: MetaData, original_name: str):
     """
     Look up a table by its original (default) name, even if it was renamed.
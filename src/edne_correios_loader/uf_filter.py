@@ -0,0 +1,152 @@
+from collections.abc import Callable, Iterable
+
+import sqlalchemy as sa
+
+UFS = (
+    "AC",
+    "AL",
+    "AM",
+    "AP",
+    "BA",
+    "CE",
+    "DF",
+    "ES",
+    "GO",
+    "MA",
+    "MG",
+    "MS",
+    "MT",
+    "PA",
+    "PB",
+    "PE",
+    "PI",
+    "PR",
+    "RJ",
+    "RN",
+    "RO",
+    "RR",
+    "RS",
+    "SC",
+    "SE",
+    "SP",
+    "TO",
+)
+
+
+def parse_ufs(ufs: Iterable[str]) -> tuple[str, ...]:
+    """
+    Normalize a list of UFs, raising ValueError for unknown ones.
+    """
+    parsed = {uf.strip().upper() for uf in ufs if uf.strip()}
+
+    if unknown := parsed.difference(UFS):
+        msg = f"Unknown UF: {', '.join(sorted(unknown))}. Valid UFs: {', '.join(UFS)}"
+        raise ValueError(msg)
+
+    if not parsed:
+        msg = "At least one UF must be provided"
+        raise ValueError(msg)
+
+    return tuple(sorted(parsed))
+
+
+def format_ufs(ufs: Iterable[str] | None) -> str | None:
+    """
+    Format the UFs of a load to be stored along with its state.
+    """
+    return ",".join(ufs) if ufs else None
+
+
+class UfFilter:
+    """
+    Keeps only the DNE rows belonging to a set of UFs.
+
+    Rows with a `ufe_sg` field are kept when it's one of the UFs. The keys of the
+    kept rows are collected while filtering, so the rows referencing them (e.g.
+    `log_var_loc` referencing `log_localidade`) are kept only when the referenced
+    row was kept. For that, the tables must be filtered in dependency order.
+
+    Fields are checked as read from the DNE files, before any row conversion.
+    """
+
+    def __init__(self, ufs: Iterable[str]):
+        self.ufs = frozenset(ufs)
+        # values of the referenced columns of the kept rows, by (table, column)
+        self.kept_keys: dict[tuple[str, str], set] = {}
+
+    def build_row_filter(self, table: sa.Table) -> Callable[[list], bool] | None:
+        """
+        Build a function telling if a DNE file line of the table must be kept.
+        Returns None if the table rows aren't related to any UF (e.g. `ect_pais`).
+        """
+        columns = list(table.columns.keys())
+        uf_index = columns.index("ufe_sg") if "ufe_sg" in columns else None
+
+        # self references are skipped, as the referenced rows may come later
+        references = [
+            (columns.index(fk.parent.name), key_converter(fk.parent), kept_keys)
+            for fk in table.foreign_keys
+            if fk.column.table is not table
+            and (kept_keys := self.kept_keys.get(get_key(fk.column))) is not None
+        ]
+
+        if uf_index is None and not references:
+            return None
+
+        # columns referenced by other tables, which may be filtered next
+        referenced_columns = {
+            fk.column
+            for other_table in table.metadata.tables.values()
+            if other_table is not table
+            for fk in other_table.foreign_keys
+            if fk.column.table is table
+        }
+        keys = [
+            (
+                columns.index(column.name),
+                key_converter(column),
+                self.kept_keys.setdefault(get_key(column), set()),
+            )
+            for column in referenced_columns
+        ]
+
+        def keep(fields: list) -> bool:
+            if uf_index is not None and (
+                uf_index >= len(fields) or fields[uf_index] not in self.ufs
+            ):
+                return False
+
+            for i, convert, kept in references:
+                value = fields[i] if i < len(fields) else None
+                if value is not None and convert(value) not in kept:
+                    return False
+
+            for i, convert, kept in keys:
+                if i < len(fields) and fields[i] is not None:
+                    kept.add(convert(fields[i]))
+
+            return True
+
+        return keep
+
+    def get_kept_columns(self, table_name: str) -> list[str]:
+        """
+        Get the columns of the table whose kept values are collected.
+        """
+        return [column for table, column in self.kept_keys if table == table_name]
+
+    def add_kept_keys(self, table_name: str, column_name: str, keys: Iterable):
+        """
+        Register values kept by a previous load (e.g. of tables already populated
+        when resuming), so the rows referencing them are kept.
+        """
+        self.kept_keys.setdefault((table_name, column_name), set()).update(keys)
+
+
+def get_key(column: sa.Column) -> tuple[str, str]:
+    return column.table.name, column.name
+
+
+def key_converter(column: sa.Column) -> Callable[[str], object]:
+    # the keys are compared as stored in the database
+    return int if isinstance(column.type, sa.Integer) else str
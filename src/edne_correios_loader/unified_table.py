@@ -3,6 +3,7 @@ from collections.abc import Iterable, Iterator
 
 import sqlalchemy as sa
 from sqlalchemy import MetaData
+from sqlalchemy.sql import visitors
 
 from .tables import get_table
 from .tables import metadata as default_metadata
@@ -216,6 +217,126 @@ def select_unidades_operacionais_ceps(metadata) -> "sa.Select":
     )
 
 
+def split_logradouro(logradouro) -> tuple:
+    """
+    SQL version of normalize_logradouro (PostgreSQL only): split the logradouro in
+    logradouro and complemento at its first comma.
+    """
+    comma = sa.func.strpos(logradouro, ",")
+
+    return (
+        sa.func.trim(sa.func.split_part(logradouro, ",", 1)),
+        sa.case((comma > 0, sa.func.trim(sa.func.substr(logradouro, comma + 1)))),
+    )
+
+
+def select_unified_ceps(metadata) -> "sa.CompoundSelect":
+    """
+    Query all the unified CEP table rows at once, normalizing them in SQL, so it can
+    define a PostgreSQL materialized view.
+    """
+    cep_unificado = get_table(metadata, "cep_unificado")
+
+    select_stmts = [
+        (select_logradouros_ceps(metadata), False),
+        (select_localidades_ceps(metadata), False),
+        (select_localidades_subordinadas_ceps(metadata), False),
+        (select_cpc_ceps(metadata), True),
+        (select_grandes_usuarios_ceps(metadata), True),
+        (select_unidades_operacionais_ceps(metadata), True),
+    ]
+    unified_selects = []
+
+    for select_stmt, normalize in select_stmts:
+        rows = select_stmt.subquery()
+        columns = dict(rows.c.items())
+
+        if normalize:
+            columns["logradouro"], columns["complemento"] = split_logradouro(
+                rows.c.logradouro
+            )
+
+        # all the selects must have the unified table columns, in the same order
+        unified_selects.append(
+            sa.select(
+                *(
+                    sa.cast(columns.get(c.name, sa.null()), c.type).label(c.name)
+                    for c in cep_unificado.columns
+                )
+            )
+        )
+
+    return sa.union_all(*unified_selects)
+
+
+def get_unified_table_columns(metadata) -> dict[str, set[str]]:
+    """
+    Get the columns of each table used to populate the unified CEP table,
+    including the ones used to join and filter the rows.
+    """
+    select_stmts = [
+        select_logradouros_ceps(metadata),
+        select_localidades_ceps(metadata),
+        select_localidades_subordinadas_ceps(metadata),
+        select_cpc_ceps(metadata),
+        select_grandes_usuarios_ceps(metadata),
+        select_unidades_operacionais_ceps(metadata),
+    ]
+    columns = {}
+
+    for select_stmt in select_stmts:
+        # the joins built by Select.join() are only reachable from the final froms
+        for element in (select_stmt, *select_stmt.get_final_froms()):
+            for column in visitors.iterate(element):
+                if not isinstance(column, sa.Column):
+                    continue
+
+                # columns of aliases are proxies to the table columns
+                for base_column in column.base_columns:
+                    columns.setdefault(base_column.table.name, set()).add(
+                        base_column.name
+                    )
+
+    return columns
+
+
+def project_metadata(metadata: MetaData = default_metadata) -> MetaData:
+    """
+    Build a copy of the metadata where the tables used to populate the unified CEP
+    table only have the columns it needs, besides their primary keys.
+
+    Only suited for loads dropping these tables after populating the unified one.
+    """
+    used_columns = get_unified_table_columns(metadata)
+    projected_metadata = MetaData(info=dict(metadata.info))
+
+    for table in metadata.sorted_tables:
+        if table.info.get("unified_table"):
+            # kept as it is, along with its dialect options and DDL events
+            unified_table = table.to_metadata(projected_metadata)
+            for listener in table.dispatch.after_create:
+                sa.event.listen(unified_table, "after_create", listener)
+            continue
+
+        keep = used_columns.get(table.name, set()) | {c.name for c in table.primary_key}
+
+        sa.Table(
+            table.name,
+            projected_metadata,
+            *(c._copy() for c in table.columns if c.name in keep),
+            # foreign keys are table constraints, they aren't copied with columns
+            *(
+                fk._copy()
+                for fk in table.foreign_key_constraints
+                if keep.issuperset(fk.column_keys)
+            ),
+            comment=table.comment,
+            info=dict(table.info),
+        )
+
+    return projected_metadata
+
+
 def populate_unified_table(
     conn: sa.Connection,
     metadata: MetaData = default_metadata,
@@ -15,7 +15,7 @@ from .dne_data import (
     generate_localidade,
     generate_logradouro,
 )
-from .shared import CreateTemporaryDneDirectory
+from .shared import CreateTemporaryDneDirectory, serve_file_over_http
 
 load_dotenv()
 
@@ -141,7 +141,7 @@ def stringify_row():
 @pytest.fixture
 def mock_urlopen(mocker):
     some_valid_url = "https://some-valid-url"
-    urlopen = mocker.patch("edne_correios_loader.resolver.urllib.request.urlopen")
+    urlopen = mocker.patch("edne_correios_loader.downloader.urllib.request.urlopen")
 
     @contextlib.contextmanager
     def mock_urlopen_fn(content, *, url=some_valid_url, with_content_length=True):
@@ -158,12 +158,22 @@ def mock_urlopen(mocker):
 
         yield url
 
-        urlopen.assert_called_once_with(url)
+        urlopen.assert_called_once()
+        assert urlopen.call_args.args[0].full_url == url
         urlopen.reset_mock()
 
     return mock_urlopen_fn
 
 
+@pytest.fixture
+def http_server():
+    """
+    Local HTTP server standing in for the Correios website
+    """
+    with serve_file_over_http() as server:
+        yield server
+
+
 ### file-reader related
 
 
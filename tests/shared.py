@@ -1,6 +1,10 @@
 import contextlib
+import os
+import re
 import shutil
 import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
 from edne_correios_loader.resolver import DELIMITED_SUBDIR
@@ -51,3 +55,105 @@ def create_inner_dne_zip_file() -> str:
                 root_dir=dne_dir.outerdir,
                 base_dir=DELIMITED_SUBDIR,
             )
+
+
+class FileRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the server content at /dne.zip, optionally supporting range requests
+    and truncating the first responses to simulate interrupted transfers.
+    Conditional requests matching the server ETag get a 304 response, and range
+    requests whose If-Range doesn't match it get the whole content.
+    """
+
+    def do_HEAD(self):
+        self.server.head_requests += 1
+
+        if self.path != "/dne.zip":
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_content_headers(len(self.server.content))
+        self.end_headers()
+
+    def do_GET(self):
+        server = self.server
+        content = server.content
+        range_header = self.headers.get("Range")
+        server.requested_ranges.append(range_header)
+        if_range = self.headers.get("If-Range")
+        if range_header:
+            server.if_ranges.append(if_range)
+
+        if self.path != "/dne.zip":
+            self.send_error(404)
+            return
+
+        if server.etag and self.headers.get("If-None-Match") == server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start, end = 0, len(content) - 1
+
+        if server.accept_ranges and range_header and if_range in (None, server.etag):
+            match = re.fullmatch(r"bytes=(\d+)-(\d*)", range_header)
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else end
+
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(content)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(content)}")
+        else:
+            self.send_response(200)
+
+        body = content[start : end + 1]
+        self.send_content_headers(len(body))
+        self.end_headers()
+
+        with server.lock:
+            truncate = server.truncated_responses > 0
+            server.truncated_responses -= 1
+
+        self.wfile.write(body[: len(body) // 2] if truncate else body)
+
+    def send_content_headers(self, length):
+        self.send_header("Content-Length", str(length))
+        if self.server.accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if self.server.etag:
+            self.send_header("ETag", self.server.etag)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def serve_file_over_http(content: bytes | None = None):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FileRequestHandler)
+    server.content = os.urandom(1000) if content is None else content
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/dne.zip"
+    server.accept_ranges = True
+    server.etag = None
+    server.truncated_responses = 0
+    server.requested_ranges = []
+    server.if_ranges = []
+    server.head_requests = 0
+    server.lock = threading.Lock()
+
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+    )
+    thread.start()
+
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,145 @@
+import datetime
+
+import pytest
+import sqlalchemy as sa
+
+from edne_correios_loader import AddressAutocomplete
+from edne_correios_loader.autocomplete import (
+    AutocompleteIndex,
+    TrigramIndex,
+    word_trigrams,
+)
+from edne_correios_loader.state import load_info_table
+from edne_correios_loader.tables import metadata
+
+
+def build_row(cep, logradouro, bairro, municipio="São Paulo", uf="SP", nome=None):
+    return {
+        "cep": cep,
+        "logradouro": logradouro,
+        "bairro": bairro,
+        "municipio": municipio,
+        "uf": uf,
+        "nome": nome,
+        "complemento": None,
+        "municipio_cod_ibge": 1,
+    }
+
+
+rows = [
+    build_row("01310100", "Avenida Paulista", "Bela Vista"),
+    build_row("01310200", "Avenida Paulista", "Bela Vista"),
+    build_row("01311000", "Avenida Paulista", "Bela Vista"),
+    build_row("01529000", "Rua Paulo Orozimbo", "Aclimação"),
+    build_row("01305000", "Rua Augusta", "Consolação"),
+    build_row("01001000", "Praça da Sé", "Sé"),
+    build_row("01000000", None, None, nome="Edifício Copan"),
+    build_row("01099999", None, None),
+    build_row("53401000", "Avenida Paulista", "Centro", "Paulista", "PE"),
+    build_row("20040002", "Rua Paulista", "Centro", "Rio de Janeiro", "RJ"),
+]
+
+
+def test_word_trigrams():
+    assert word_trigrams("se") == {"  s", " se", "se "}
+    assert word_trigrams("rua", prefix=True) == {"  r", " ru", "rua"}
+
+
+def test_trigram_index_finds_prefixes_and_misspellings():
+    index = TrigramIndex(["rua augusta", "avenida paulista", "rua paulo", "rua"])
+
+    assert index.search("rua aug") == [(0, 1.0)]
+    assert index.search("ru") == [(0, 1.0), (2, 1.0), (3, 1.0)]
+    assert index.search("paul", [(2, 4)]) == [(2, 1.0)]
+    assert index.search("avenida paulsita") == [(1, 0.75)]
+    assert index.search("rua agusta", min_similarity=0.9) == []
+    assert index.search("") == []
+
+
+@pytest.fixture
+def autocomplete_index():
+    return AutocompleteIndex(rows)
+
+
+def test_autocomplete_index_suggests_addresses(autocomplete_index):
+    assert autocomplete_index.suggest("av paulista", municipio="são paulo") == [
+        {
+            "logradouro": "Avenida Paulista",
+            "bairro": "Bela Vista",
+            "municipio": "São Paulo",
+            "uf": "SP",
+            "ceps": ["01310100", "01310200", "01311000"],
+            "similarity": 1.0,
+        }
+    ]
+    assert autocomplete_index.suggest("edificio cop")[0]["ceps"] == ["01000000"]
+    assert autocomplete_index.suggest("rua agusta consolacao")[0]["ceps"] == [
+        "01305000"
+    ]
+    assert autocomplete_index.suggest("avenida nove de julho") == []
+    # CEPs without street or name aren't suggested
+    assert len(autocomplete_index) == 7
+
+
+def test_autocomplete_index_ranks_addresses(autocomplete_index):
+    suggestions = autocomplete_index.suggest("paulo", municipio="Sao Paulo")
+
+    # as typed, then similar streets with more CEPs first
+    assert [s["logradouro"] for s in suggestions] == [
+        "Rua Paulo Orozimbo",
+        "Avenida Paulista",
+    ]
+    assert suggestions[1]["similarity"] < 1
+
+
+def test_autocomplete_index_filters_by_municipio_and_uf(autocomplete_index):
+    def suggest(*args, **kwargs):
+        return [
+            (s["municipio"], s["uf"])
+            for s in autocomplete_index.suggest(*args, **kwargs)
+        ]
+
+    assert suggest("paulista", municipio="Paulista") == [("Paulista", "PE")]
+    assert suggest("paulista", uf="rj") == [("Rio de Janeiro", "RJ")]
+    assert suggest("paulista", municipio="Paulista", uf="SP") == []
+    assert suggest("paulista", municipio="Campinas") == []
+    assert len(suggest("paulista", limit=2)) == 2
+
+
+def save_loaded_at(connection, loaded_at):
+    connection.execute(load_info_table.delete())
+    connection.execute(
+        load_info_table.insert(),
+        {
+            "cep_table": "cep_unificado",
+            "table_set": "cep-tables",
+            "loaded_at": loaded_at,
+        },
+    )
+
+
+def test_address_autocomplete_refreshes_after_loads(connection_url):
+    cep_unificado = metadata.tables["cep_unificado"]
+    loaded_at = datetime.datetime(2024, 4, 1, tzinfo=datetime.timezone.utc)
+    engine = sa.create_engine(connection_url)
+
+    with engine.connect() as connection:
+        metadata.create_all(connection, tables=[cep_unificado])
+        load_info_table.create(connection, checkfirst=True)
+        connection.execute(cep_unificado.delete())
+        connection.execute(cep_unificado.insert(), rows[:3])
+        save_loaded_at(connection, loaded_at)
+        connection.commit()
+
+    autocomplete = AddressAutocomplete(connection_url)
+
+    assert autocomplete.suggest("rua augusta") == []
+    assert autocomplete.refresh() is False
+
+    with engine.connect() as connection:
+        connection.execute(cep_unificado.insert(), rows[4])
+        save_loaded_at(connection, loaded_at + datetime.timedelta(days=14))
+        connection.commit()
+
+    assert autocomplete.refresh() is True
+    assert autocomplete.suggest("rua augusta")[0]["ceps"] == ["01305000"]
@@ -0,0 +1,95 @@
+import os
+from pathlib import Path
+
+from edne_correios_loader.cache import DneCache, file_hash, url_cache_key
+
+
+def make_release(cache: DneCache, name: str, size: int) -> Path:
+    extracted = cache.tmp_dir / name
+    extracted.mkdir()
+    (extracted / "LOG_LOCALIDADE.TXT").write_bytes(b"x" * size)
+    return extracted
+
+
+def test_cache_stores_and_gets_releases(tmp_path):
+    cache = DneCache(tmp_path)
+
+    assert cache.get("abc") is None
+
+    release = cache.store("abc", make_release(cache, "extracted", 10))
+
+    assert release == tmp_path / "releases" / "abc"
+    assert cache.get("abc") == release
+    assert (release / "LOG_LOCALIDADE.TXT").is_file()
+
+
+def test_cache_maps_url_validators_to_releases(tmp_path):
+    cache = DneCache(tmp_path)
+    release = cache.store("abc", make_release(cache, "extracted", 10))
+
+    assert cache.get_by_validators(None) is None
+    assert cache.get_by_validators("url-key") is None
+
+    cache.save_validators("url-key", "abc")
+
+    assert cache.get_by_validators("url-key") == release
+    # the index is persisted
+    assert DneCache(tmp_path).get_by_validators("url-key") == release
+
+
+def test_cache_evicts_least_recently_used_releases(tmp_path):
+    cache = DneCache(tmp_path, max_size=25)
+
+    cache.store("first", make_release(cache, "first", 10))
+    cache.store("second", make_release(cache, "second", 10))
+    cache.save_validators("first-url", "first")
+
+    # use the first release, so the second one becomes the least recently used
+    first = cache.get("first")
+    os.utime(first, (first.stat().st_atime + 10, first.stat().st_mtime + 10))
+
+    cache.store("third", make_release(cache, "third", 10))
+
+    assert cache.get("first") is not None
+    assert cache.get("second") is None
+    assert cache.get("third") is not None
+    assert cache.get_by_validators("first-url") is not None
+
+
+def test_cache_never_evicts_the_release_being_stored(tmp_path):
+    cache = DneCache(tmp_path, max_size=5)
+
+    cache.store("first", make_release(cache, "first", 10))
+    cache.store("second", make_release(cache, "second", 10))
+
+    assert cache.get("first") is None
+    assert cache.get("second") is not None
+
+
+def test_cache_download_path_is_stable_per_url(tmp_path):
+    cache = DneCache(tmp_path)
+
+    assert cache.download_path("http://a/dne.zip") == cache.download_path(
+        "http://a/dne.zip"
+    )
+    assert cache.download_path("http://a/dne.zip") != cache.download_path(
+        "http://b/dne.zip"
+    )
+    assert cache.download_path("http://a/dne.zip").parent == cache.downloads_dir
+
+
+def test_url_cache_key():
+    assert url_cache_key("http://a", {}) is None
+    assert url_cache_key("http://a", {"ETag": '"1"'}) != url_cache_key(
+        "http://a", {"ETag": '"2"'}
+    )
+    assert url_cache_key("http://a", {"Last-Modified": "today"}) is not None
+
+
+def test_file_hash(tmp_path):
+    file = tmp_path / "file"
+    file.write_bytes(b"content")
+
+    assert file_hash(file, buffer_size=2) == (
+        "ed7002b439e9ac845f22357d822bac1444730fbdb6016d3ec9432297b9ec9f73"
+    )
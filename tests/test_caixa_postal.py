@@ -0,0 +1,96 @@
+import pytest
+import sqlalchemy as sa
+
+from edne_correios_loader import CaixaPostalQuerier
+from edne_correios_loader.caixa_postal import parse_caixa_postal
+from edne_correios_loader.tables import metadata
+
+rows = {
+    "log_localidade": [
+        ["1", "SP", "São Paulo", None, "1", "M", None, "S Paulo", "3550308"],
+    ],
+    "log_bairro": [["10", "SP", "1", "Sé", None]],
+    "log_unid_oper": [
+        [
+            "100",
+            "SP",
+            "1",
+            "10",
+            None,
+            "AC Sé",
+            "Praça da Sé, 1",
+            "01001970",
+            "S",
+            None,
+        ],
+        ["101", "SP", "1", "10", None, "AC Centro", "Rua X, 2", "01002970", "N", None],
+    ],
+    "log_faixa_uop": [["100", "1", "999"], ["100", "5000", "5999"]],
+}
+
+agencia_se = {
+    "uop_nu": 100,
+    "ufe_sg": "SP",
+    "loc_nu": 1,
+    "bai_nu": 10,
+    "log_nu": None,
+    "uop_no": "AC Sé",
+    "uop_endereco": "Praça da Sé, 1",
+    "cep": "01001970",
+    "uop_in_cp": "S",
+    "uop_no_abrev": None,
+}
+
+
+@pytest.fixture(autouse=True)
+def populate_tables(connection_url):
+    tables = [metadata.tables[name] for name in rows]
+    # referenced by log_unid_oper
+    log_logradouro = metadata.tables["log_logradouro"]
+
+    with sa.create_engine(connection_url).connect() as connection:
+        metadata.create_all(connection, tables=[log_logradouro, *tables])
+
+        for table in reversed(tables):
+            connection.execute(table.delete())
+
+        for table in tables:
+            connection.execute(
+                table.insert(),
+                [
+                    dict(zip(table.c.keys(), row, strict=True))
+                    for row in rows[table.name]
+                ],
+            )
+
+        connection.commit()
+
+
+@pytest.mark.parametrize(
+    ("caixa_postal", "expected"),
+    [("1234", 1234), (" 12 ", 12), (12, 12), ("12A", None), (-1, None), (None, None)],
+)
+def test_parse_caixa_postal(caixa_postal, expected):
+    assert parse_caixa_postal(caixa_postal) == expected
+
+
+@pytest.mark.parametrize("method", ["query", "query_database"])
+def test_caixa_postal_querier_finds_the_unit_of_a_caixa_postal(connection_url, method):
+    query = getattr(CaixaPostalQuerier(connection_url), method)
+
+    assert query(100, "1") == agencia_se
+    assert query(100, 5500) == agencia_se
+    assert query(100, "1000") is None
+    assert query(101, "1") is None
+    assert query(999, "1") is None
+    assert query(100, "invalid") is None
+
+
+def test_caixa_postal_querier_queries_many_caixas_postais(connection_url):
+    querier = CaixaPostalQuerier(connection_url)
+
+    assert querier.query_many([(100, "999"), (100, "4999"), (101, 1)]) == [
+        agencia_se,
+        None,
+        None,
+    ]
@@ -0,0 +1,113 @@
+import os
+import stat
+
+import pytest
+import sqlalchemy as sa
+
+from edne_correios_loader import CepBitmap
+from edne_correios_loader.cep_bitmap import CEP_BITMAP_SIZE, build_cep_bitmap
+from edne_correios_loader.tables import build_metadata
+
+ceps = ["00000000", "01001000", "01001-001", 70040010, "99999999"]
+
+
+@pytest.mark.parametrize("with_numpy", [True, False])
+def test_cep_bitmap_contains_the_given_ceps(mocker, with_numpy):
+    if with_numpy:
+        pytest.importorskip("numpy")
+    else:
+        mocker.patch("edne_correios_loader.cep_bitmap.np", None)
+
+    bitmap = CepBitmap.from_ceps([*ceps, "invalid"])
+
+    assert bitmap.count() == len(ceps)
+    assert bitmap.contains("01001-000")
+    assert 70040010 in bitmap
+    assert not bitmap.contains("01001002")
+    assert not bitmap.contains("invalid")
+    assert bitmap.contains_many(["99999999", "01001001", "00000001", "", -1]) == [
+        True,
+        True,
+        False,
+        False,
+        False,
+    ]
+
+
+def test_cep_bitmap_checks_arrays_of_ceps():
+    np = pytest.importorskip("numpy")
+    bitmap = CepBitmap.from_ceps(ceps)
+
+    assert bitmap.contains_many(np.array([0, 1001000, 1001002, 100_000_000])) == [
+        True,
+        True,
+        False,
+        False,
+    ]
+
+
+def test_cep_bitmap_is_saved_and_mapped_into_memory(tmp_path):
+    path = tmp_path / "ceps.bin"
+    CepBitmap.from_ceps(ceps).save(path)
+
+    assert path.stat().st_size == CEP_BITMAP_SIZE
+    assert list(tmp_path.iterdir()) == [path]
+
+    bitmap = CepBitmap.load(path)
+    assert bitmap.count() == len(ceps)
+    assert bitmap.contains_many(["01001000", "01001002"]) == [True, False]
+
+
+@pytest.mark.skipif(os.name != "posix", reason="file modes are POSIX only")
+def test_cep_bitmap_is_saved_with_the_mode_of_the_replaced_file(tmp_path):
+    path = tmp_path / "ceps.bin"
+    umask = os.umask(0o022)
+
+    try:
+        CepBitmap.from_ceps(ceps).save(path)
+        assert stat.S_IMODE(path.stat().st_mode) == 0o644
+
+        path.chmod(0o640)
+        CepBitmap.from_ceps(ceps).save(path)
+        assert stat.S_IMODE(path.stat().st_mode) == 0o640
+    finally:
+        os.umask(umask)
+
+
+def test_cep_bitmap_rejects_invalid_data():
+    with pytest.raises(ValueError, match="must have 12500000 bytes"):
+        CepBitmap(b"\0" * 10)
+
+
+@pytest.mark.parametrize("cep_as_integer", [False, True])
+def test_build_cep_bitmap_from_the_unified_table(
+    connection_url, tmp_path, cep_as_integer
+):
+    metadata = build_metadata(
+        {"cep_unificado": "bitmap_ceps"}, cep_as_integer=cep_as_integer
+    )
+    cep_unificado = metadata.tables["bitmap_ceps"]
+    row = {
+        "municipio": "São Paulo",
+        "municipio_cod_ibge": 3550308,
+        "uf": "SP",
+    }
+
+    with sa.create_engine(connection_url).connect() as connection:
+        metadata.create_all(connection, tables=[cep_unificado])
+        connection.execute(cep_unificado.delete())
+        connection.execute(
+            cep_unificado.insert(),
+            [
+                {**row, "cep": 1001000 if cep_as_integer else "01001000"},
+                {**row, "cep": 1310100 if cep_as_integer else "01310100"},
+            ],
+        )
+        connection.commit()
+
+    build_cep_bitmap(connection_url, tmp_path / "ceps.bin", metadata)
+    bitmap = CepBitmap.load(tmp_path / "ceps.bin")
+
+    assert bitmap.count() == 2
+    assert bitmap.contains("01001000")
+    assert bitmap.contains("01310-100")
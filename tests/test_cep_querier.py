@@ -2,7 +2,7 @@ import pytest
 import sqlalchemy as sa
 
 from edne_correios_loader import CepQuerier
-from edne_correios_loader.tables import metadata
+from edne_correios_loader.tables import build_metadata, metadata
 
 cep1 = {
     "cep": "11111111",
@@ -54,3 +54,63 @@ def test_cep_querier_normalizes_the_cep_value(connection_url):
 
 def test_cep_querier_returns_none_when_cep_does_not_exist(connection_url):
     assert CepQuerier(connection_url).query("33333333") is None
+
+
+def test_cep_querier_returns_none_when_cep_is_invalid(connection_url):
+    assert CepQuerier(connection_url).query("1111111") is None
+    assert CepQuerier(connection_url).query("111111111") is None
+
+
+def test_cep_querier_restores_the_leading_zeros_of_integer_ceps(connection_url):
+    integer_metadata = build_metadata(
+        {"cep_unificado": "cep_unificado_int"}, cep_as_integer=True
+    )
+    cep_unificado = integer_metadata.tables["cep_unificado_int"]
+    cep = {**cep1, "cep": "01001000"}
+
+    with sa.create_engine(connection_url).connect() as connection:
+        integer_metadata.create_all(connection, tables=[cep_unificado])
+        connection.execute(cep_unificado.delete())
+        connection.execute(cep_unificado.insert(), [{**cep, "cep": 1001000}])
+        connection.commit()
+
+    querier = CepQuerier(
+        connection_url, cep_table_name="cep_unificado_int", cep_as_integer=True
+    )
+    assert querier.query("01001-000") == cep
+    assert querier.query("0100100X") is None
+    # would be the same integer as 01001000, but it isn't a CEP
+    assert querier.query("1001000") is None
+
+
+def test_cep_querier_lists_ceps_in_pages(connection_url, mocker):
+    querier = CepQuerier(connection_url)
+    connect = mocker.spy(querier.engine, "connect")
+
+    assert list(querier.list_ceps(page_size=1)) == [cep1, cep2]
+    # the last page is empty
+    assert connect.call_count == 3
+    assert list(querier.list_ceps(after="11111-111")) == [cep2]
+    assert list(querier.list_ceps(after="55555551")) == []
+
+
+def test_cep_querier_lists_ceps_by_uf_municipio_and_bairro(connection_url):
+    querier = CepQuerier(connection_url)
+
+    assert list(querier.list_ceps(uf="sp")) == [cep1, cep2]
+    assert list(querier.list_ceps(uf="RJ")) == []
+    assert list(querier.list_ceps(municipio_cod_ibge=334455)) == [cep1, cep2]
+    assert list(querier.list_ceps(bairro=cep2["bairro"], uf="SP")) == [cep2]
+
+
+def test_cep_querier_rejects_invalid_listing_arguments(connection_url):
+    with pytest.raises(ValueError, match="page size must be positive"):
+        list(CepQuerier(connection_url).list_ceps(page_size=0))
+
+    with pytest.raises(ValueError, match="Invalid CEP: 0100100X"):
+        list(
+            CepQuerier(connection_url, cep_as_integer=True).list_ceps(after="0100100X")
+        )
+
+    with pytest.raises(ValueError, match="Invalid CEP: 1111111"):
+        list(CepQuerier(connection_url).list_ceps(after="1111111"))
@@ -0,0 +1,161 @@
+import pytest
+import sqlalchemy as sa
+
+from edne_correios_loader import CepRangeQuerier, UfClassifier
+from edne_correios_loader.cep_ranges import RangeIndex, parse_cep
+from edne_correios_loader.tables import metadata
+
+faixas_uf = [
+    ["SP", "01000000", "19999999"],
+    ["DF", "70000000", "72799999"],
+    ["GO", "72800000", "72999999"],
+    ["DF", "73000000", "73699999"],
+    ["GO", "73700000", "76799999"],
+]
+
+faixas_rows = {
+    "log_localidade": [
+        ["1", "SP", "São Paulo", None, "1", "M", None, "S Paulo", "3550308"],
+        ["2", "SP", "Perus", None, "2", "D", "1", None, None],
+        ["3", "SP", "Cajamar", None, "1", "M", None, "Cajamar", "3509205"],
+    ],
+    "log_bairro": [["10", "SP", "1", "Sé", None]],
+    "log_faixa_localidade": [
+        ["1", "01000000", "05999999", "T"],
+        ["2", "05200000", "05299999", "T"],
+        ["3", "07750000", "07799999", "T"],
+    ],
+    "log_faixa_bairro": [["10", "01001000", "01009999"]],
+}
+
+
+@pytest.mark.parametrize(
+    ("cep", "expected"),
+    [
+        ("01001-000", 1001000),
+        (" 01001000 ", 1001000),
+        (1001000, 1001000),
+        ("0100100", None),
+        ("0100100X", None),
+        (100_000_000, None),
+        (None, None),
+    ],
+)
+def test_parse_cep(cep, expected):
+    assert parse_cep(cep) == expected
+
+
+def test_range_index_finds_the_narrowest_range():
+    index = RangeIndex(
+        [
+            (100, 199, "municipio"),
+            (120, 129, "distrito"),
+            (150, 150, "povoado"),
+            (300, 399, "outro municipio"),
+        ]
+    )
+
+    assert index.find(99) is None
+    assert index.find(100) == "municipio"
+    assert index.find(125) == "distrito"
+    assert index.find(130) == "municipio"
+    assert index.find(150) == "povoado"
+    assert index.find(199) == "municipio"
+    assert index.find(200) is None
+    assert index.find(399) == "outro municipio"
+    assert index.find_many([125, 200, None, 151]) == [
+        "distrito",
+        None,
+        None,
+        "municipio",
+    ]
+
+
+def test_range_index_finds_many_keys_with_numpy():
+    np = pytest.importorskip("numpy")
+    index = RangeIndex([(100, 199, "a"), (120, 129, "b")])
+
+    assert index.find_many([99, 125, None]) == [None, "b", None]
+    assert index.find_many(np.array([100, 130, 200])) == ["a", "a", None]
+
+
+def test_uf_classifier_from_dne_file(temporary_dne_dir):
+    temporary_dne_dir.populate_file("LOG_FAIXA_UF.TXT", faixas_uf)
+    classifier = UfClassifier.from_dne(temporary_dne_dir.innerdir)
+
+    assert classifier.uf_for_cep("01001-000") == "SP"
+    assert classifier.uf_for_cep("72800000") == "GO"
+    assert classifier.uf_for_cep(73000000) == "DF"
+    assert classifier.uf_for_cep("99999999") is None
+    assert classifier.uf_for_cep("invalid") is None
+    assert classifier.ufs_for_ceps(["70040-010", "76799999", "", 19999999]) == [
+        "DF",
+        "GO",
+        None,
+        "SP",
+    ]
+
+
+def test_uf_classifier_from_database(connection_url):
+    log_faixa_uf = metadata.tables["log_faixa_uf"]
+
+    with sa.create_engine(connection_url).connect() as connection:
+        metadata.create_all(connection, tables=[log_faixa_uf])
+        connection.execute(log_faixa_uf.delete())
+        connection.execute(
+            log_faixa_uf.insert(),
+            [dict(zip(log_faixa_uf.c.keys(), f, strict=True)) for f in faixas_uf],
+        )
+        connection.commit()
+
+    classifier = UfClassifier.from_database(connection_url)
+
+    assert classifier.uf_for_cep("72900000") == "GO"
+    assert classifier.ufs_for_ceps(["01001000", "20000000"]) == ["SP", None]
+
+
+@pytest.fixture
+def populate_faixas_tables(connection_url):
+    tables = [metadata.tables[name] for name in faixas_rows]
+
+    with sa.create_engine(connection_url).connect() as connection:
+        metadata.create_all(connection, tables=tables)
+
+        for table in reversed(tables):
+            connection.execute(table.delete())
+
+        for table in tables:
+            connection.execute(
+                table.insert(),
+                [
+                    dict(zip(table.c.keys(), row, strict=True))
+                    for row in faixas_rows[table.name]
+                ],
+            )
+
+        connection.commit()
+
+
+@pytest.mark.usefixtures("populate_faixas_tables")
+@pytest.mark.parametrize("method", ["query", "query_database"])
+def test_cep_range_querier_finds_the_localidade_and_bairro(connection_url, method):
+    query = getattr(CepRangeQuerier(connection_url), method)
+    sao_paulo = {
+        "cep": None,
+        "logradouro": None,
+        "complemento": None,
+        "bairro": None,
+        "municipio": "São Paulo",
+        "municipio_cod_ibge": 3550308,
+        "uf": "SP",
+        "nome": None,
+    }
+
+    assert query("01001-010") == {**sao_paulo, "cep": "01001010", "bairro": "Sé"}
+    assert query("05210000") == {**sao_paulo, "cep": "05210000", "bairro": "Perus"}
+    assert query(2000000) == {**sao_paulo, "cep": "02000000"}
+    assert query("06000000") is None
+    # between two ranges
+    assert query("07000000") is None
+    assert query("07750001")["municipio"] == "Cajamar"
+    assert query("invalid") is None
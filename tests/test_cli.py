@@ -4,11 +4,15 @@ from pathlib import Path
 import pytest
 from click.testing import CliRunner
 
+from edne_correios_loader.clean_strategy import CleanStrategyEnum
 from edne_correios_loader.cli import (
     DneResolverWithDownloadProgress,
     edne_correios_loader,
+    export,
     load,
     query_cep,
+    search,
+    serve,
 )
 from edne_correios_loader.table_set import TableSetEnum
 
@@ -25,6 +29,11 @@ def mocked_cep_querier(mocker):
     return mocker.patch("edne_correios_loader.cli.CepQuerier")
 
 
+@pytest.fixture
+def mocked_cep_searcher(mocker):
+    return mocker.patch("edne_correios_loader.cli.CepSearcher")
+
+
 @pytest.fixture
 def inner_dne_zip_content() -> bytes:
     with create_inner_dne_zip_file() as path:
@@ -73,9 +82,29 @@ def test_cli_load_command_accepts_use_default_options(mocked_dne_loader):
     runner = CliRunner()
     result = runner.invoke(load, ["-db", db_url])
 
-    mocked_dne_loader.assert_called_once_with(db_url, dne_source=None, table_names=None)
+    mocked_dne_loader.assert_called_once_with(
+        db_url,
+        dne_source=None,
+        table_names=None,
+        cache_dir=None,
+        cache_max_size=None,
+        cep_as_integer=False,
+        partition_unified_table=False,
+    )
     mocked_dne_loader.return_value.load.assert_called_once_with(
-        table_set=TableSetEnum.UNIFIED_CEP_ONLY
+        table_set=TableSetEnum.UNIFIED_CEP_ONLY,
+        resume=False,
+        force=False,
+        clean_strategy=CleanStrategyEnum.DELETE,
+        relax_foreign_keys=False,
+        sqlite_bulk=False,
+        unlogged_staging=False,
+        pipelined=False,
+        project_columns=False,
+        ufs=None,
+        materialized_view=False,
+        cep_bitmap_path=None,
+        search_index=False,
     )
 
     assert result.exit_code == 0
@@ -110,9 +139,229 @@ def test_cli_load_command_use_provided_options(mocked_dne_loader):
 
     assert result.exit_code == 0
     mocked_dne_loader.assert_called_once_with(
-        db_url, dne_source=dne_source, table_names=None
+        db_url,
+        dne_source=dne_source,
+        table_names=None,
+        cache_dir=None,
+        cache_max_size=None,
+        cep_as_integer=False,
+        partition_unified_table=False,
+    )
+    mocked_dne_loader.return_value.load.assert_called_once_with(
+        table_set=table_set,
+        resume=False,
+        force=False,
+        clean_strategy=CleanStrategyEnum.DELETE,
+        relax_foreign_keys=False,
+        sqlite_bulk=False,
+        unlogged_staging=False,
+        pipelined=False,
+        project_columns=False,
+        ufs=None,
+        materialized_view=False,
+        cep_bitmap_path=None,
+        search_index=False,
+    )
+
+
+def test_cli_load_command_resume_option(mocked_dne_loader):
+    runner = CliRunner()
+    result = runner.invoke(load, ["-db", "db-url", "--resume"])
+
+    assert result.exit_code == 0
+    mocked_dne_loader.return_value.load.assert_called_once_with(
+        table_set=TableSetEnum.UNIFIED_CEP_ONLY,
+        resume=True,
+        force=False,
+        clean_strategy=CleanStrategyEnum.DELETE,
+        relax_foreign_keys=False,
+        sqlite_bulk=False,
+        unlogged_staging=False,
+        pipelined=False,
+        project_columns=False,
+        ufs=None,
+        materialized_view=False,
+        cep_bitmap_path=None,
+        search_index=False,
+    )
+
+
+def test_cli_load_command_force_option(mocked_dne_loader):
+    runner = CliRunner()
+    result = runner.invoke(load, ["-db", "db-url", "--force"])
+
+    assert result.exit_code == 0
+    mocked_dne_loader.return_value.load.assert_called_once_with(
+        table_set=TableSetEnum.UNIFIED_CEP_ONLY,
+        resume=False,
+        force=True,
+        clean_strategy=CleanStrategyEnum.DELETE,
+        relax_foreign_keys=False,
+        sqlite_bulk=False,
+        unlogged_staging=False,
+        pipelined=False,
+        project_columns=False,
+        ufs=None,
+        materialized_view=False,
+        cep_bitmap_path=None,
+        search_index=False,
+    )
+
+
+def test_cli_load_command_clean_strategy_option(mocked_dne_loader):
+    runner = CliRunner()
+    result = runner.invoke(load, ["-db", "db-url", "--clean-strategy", "truncate"])
+
+    assert result.exit_code == 0
+    mocked_dne_loader.return_value.load.assert_called_once_with(
+        table_set=TableSetEnum.UNIFIED_CEP_ONLY,
+        resume=False,
+        force=False,
+        clean_strategy=CleanStrategyEnum.TRUNCATE,
+        relax_foreign_keys=False,
+        sqlite_bulk=False,
+        unlogged_staging=False,
+        pipelined=False,
+        project_columns=False,
+        ufs=None,
+        materialized_view=False,
+        cep_bitmap_path=None,
+        search_index=False,
+    )
+
+
+def test_cli_load_command_relax_foreign_keys_option(mocked_dne_loader):
+    runner = CliRunner()
+    result = runner.invoke(load, ["-db", "db-url", "--relax-foreign-keys"])
+
+    assert result.exit_code == 0
+    mocked_dne_loader.return_value.load.assert_called_once_with(
+        table_set=TableSetEnum.UNIFIED_CEP_ONLY,
+        resume=False,
+        force=False,
+        clean_strategy=CleanStrategyEnum.DELETE,
+        relax_foreign_keys=True,
+        sqlite_bulk=False,
+        unlogged_staging=False,
+        pipelined=False,
+        project_columns=False,
+        ufs=None,
+        materialized_view=False,
+        cep_bitmap_path=None,
+        search_index=False,
+    )
+
+
+def test_cli_load_command_sqlite_bulk_option(mocked_dne_loader):
+    runner = CliRunner()
+    result = runner.invoke(load, ["-db", "sqlite:///dne.db", "--sqlite-bulk"])
+
+    assert result.exit_code == 0
+    assert mocked_dne_loader.return_value.load.call_args.kwargs["sqlite_bulk"]
+
+
+def test_cli_load_command_unlogged_staging_option(mocked_dne_loader):
+    runner = CliRunner()
+    result = runner.invoke(load, ["-db", "db-url", "--unlogged-staging"])
+
+    assert result.exit_code == 0
+    assert mocked_dne_loader.return_value.load.call_args.kwargs["unlogged_staging"]
+
+
+def test_cli_load_command_pipelined_option(mocked_dne_loader):
+    runner = CliRunner()
+    result = runner.invoke(load, ["-db", "db-url", "--pipelined"])
+
+    assert result.exit_code == 0
+    assert mocked_dne_loader.return_value.load.call_args.kwargs["pipelined"]
+
+
+def test_cli_load_command_project_columns_option(mocked_dne_loader):
+    runner = CliRunner()
+    result = runner.invoke(load, ["-db", "db-url", "--project-columns"])
+
+    assert result.exit_code == 0
+    assert mocked_dne_loader.return_value.load.call_args.kwargs["project_columns"]
+
+
+def test_cli_load_command_uf_option(mocked_dne_loader):
+    runner = CliRunner()
+    result = runner.invoke(load, ["-db", "db-url", "--uf", "sp, RJ"])
+
+    assert result.exit_code == 0
+    assert mocked_dne_loader.return_value.load.call_args.kwargs["ufs"] == ("RJ", "SP")
+
+
+def test_cli_load_command_rejects_unknown_uf(mocked_dne_loader):
+    runner = CliRunner()
+    result = runner.invoke(load, ["-db", "db-url", "--uf", "SP,XX"])
+
+    assert result.exit_code == 2
+    assert "Unknown UF: XX" in result.output
+    mocked_dne_loader.assert_not_called()
+
+
+def test_cli_load_command_materialized_view_option(mocked_dne_loader):
+    runner = CliRunner()
+    result = runner.invoke(
+        load, ["-db", "db-url", "--tables", "cep-tables", "--materialized-view"]
+    )
+
+    assert result.exit_code == 0
+    assert mocked_dne_loader.return_value.load.call_args.kwargs["materialized_view"]
+
+
+def test_cli_load_command_cep_as_integer_option(mocked_dne_loader):
+    runner = CliRunner()
+    result = runner.invoke(load, ["-db", "db-url", "--cep-as-integer"])
+
+    assert result.exit_code == 0
+    assert mocked_dne_loader.call_args.kwargs["cep_as_integer"]
+
+
+def test_cli_load_command_partition_unified_table_option(mocked_dne_loader):
+    runner = CliRunner()
+    result = runner.invoke(load, ["-db", "db-url", "--partition-unified-table"])
+
+    assert result.exit_code == 0
+    assert mocked_dne_loader.call_args.kwargs["partition_unified_table"]
+
+
+def test_cli_load_command_cep_bitmap_option(mocked_dne_loader):
+    runner = CliRunner()
+    result = runner.invoke(load, ["-db", "db-url", "--cep-bitmap", "/some/ceps.bin"])
+
+    assert result.exit_code == 0
+    assert (
+        mocked_dne_loader.return_value.load.call_args.kwargs["cep_bitmap_path"]
+        == "/some/ceps.bin"
+    )
+
+
+def test_cli_load_command_search_index_option(mocked_dne_loader):
+    runner = CliRunner()
+    result = runner.invoke(load, ["-db", "db-url", "--search-index"])
+
+    assert result.exit_code == 0
+    assert mocked_dne_loader.return_value.load.call_args.kwargs["search_index"]
+
+
+def test_cli_load_command_cache_options(mocked_dne_loader):
+    runner = CliRunner()
+    result = runner.invoke(
+        load, ["-db", "db-url", "--cache-dir", "/some/dir", "--cache-max-size", "10"]
+    )
+
+    assert result.exit_code == 0
+    mocked_dne_loader.assert_called_once_with(
+        "db-url",
+        dne_source=None,
+        table_names=None,
+        cache_dir="/some/dir",
+        cache_max_size=10 * 1024 * 1024,
+        cep_as_integer=False,
+        partition_unified_table=False,
     )
-    mocked_dne_loader.return_value.load.assert_called_once_with(table_set=table_set)
 
 
 # --- --table-name ---
@@ -130,6 +379,10 @@ def test_cli_load_with_single_table_name(mocked_dne_loader):
         "db-url",
         dne_source=None,
         table_names={"cep_unificado": "my_cep"},
+        cache_dir=None,
+        cache_max_size=None,
+        cep_as_integer=False,
+        partition_unified_table=False,
     )
 
 
@@ -152,6 +405,10 @@ def test_cli_load_with_multiple_table_names(mocked_dne_loader):
         "db-url",
         dne_source=None,
         table_names={"cep_unificado": "my_cep", "log_localidade": "my_loc"},
+        cache_dir=None,
+        cache_max_size=None,
+        cep_as_integer=False,
+        partition_unified_table=False,
     )
 
 
@@ -222,7 +479,9 @@ def test_cli_query_cep_uses_default_table_name(mocked_cep_querier):
     runner = CliRunner()
     runner.invoke(query_cep, ["-db", "db-url", "12345678"])
 
-    mocked_cep_querier.assert_called_once_with("db-url", cep_table_name=None)
+    mocked_cep_querier.assert_called_once_with(
+        "db-url", cep_table_name=None, cep_as_integer=False
+    )
 
 
 def test_cli_query_cep_with_custom_table_name(mocked_cep_querier):
@@ -235,7 +494,9 @@ def test_cli_query_cep_with_custom_table_name(mocked_cep_querier):
     )
 
     assert result.exit_code == 0
-    mocked_cep_querier.assert_called_once_with("db-url", cep_table_name="my_cep")
+    mocked_cep_querier.assert_called_once_with(
+        "db-url", cep_table_name="my_cep", cep_as_integer=False
+    )
 
 
 def test_cli_query_cep_capture_and_display_errors(mocked_cep_querier):
@@ -249,3 +510,129 @@ def test_cli_query_cep_capture_and_display_errors(mocked_cep_querier):
     assert result.exit_code == 1
     assert result.stderr.strip() == "ERROR: some nasty error"
     mocked_cep_querier.return_value.query.assert_called_once_with(cep)
+
+
+def test_cli_search_uses_args_correctly(mocked_cep_searcher):
+    ceps = [{"cep": "01310100", "logradouro": "Avenida Paulista"}]
+    mocked_cep_searcher.return_value.search.return_value = ceps
+
+    runner = CliRunner()
+    result = runner.invoke(
+        search,
+        ["-db", "db-url", "--uf", "SP", "--limit", "5", "av paulista"],
+    )
+    assert result.exit_code == 0
+    assert json.loads(result.stdout) == ceps
+    mocked_cep_searcher.assert_called_once_with(
+        "db-url", table_names=None, cep_as_integer=False
+    )
+    mocked_cep_searcher.return_value.search.assert_called_once_with(
+        "av paulista", municipio=None, uf="SP", limit=5
+    )
+
+    mocked_cep_searcher.return_value.search.return_value = []
+    result = runner.invoke(
+        search, ["-db", "db-url", "--cep-table-name", "my_cep", "av paulista"]
+    )
+    assert result.exit_code == 3
+    assert result.stderr.strip() == "No CEPs found"
+    assert mocked_cep_searcher.call_args.kwargs["table_names"] == {
+        "cep_unificado": "my_cep"
+    }
+
+
+def test_cli_export_writes_csv(mocked_cep_querier):
+    mocked_cep_querier.return_value.cep_table.c.keys.return_value = ["cep", "uf"]
+    mocked_cep_querier.return_value.list_ceps.return_value = iter(
+        [{"cep": "01001000", "uf": "SP"}, {"cep": "01001001", "uf": "SP"}]
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        export,
+        ["-db", "db-url", "--uf", "SP", "--municipio-cod-ibge", "3550308"],
+    )
+
+    assert result.exit_code == 0
+    assert result.stdout.splitlines() == ["cep,uf", "01001000,SP", "01001001,SP"]
+    mocked_cep_querier.assert_called_once_with(
+        "db-url", cep_table_name=None, cep_as_integer=False
+    )
+    mocked_cep_querier.return_value.list_ceps.assert_called_once_with(
+        uf="SP", municipio_cod_ibge=3550308, bairro=None, after=None
+    )
+
+
+def test_cli_export_writes_json_lines(mocked_cep_querier, tmp_path):
+    ceps = [{"cep": "01001000", "bairro": "Sé"}, {"cep": "01001001", "bairro": "Sé"}]
+    mocked_cep_querier.return_value.list_ceps.return_value = iter(ceps)
+    output = tmp_path / "ceps.jsonl"
+
+    runner = CliRunner()
+    result = runner.invoke(
+        export,
+        [
+            "-db",
+            "db-url",
+            "--bairro",
+            "Sé",
+            "--after",
+            "01000000",
+            "--format",
+            "jsonl",
+            "-o",
+            str(output),
+        ],
+    )
+
+    assert result.exit_code == 0
+    lines = output.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == ceps
+    mocked_cep_querier.return_value.list_ceps.assert_called_once_with(
+        uf=None, municipio_cod_ibge=None, bairro="Sé", after="01000000"
+    )
+
+
+def test_cli_export_capture_and_display_errors(mocked_cep_querier):
+    mocked_cep_querier.return_value.list_ceps.side_effect = ValueError("Invalid CEP: x")
+
+    runner = CliRunner()
+    result = runner.invoke(export, ["-db", "db-url", "--after", "x"])
+
+    assert result.exit_code == 1
+    assert result.stderr.strip() == "ERROR: Invalid CEP: x"
+
+
+def test_cli_serve_uses_args_correctly(mocked_cep_querier, mocker, tmp_path):
+    cep_server = mocker.patch("edne_correios_loader.cli.CepServer")
+    cep_server.return_value.serve_forever = mocker.AsyncMock()
+
+    socket_path = str(tmp_path / "cep.sock")
+
+    runner = CliRunner()
+    result = runner.invoke(
+        serve, ["-db", "db-url", "--socket", socket_path, "--cache-size", "10"]
+    )
+
+    assert result.exit_code == 0
+    mocked_cep_querier.assert_called_once_with(
+        "db-url", cep_table_name=None, cep_as_integer=False
+    )
+    cep_server.assert_called_once_with(mocked_cep_querier.return_value, cache_size=10)
+    cep_server.return_value.serve_forever.assert_awaited_once_with(
+        socket_path=socket_path, host="127.0.0.1", port=8765
+    )
+
+
+@pytest.mark.usefixtures("mocked_cep_querier")
+def test_cli_serve_capture_and_display_errors(mocker):
+    cep_server = mocker.patch("edne_correios_loader.cli.CepServer")
+    cep_server.return_value.serve_forever = mocker.AsyncMock(
+        side_effect=OSError("Address already in use")
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(serve, ["-db", "db-url"])
+
+    assert result.exit_code == 1
+    assert result.stderr.strip() == "ERROR: Address already in use"
@@ -1,9 +1,16 @@
 import pytest
 import sqlalchemy as sa
 
-from edne_correios_loader import TableSetEnum
-from edne_correios_loader.dbwriter import DneDatabaseWriter
-from edne_correios_loader.tables import get_table, metadata
+from edne_correios_loader import CleanStrategyEnum, TableSetEnum
+from edne_correios_loader.dbwriter import DneDatabaseWriter, SqliteBulkDatabaseWriter
+from edne_correios_loader.exc import DneIntegrityError
+from edne_correios_loader.loader import build_row_converter
+from edne_correios_loader.tables import (
+    build_metadata,
+    format_cep,
+    get_table,
+    metadata,
+)
 
 log_localidade = get_table(metadata, "log_localidade")
 log_bairro = get_table(metadata, "log_bairro")
@@ -63,6 +70,24 @@ def test_dbwriter_create_and_drop_correct_tables(
         assert existing_tables == set(final_tables + external_tables)
 
 
+def test_dbwriter_creates_the_missing_indexes_of_existing_tables(connection_url):
+    cep_unificado = get_table(metadata, "cep_unificado")
+    index = next(i for i in cep_unificado.indexes if i.name.endswith("_uf_cep"))
+
+    with DneDatabaseWriter(connection_url) as db_writer:
+        db_writer.create_tables(["cep_unificado"])
+
+    # created by a version without the index
+    with sa.create_engine(connection_url).begin() as connection:
+        index.drop(connection)
+
+    with DneDatabaseWriter(connection_url) as db_writer:
+        db_writer.create_tables(["cep_unificado"])
+
+        indexes = sa.inspect(db_writer.connection).get_indexes(cep_unificado.name)
+        assert index.name in {i["name"] for i in indexes}
+
+
 def test_dbwriter_rollback_changes_on_error(
     connection_url, generate_localidades, stringify_row
 ):
@@ -155,7 +180,26 @@ def test_dbwriter_is_able_to_populate_tables_with_fk_to_self(
         assert fetch_all(connection, log_localidade) == localidades
 
 
+def test_dbwriter_populates_tables_with_typed_rows(
+    connection_url, generate_localidades, stringify_row
+):
+    localidades = generate_localidades(10)
+    row_converter = build_row_converter(log_localidade)
+
+    with DneDatabaseWriter(connection_url) as db_writer:
+        db_writer.create_tables(TableSetEnum.CEP_TABLES.to_populate())
+        db_writer.populate_table(
+            "log_localidade",
+            [row_converter(stringify_row(l)) for l in reversed(localidades)],
+        )
+
+    with sa.create_engine(connection_url).connect() as connection:
+        assert fetch_all(connection, log_localidade) == localidades
+
+
+@pytest.mark.parametrize("clean_strategy", list(CleanStrategyEnum))
 def test_dbwriter_clean_tables_correctly(
+    clean_strategy,
     connection_url,
     generate_bairros,
     generate_localidades,
@@ -184,7 +228,7 @@ def test_dbwriter_clean_tables_correctly(
         )
 
     with DneDatabaseWriter(connection_url) as db_writer:
-        db_writer.clean_tables(TableSetEnum.CEP_TABLES.to_populate())
+        db_writer.clean_tables(TableSetEnum.CEP_TABLES.to_populate(), clean_strategy)
 
     with sa.create_engine(connection_url).connect() as connection:
         assert fetch_all(connection, log_localidade) == []
@@ -200,3 +244,354 @@ def test_dbwriter_calls_populate_unified_table(mocker, connection_url):
     with DneDatabaseWriter(connection_url) as db_writer:
         db_writer.populate_unified_table()
         populate_unified_table.assert_called_once_with(db_writer.connection, metadata)
+
+
+def test_dbwriter_discards_checkpoints_of_another_dne_release(connection_url):
+    with DneDatabaseWriter(connection_url) as db_writer:
+        assert db_writer.get_checkpoints("cep-tables", dne_version=24021) == {}
+        db_writer.save_checkpoint(
+            "log_localidade", "cep-tables", completed=True, dne_version=24021
+        )
+
+        assert db_writer.get_checkpoints("cep-tables", dne_version=24031) == {}
+        # they were removed
+        assert db_writer.get_checkpoints("cep-tables", dne_version=24021) == {}
+
+        db_writer.clear_checkpoints()
+
+
+def test_dbwriter_calls_checkpoint_every_some_batches(
+    connection_url, generate_localidades, generate_bairros, stringify_row, mocker
+):
+    localidades = generate_localidades(10)
+    bairros = generate_bairros(10, localidades)
+    checkpoint = mocker.Mock()
+
+    with DneDatabaseWriter(connection_url) as db_writer:
+        db_writer.create_tables(TableSetEnum.CEP_TABLES.to_populate())
+        db_writer.insert_buffer_size = 2
+        db_writer.checkpoint_batches = 2
+
+        # tables with self-referencing FKs are never checkpointed mid-way
+        db_writer.populate_table(
+            "log_localidade",
+            [stringify_row(l) for l in localidades],
+            checkpoint=checkpoint,
+        )
+        checkpoint.assert_not_called()
+
+        # 10 rows -> 5 batches -> 2 checkpoints
+        db_writer.populate_table(
+            "log_bairro", [stringify_row(b) for b in bairros], checkpoint=checkpoint
+        )
+        assert checkpoint.call_count == 2
+
+
+def test_dbwriter_saves_and_clears_checkpoints(
+    connection_url, generate_localidades, stringify_row
+):
+    localidades = generate_localidades(10)
+
+    with pytest.raises(RuntimeError), DneDatabaseWriter(connection_url) as db_writer:
+        db_writer.create_tables(TableSetEnum.CEP_TABLES.to_populate())
+        assert db_writer.get_checkpoints("cep-tables", dne_version=24021) == {}
+
+        db_writer.populate_table(
+            "log_localidade", [stringify_row(l) for l in localidades]
+        )
+        db_writer.save_checkpoint(
+            "log_localidade", "cep-tables", completed=True, dne_version=24021
+        )
+        db_writer.save_checkpoint(
+            "log_bairro", "cep-tables", "LOG_BAIRRO.TXT", 7, dne_version=24021
+        )
+
+        msg = "Load failed after the checkpoints"
+        raise RuntimeError(msg)
+
+    # progress was committed, so it's available to a new writer
+    with DneDatabaseWriter(connection_url) as db_writer:
+        checkpoints = db_writer.get_checkpoints("cep-tables", dne_version=24021)
+
+        assert checkpoints["log_localidade"]["completed"] is True
+        assert checkpoints["log_bairro"]["completed"] is False
+        assert checkpoints["log_bairro"]["file_name"] == "LOG_BAIRRO.TXT"
+        assert checkpoints["log_bairro"]["line"] == 7
+
+        # checkpoints saved for another table set are discarded
+        assert db_writer.get_checkpoints("all", dne_version=24021) == {}
+
+        db_writer.clear_checkpoints()
+
+    engine = sa.create_engine(connection_url)
+    assert "dne_load_checkpoint" not in reflect_metadata(engine).tables
+
+    with engine.connect() as connection:
+        assert fetch_all(connection, log_localidade) == localidades
+
+
+def test_dbwriter_saves_load_info(connection_url):
+    with DneDatabaseWriter(connection_url) as db_writer:
+        assert db_writer.get_load_info() is None
+
+        db_writer.save_load_info("cep-tables", 24021, {"etag": '"abc"'})
+        db_writer.save_load_info(
+            "all",
+            24031,
+            {"last_modified": "Mon, 1 Apr 2024"},
+            options={"cep_as_integer": True},
+        )
+
+    with DneDatabaseWriter(connection_url) as db_writer:
+        load_info = db_writer.get_load_info()
+
+    assert load_info["cep_table"] == "cep_unificado"
+    assert load_info["table_set"] == "all"
+    assert load_info["dne_version"] == 24031
+    assert load_info["etag"] is None
+    assert load_info["last_modified"] == "Mon, 1 Apr 2024"
+    assert load_info["cep_as_integer"] is True
+    assert load_info["partition_unified_table"] is False
+    assert load_info["materialized_view"] is False
+    assert load_info["loaded_at"] is not None
+
+
+def test_dbwriter_clears_the_release_but_not_the_schema_options(connection_url):
+    with DneDatabaseWriter(connection_url) as db_writer:
+        db_writer.save_load_info(
+            "all", 24031, {"etag": '"abc"'}, options={"cep_as_integer": True}
+        )
+        db_writer.clear_load_info()
+        load_info = db_writer.get_load_info()
+
+    assert load_info["table_set"] == "all"
+    assert load_info["dne_version"] is None
+    assert load_info["etag"] is None
+    assert load_info["cep_as_integer"] is True
+
+
+def test_dbwriter_drops_all_tables(connection_url):
+    with DneDatabaseWriter(connection_url) as db_writer:
+        db_writer.create_tables(TableSetEnum.ALL_TABLES.to_populate())
+        db_writer.populate_search_table()
+        db_writer.drop_all_tables()
+
+        table_names = sa.inspect(db_writer.connection).get_table_names()
+
+    assert not set(table_names) & {*metadata.tables, "cep_unificado_busca"}
+
+
+def test_dbwriter_relaxed_foreign_keys_are_verified_at_the_end(
+    connection_url, generate_localidades, generate_bairros, stringify_row, mocker
+):
+    localidades = generate_localidades(10)
+    bairros = generate_bairros(10, localidades)
+
+    with (
+        pytest.raises(DneIntegrityError) as e,
+        DneDatabaseWriter(connection_url) as db_writer,
+    ):
+        db_writer.create_tables(TableSetEnum.CEP_TABLES.to_populate())
+        db_writer.relax_foreign_keys()
+        assert db_writer.foreign_keys_relaxed
+
+        sort_topologically = mocker.spy(db_writer, "sort_topologically")
+
+        # children before their parents
+        db_writer.populate_table(
+            "log_localidade", [stringify_row(l) for l in reversed(localidades)]
+        )
+        sort_topologically.assert_not_called()
+        db_writer.verify_foreign_keys(["log_localidade"])
+
+        # bairros of localidades which weren't loaded
+        db_writer.connection.execute(log_localidade.delete())
+        db_writer.populate_table("log_bairro", [stringify_row(b) for b in bairros])
+        db_writer.verify_foreign_keys(["log_localidade", "log_bairro"])
+
+    e.match(
+        "10 rows of log_bairro \\(loc_nu\\) reference missing rows of log_localidade"
+    )
+
+
+def test_dbwriter_makes_staging_tables_unlogged(connection_url):
+    tables = TableSetEnum.UNIFIED_CEP_ONLY.to_drop()
+
+    with DneDatabaseWriter(connection_url) as db_writer:
+        db_writer.create_tables(TableSetEnum.UNIFIED_CEP_ONLY.to_populate())
+        db_writer.make_tables_unlogged(tables)
+
+        if db_writer.engine.dialect.name == "postgresql":
+            persistence = dict(
+                db_writer.connection.execute(
+                    sa.text("SELECT relname, relpersistence FROM pg_class")
+                ).fetchall()
+            )
+            assert {persistence[t] for t in tables} == {"u"}
+            assert persistence["cep_unificado"] == "p"
+
+
+def test_dbwriter_populates_unified_materialized_view(
+    connection_url, generate_localidades, stringify_row
+):
+    localidades = generate_localidades(10)
+    tables = [t for t in TableSetEnum.CEP_TABLES.to_populate() if t != "cep_unificado"]
+
+    with DneDatabaseWriter(connection_url) as db_writer:
+        if db_writer.engine.dialect.name != "postgresql":
+            pytest.skip("Materialized views are only supported on PostgreSQL")
+
+        db_writer.create_tables(TableSetEnum.CEP_TABLES.to_populate())
+        db_writer.clean_tables(tables)
+        db_writer.populate_table(
+            "log_localidade", [stringify_row(l) for l in localidades[:5]]
+        )
+        # the unified table is replaced by the view
+        db_writer.populate_unified_view()
+        assert db_writer.is_materialized_view("cep_unificado")
+
+        db_writer.populate_table(
+            "log_localidade", [stringify_row(l) for l in localidades[5:]]
+        )
+        db_writer.populate_unified_view()
+
+        ceps = db_writer.connection.execute(
+            sa.text("SELECT cep FROM cep_unificado")
+        ).scalars()
+        assert sorted(ceps) == sorted(l[3] for l in localidades)
+
+        # a load without the view replaces it by the table again
+        db_writer.commit()
+        db_writer.create_tables(TableSetEnum.CEP_TABLES.to_populate())
+        assert not db_writer.is_materialized_view("cep_unificado")
+        db_writer.drop_tables(TableSetEnum.CEP_TABLES.to_populate())
+        db_writer.commit()
+
+
+@pytest.mark.parametrize("cep_as_integer", [False, True])
+def test_dbwriter_creates_partitioned_unified_table(connection_url, cep_as_integer):
+    metadata = build_metadata(
+        {"cep_unificado": "cep_unificado_partitioned"},
+        cep_as_integer=cep_as_integer,
+        partition_unified_table=True,
+    )
+    cep_unificado = metadata.tables["cep_unificado_partitioned"]
+    ceps = ["01001000", "50000000", "99999999"]
+    row = {"municipio": "Recife", "municipio_cod_ibge": 2611606, "uf": "PE"}
+
+    with DneDatabaseWriter(connection_url, metadata) as db_writer:
+        db_writer.create_tables([cep_unificado.name])
+        db_writer.connection.execute(
+            cep_unificado.insert(),
+            [{**row, "cep": int(c) if cep_as_integer else c} for c in ceps],
+        )
+
+        if db_writer.engine.dialect.name == "postgresql":
+            partitions = db_writer.connection.execute(
+                sa.text(
+                    "SELECT count(*) FROM pg_inherits "
+                    "WHERE inhparent = 'cep_unificado_partitioned'::regclass"
+                )
+            ).scalar()
+            assert partitions == 10
+
+        rows = db_writer.connection.execute(
+            sa.select(cep_unificado.c.cep).order_by(cep_unificado.c.cep)
+        ).scalars()
+        assert [format_cep(c) for c in rows] == ceps
+
+        db_writer.drop_tables([cep_unificado.name])
+
+
+# SQLite bulk load
+
+
+def test_sqlite_bulk_writer_replaces_database_when_done(
+    tmp_path, generate_localidades, stringify_row
+):
+    localidades = generate_localidades(10)
+    database_path = tmp_path / "dne.db"
+    connection_url = f"sqlite:///{database_path}"
+    external_tables = create_external_tables(sa.create_engine(connection_url))
+
+    with SqliteBulkDatabaseWriter(connection_url) as db_writer:
+        db_writer.create_tables(TableSetEnum.CEP_TABLES.to_populate())
+        db_writer.populate_table(
+            "log_localidade", [stringify_row(l) for l in localidades]
+        )
+
+        pragmas = {
+            p: db_writer.connection.exec_driver_sql(f"PRAGMA {p}").scalar()
+            for p in ("journal_mode", "synchronous", "locking_mode")
+        }
+        assert pragmas == {
+            "journal_mode": "off",
+            "synchronous": 0,
+            "locking_mode": "exclusive",
+        }
+
+        # the target is only replaced at the end
+        assert (
+            "log_localidade"
+            not in reflect_metadata(sa.create_engine(connection_url)).tables
+        )
+
+    assert list(tmp_path.iterdir()) == [database_path]
+
+    engine = sa.create_engine(connection_url)
+    reflected_metadata = reflect_metadata(engine)
+    assert set(external_tables) <= set(reflected_metadata.tables)
+    assert {i.name for i in reflected_metadata.tables["log_localidade"].indexes} == {
+        i.name for i in log_localidade.indexes
+    }
+
+    with engine.connect() as connection:
+        assert fetch_all(connection, log_localidade) == localidades
+
+
+def test_sqlite_bulk_writer_keeps_database_untouched_on_error(
+    tmp_path, generate_localidades, stringify_row
+):
+    database_path = tmp_path / "dne.db"
+    connection_url = f"sqlite:///{database_path}"
+    external_tables = create_external_tables(sa.create_engine(connection_url))
+    content = database_path.read_bytes()
+
+    with (
+        pytest.raises(RuntimeError),
+        SqliteBulkDatabaseWriter(connection_url) as db_writer,
+    ):
+        db_writer.create_tables(TableSetEnum.CEP_TABLES.to_populate())
+        db_writer.populate_table(
+            "log_localidade", [stringify_row(l) for l in generate_localidades(10)]
+        )
+
+        msg = "Load failed"
+        raise RuntimeError(msg)
+
+    assert list(tmp_path.iterdir()) == [database_path]
+    assert database_path.read_bytes() == content
+    assert set(reflect_metadata(sa.create_engine(connection_url)).tables) == set(
+        external_tables
+    )
+
+
+def test_sqlite_bulk_writer_keeps_database_untouched_when_abandoned(tmp_path):
+    database_path = tmp_path / "dne.db"
+    connection_url = f"sqlite:///{database_path}"
+    create_external_tables(sa.create_engine(connection_url))
+    content = database_path.read_bytes()
+    inode = database_path.stat().st_ino
+
+    with SqliteBulkDatabaseWriter(connection_url) as db_writer:
+        assert db_writer.get_load_info() is None
+        db_writer.abandon()
+
+    assert list(tmp_path.iterdir()) == [database_path]
+    assert database_path.stat().st_ino == inode
+    assert database_path.read_bytes() == content
+
+
+def test_sqlite_bulk_writer_requires_a_database_file():
+    with pytest.raises(ValueError, match="needs a SQLite database file"):
+        SqliteBulkDatabaseWriter("sqlite://")
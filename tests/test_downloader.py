@@ -0,0 +1,229 @@
+import json
+import urllib.error
+from pathlib import Path
+
+import pytest
+
+from edne_correios_loader.downloader import DneDownloader
+from edne_correios_loader.exc import DneDownloadError
+
+
+@pytest.fixture
+def downloader(http_server):
+    downloader = DneDownloader(http_server.url)
+    downloader.buffer_size = 64
+    downloader.min_segment_size = 100
+    downloader.retry_delay = 0
+    return downloader
+
+
+def test_downloader_downloads_in_parallel_segments(
+    http_server, downloader, tmp_path: Path
+):
+    destination = downloader.download(tmp_path / "dne.zip")
+
+    assert destination.read_bytes() == http_server.content
+    assert sorted(r for r in http_server.requested_ranges if r) == [
+        "bytes=0-249",
+        "bytes=250-499",
+        "bytes=500-749",
+        "bytes=750-999",
+    ]
+    # segment files are removed after joining them
+    assert list(tmp_path.iterdir()) == [destination]
+
+
+def test_downloader_downloads_sequentially_without_range_support(
+    http_server, downloader, tmp_path: Path
+):
+    http_server.accept_ranges = False
+
+    destination = downloader.download(tmp_path / "dne.zip")
+
+    assert destination.read_bytes() == http_server.content
+    assert http_server.requested_ranges == [None]
+
+
+def test_downloader_retries_interrupted_segments_from_where_they_stopped(
+    http_server, downloader, tmp_path: Path
+):
+    http_server.truncated_responses = 5
+
+    destination = downloader.download(tmp_path / "dne.zip")
+
+    assert destination.read_bytes() == http_server.content
+    # the retries continue segments after the bytes already received
+    assert any(
+        r and not r.startswith(("bytes=0-", "bytes=250-", "bytes=500-", "bytes=750-"))
+        for r in http_server.requested_ranges
+    )
+
+
+def test_downloader_resumes_interrupted_sequential_download(
+    http_server, downloader, tmp_path: Path
+):
+    downloader.min_segment_size = 1000
+    http_server.truncated_responses = 1
+
+    destination = downloader.download(tmp_path / "dne.zip")
+
+    assert destination.read_bytes() == http_server.content
+    assert http_server.requested_ranges == [None, "bytes=500-"]
+
+
+def test_downloader_restarts_interrupted_download_without_range_support(
+    http_server, downloader, tmp_path: Path
+):
+    http_server.accept_ranges = False
+    http_server.truncated_responses = 1
+
+    destination = downloader.download(tmp_path / "dne.zip")
+
+    assert destination.read_bytes() == http_server.content
+    assert http_server.requested_ranges == [None, None]
+
+
+def write_resume_file(path: Path, etag: str, total_size: int = 1000):
+    path.with_name(f"{path.name}.resume").write_text(
+        json.dumps({"etag": etag, "last_modified": None, "total_size": total_size})
+    )
+
+
+def test_downloader_resumes_segments_left_by_a_previous_download(
+    http_server, downloader, tmp_path: Path
+):
+    http_server.etag = '"v1"'
+    write_resume_file(tmp_path / "dne.zip", '"v1"')
+    (tmp_path / "dne.zip.part0").write_bytes(http_server.content[:100])
+    (tmp_path / "dne.zip.part2").write_bytes(http_server.content[500:750])
+
+    destination = downloader.download(tmp_path / "dne.zip")
+
+    assert destination.read_bytes() == http_server.content
+    assert sorted(r for r in http_server.requested_ranges if r) == [
+        "bytes=100-249",
+        "bytes=250-499",
+        "bytes=750-999",
+    ]
+    assert set(http_server.if_ranges) == {'"v1"'}
+    # the validators are removed along with the segments
+    assert list(tmp_path.iterdir()) == [destination]
+
+
+@pytest.mark.parametrize("previous_etag", ['"v1"', None])
+def test_downloader_discards_leftovers_of_another_version(
+    http_server, downloader, tmp_path: Path, previous_etag
+):
+    http_server.etag = '"v2"'
+    if previous_etag:
+        write_resume_file(tmp_path / "dne.zip", previous_etag)
+    (tmp_path / "dne.zip.part0").write_bytes(b"x" * 100)
+    (tmp_path / "dne.zip.part1").write_bytes(b"x" * 250)
+
+    destination = downloader.download(tmp_path / "dne.zip")
+
+    assert destination.read_bytes() == http_server.content
+    assert sorted(r for r in http_server.requested_ranges if r) == [
+        "bytes=0-249",
+        "bytes=250-499",
+        "bytes=500-749",
+        "bytes=750-999",
+    ]
+
+
+def test_downloader_discards_sequential_leftovers_of_another_version(
+    http_server, downloader, tmp_path: Path
+):
+    downloader.min_segment_size = 1000
+    http_server.etag = '"v2"'
+    write_resume_file(tmp_path / "dne.zip", '"v1"')
+    # complete, as left by a failed load of the previous version
+    (tmp_path / "dne.zip").write_bytes(b"x" * 1000)
+
+    destination = downloader.download(tmp_path / "dne.zip")
+
+    assert destination.read_bytes() == http_server.content
+    assert http_server.requested_ranges == [None]
+
+
+def test_downloader_resumes_sequential_leftovers_of_the_same_version(
+    http_server, downloader, tmp_path: Path
+):
+    downloader.min_segment_size = 1000
+    http_server.etag = '"v1"'
+    write_resume_file(tmp_path / "dne.zip", '"v1"')
+    (tmp_path / "dne.zip").write_bytes(http_server.content[:400])
+
+    destination = downloader.download(tmp_path / "dne.zip")
+
+    assert destination.read_bytes() == http_server.content
+    assert http_server.requested_ranges == [None, "bytes=400-"]
+    assert http_server.if_ranges == ['"v1"']
+
+
+def test_downloader_restarts_when_the_file_changed_during_the_download(
+    http_server, downloader, tmp_path: Path
+):
+    http_server.etag = '"v2"'
+    destination = tmp_path / "dne.zip"
+    destination.write_bytes(http_server.content[:400])
+    downloader.validators = {"etag": '"v1"'}
+
+    response = downloader.reopen_stream(destination, accepts_ranges=True)
+
+    with response:
+        assert response.read() == http_server.content
+    # the server answered the If-Range with the whole new file, requested again
+    assert http_server.requested_ranges == ["bytes=400-", None]
+    assert http_server.if_ranges == ['"v1"']
+    assert destination.read_bytes() == b""
+
+
+def test_downloader_starts_over_when_the_range_is_not_satisfiable(
+    http_server, downloader, tmp_path: Path
+):
+    downloader.min_segment_size = 1000
+    http_server.etag = '"v1"'
+    destination = tmp_path / "dne.zip"
+    destination.write_bytes(b"x" * 1200)
+    downloader.validators = {"etag": '"v1"'}
+
+    response = downloader.reopen_stream(destination, accepts_ranges=True)
+
+    with response:
+        assert response.read() == http_server.content
+    assert http_server.requested_ranges == ["bytes=1200-", None]
+    assert destination.read_bytes() == b""
+
+
+def test_downloader_gives_up_after_max_retries(http_server, downloader, tmp_path):
+    http_server.accept_ranges = False
+    http_server.truncated_responses = 10
+
+    with pytest.raises(DneDownloadError, match="ended before the expected size"):
+        downloader.download(tmp_path / "dne.zip")
+
+    assert len(http_server.requested_ranges) == downloader.max_retries + 1
+
+
+def test_downloader_does_not_retry_client_errors(http_server, tmp_path):
+    downloader = DneDownloader(http_server.url.replace("dne.zip", "missing.zip"))
+
+    with pytest.raises(urllib.error.HTTPError):
+        downloader.download(tmp_path / "dne.zip")
+
+    assert len(http_server.requested_ranges) == 1
+
+
+def test_downloader_reports_progress(http_server, downloader, tmp_path, mocker):
+    report_hook = mocker.Mock()
+    downloader.report_hook = report_hook
+
+    downloader.download(tmp_path / "dne.zip")
+
+    calls = report_hook.call_args_list
+    assert calls[0] == mocker.call(0, 1000, "start")
+    assert calls[-1] == mocker.call(0, 1000, "finish")
+    assert sum(c.args[0] for c in calls if c.args[2] == "progress") == len(
+        http_server.content
+    )
@@ -1,10 +1,23 @@
 from unittest.mock import sentinel
 
 import pytest
+import sqlalchemy as sa
 
-from edne_correios_loader import DneLoader
-from edne_correios_loader.loader import TableFilesReader
+from edne_correios_loader import CepQuerier, CleanStrategyEnum, DneLoader
+from edne_correios_loader.exc import DneNotModifiedError
+from edne_correios_loader.loader import (
+    PipelinedReader,
+    TableFilesReader,
+    build_row_converter,
+)
 from edne_correios_loader.table_set import TableSetEnum
+from edne_correios_loader.tables import (
+    SituacaoLocalidadeEnum,
+    TipoLocalidadeEnum,
+    build_metadata,
+    get_table,
+    metadata,
+)
 
 db_url = sentinel.database_url
 dne_source = sentinel.dne_source
@@ -14,6 +27,8 @@ dne_source = sentinel.dne_source
 def dne_resolver(mocker):
     mock = mocker.patch("edne_correios_loader.loader.DneLoader.DneResolver")
     mock.return_value.__enter__.return_value = mock.return_value
+    mock.return_value.dne_version = 2402
+    mock.return_value.source_validators = {}
     return mock
 
 
@@ -21,6 +36,8 @@ def dne_resolver(mocker):
 def db_writer(mocker):
     mock = mocker.patch("edne_correios_loader.loader.DneLoader.DneDatabaseWriter")
     mock.return_value.__enter__.return_value = mock.return_value
+    mock.return_value.get_load_info.return_value = None
+    mock.return_value.foreign_keys_relaxed = False
     return mock
 
 
@@ -121,4 +138,586 @@ def test_table_files_reader(temporary_dne_dir):
     temporary_dne_dir.populate_file("LOG_LOGRADOURO_AL.TXT", logradouros_al)
     files = temporary_dne_dir.innerdir.glob("LOG_LOGRADOURO_*.TXT")
 
-    assert list(TableFilesReader(files)) == logradouros_sp + logradouros_al
+    # files are read in name order
+    assert list(TableFilesReader(files)) == logradouros_al + logradouros_sp
+
+
+def test_table_files_reader_skips_filtered_lines(temporary_dne_dir):
+    rows = [["1", "AL"], ["2", "SP"], ["3", "AL"]]
+    temporary_dne_dir.populate_file("LOG_BAIRRO.TXT", rows)
+
+    reader = TableFilesReader(
+        temporary_dne_dir.innerdir.glob("LOG_BAIRRO.TXT"),
+        row_filter=lambda fields: fields[1] == "AL",
+    )
+
+    assert list(reader) == [["1", "AL"], ["3", "AL"]]
+    assert reader.position == ("LOG_BAIRRO.TXT", 3)
+
+
+def test_table_files_reader_resumes_from_position(temporary_dne_dir):
+    rows_al = [["1", "AL"], ["2", "AL"], ["3", "AL"]]
+    rows_sp = [["4", "SP"], ["5", "SP"]]
+
+    temporary_dne_dir.populate_file("LOG_LOGRADOURO_AL.TXT", rows_al)
+    temporary_dne_dir.populate_file("LOG_LOGRADOURO_SP.TXT", rows_sp)
+    files = list(temporary_dne_dir.innerdir.glob("LOG_LOGRADOURO_*.TXT"))
+
+    reader = TableFilesReader(files, resume_from=("LOG_LOGRADOURO_AL.TXT", 2))
+    assert list(reader) == rows_al[2:] + rows_sp
+    assert reader.position == ("LOG_LOGRADOURO_SP.TXT", 2)
+
+    reader = TableFilesReader(files, resume_from=("LOG_LOGRADOURO_SP.TXT", 1))
+    assert list(reader) == rows_sp[1:]
+
+
+def test_table_files_reader_converts_rows_to_column_types(temporary_dne_dir):
+    temporary_dne_dir.populate_file(
+        "LOG_LOCALIDADE.TXT",
+        [
+            ["1", "SP", "São Paulo", None, "1", "M", None, "S Paulo", "3550308"],
+            ["2", "SP", "Perus", "05200000", "2", "D", "1", None, None],
+        ],
+    )
+    files = temporary_dne_dir.innerdir.glob("LOG_LOCALIDADE.TXT")
+    row_converter = build_row_converter(get_table(metadata, "log_localidade"))
+
+    assert list(TableFilesReader(files, row_converter=row_converter)) == [
+        (
+            1,
+            "SP",
+            "São Paulo",
+            None,
+            SituacaoLocalidadeEnum.CODIFICADA,
+            TipoLocalidadeEnum.MUNICIPIO,
+            None,
+            "S Paulo",
+            3550308,
+        ),
+        (
+            2,
+            "SP",
+            "Perus",
+            "05200000",
+            SituacaoLocalidadeEnum.DISTRITO,
+            TipoLocalidadeEnum.DISTRITO,
+            1,
+            None,
+            None,
+        ),
+    ]
+
+
+def test_row_converter_projects_the_fields_of_the_projected_table():
+    table = get_table(metadata, "log_bairro")
+    projected_table = sa.Table(
+        "log_bairro",
+        sa.MetaData(),
+        sa.Column("bai_nu", sa.Integer, primary_key=True),
+        sa.Column("bai_no", sa.String(72)),
+    )
+    row_converter = build_row_converter(table, projected_table)
+
+    assert row_converter(["1", "SP", "2", "Centro", "Ctr"]) == (1, "Centro")
+    assert row_converter(["1", "SP", "2"]) == (1, None)
+
+
+def test_row_converter_converts_ceps_stored_as_integers():
+    table = get_table(build_metadata(cep_as_integer=True), "log_faixa_uf")
+    row_converter = build_row_converter(table)
+
+    assert row_converter(["SP", "01000000", "19999999"]) == ("SP", 1000000, 19999999)
+
+
+def test_pipelined_reader_yields_lines_with_their_positions(temporary_dne_dir):
+    rows_al = [[str(i), "AL"] for i in range(7)]
+    rows_sp = [[str(i), "SP"] for i in range(5)]
+
+    temporary_dne_dir.populate_file("LOG_LOGRADOURO_AL.TXT", rows_al)
+    temporary_dne_dir.populate_file("LOG_LOGRADOURO_SP.TXT", rows_sp)
+    files = list(temporary_dne_dir.innerdir.glob("LOG_LOGRADOURO_*.TXT"))
+
+    reader = PipelinedReader(TableFilesReader(files), chunk_size=3, max_chunks=1)
+    lines = []
+
+    for line in reader:
+        lines.append(line)
+        # the position is the one of the line being consumed, not of the read ahead
+        if line == ["1", "SP"]:
+            assert reader.position == ("LOG_LOGRADOURO_SP.TXT", 2)
+
+    assert lines == rows_al + rows_sp
+    assert reader.position == ("LOG_LOGRADOURO_SP.TXT", 5)
+
+
+def test_pipelined_reader_propagates_errors(mocker):
+    def failing_reader():
+        yield ["1"]
+        msg = "Invalid file"
+        raise ValueError(msg)
+
+    reader = mocker.MagicMock(position=(None, 0))
+    reader.__iter__.side_effect = failing_reader
+
+    with pytest.raises(ValueError, match="Invalid file"):
+        list(PipelinedReader(reader, chunk_size=1))
+
+
+def test_pipelined_reader_stops_reading_when_consumer_stops(mocker):
+    def endless_reader():
+        while True:
+            yield ["1"]
+
+    reader = mocker.MagicMock(position=(None, 0))
+    reader.__iter__.side_effect = endless_reader
+    pipelined_reader = iter(PipelinedReader(reader, chunk_size=10, max_chunks=2))
+
+    assert next(pipelined_reader) == ["1"]
+    # closing the generator stops and joins the reading thread
+    pipelined_reader.close()
+
+
+def test_loader_resume_skips_completed_tables(
+    dne_resolver,  # noqa: ARG001
+    db_writer,
+    mocker,
+):
+    table_files_reader = mocker.patch("edne_correios_loader.loader.TableFilesReader")
+    db_writer.return_value.get_checkpoints.return_value = {
+        "log_localidade": {"completed": True, "file_name": None, "line": 0},
+        "log_bairro": {
+            "completed": False,
+            "file_name": "LOG_BAIRRO.TXT",
+            "line": 42,
+        },
+    }
+
+    DneLoader(db_url, dne_source=dne_source).load(resume=True)
+
+    db_writer.return_value.get_checkpoints.assert_called_once_with(
+        TableSetEnum.UNIFIED_CEP_ONLY.value, ufs=None, dne_version=2402
+    )
+    db_writer.return_value.clean_tables.assert_not_called()
+
+    populated_tables = [
+        c.args[0] for c in db_writer.return_value.populate_table.call_args_list
+    ]
+    assert "log_localidade" not in populated_tables
+    assert "log_bairro" in populated_tables
+
+    assert (
+        mocker.call(
+            mocker.ANY,
+            buffer_size=DneLoader.read_buffer_size,
+            resume_from=("LOG_BAIRRO.TXT", 42),
+            row_converter=mocker.ANY,
+            row_filter=None,
+        )
+        in table_files_reader.call_args_list
+    )
+    db_writer.return_value.save_checkpoint.assert_any_call(
+        "log_bairro",
+        TableSetEnum.UNIFIED_CEP_ONLY.value,
+        completed=True,
+        ufs=None,
+        dne_version=2402,
+    )
+    db_writer.return_value.clear_checkpoints.assert_called_once_with()
+
+
+def test_loader_resume_without_checkpoints_cleans_tables(
+    dne_resolver,  # noqa: ARG001
+    db_writer,
+    mocker,
+):
+    mocker.patch("edne_correios_loader.loader.TableFilesReader")
+    db_writer.return_value.get_checkpoints.return_value = {}
+
+    DneLoader(db_url, dne_source=dne_source).load(resume=True)
+
+    db_writer.return_value.clean_tables.assert_called_once()
+    db_writer.return_value.clear_load_info.assert_called_once_with()
+    db_writer.return_value.commit.assert_called()
+
+
+def test_loader_skips_already_loaded_dne_version(dne_resolver, db_writer):
+    db_writer.return_value.get_load_info.return_value = {
+        "table_set": TableSetEnum.UNIFIED_CEP_ONLY.value,
+        "ufs": None,
+        "cep_as_integer": False,
+        "partition_unified_table": False,
+        "materialized_view": False,
+        "dne_version": 2402,
+        "etag": '"abc"',
+        "last_modified": None,
+    }
+
+    assert DneLoader(db_url, dne_source=dne_source).load() is False
+
+    assert dne_resolver.call_args.kwargs["validators"] == {
+        "etag": '"abc"',
+        "last_modified": None,
+    }
+    db_writer.return_value.populate_table.assert_not_called()
+    db_writer.return_value.save_load_info.assert_not_called()
+    db_writer.return_value.abandon.assert_called_once()
+
+
+def test_loader_skips_not_modified_dne_source(dne_resolver, db_writer):
+    dne_resolver.return_value.__enter__.side_effect = DneNotModifiedError
+    db_writer.return_value.get_load_info.return_value = {
+        "table_set": TableSetEnum.UNIFIED_CEP_ONLY.value,
+        "ufs": None,
+        "cep_as_integer": False,
+        "partition_unified_table": False,
+        "materialized_view": False,
+        "dne_version": 2401,
+        "etag": '"abc"',
+        "last_modified": None,
+    }
+
+    assert DneLoader(db_url, dne_source=dne_source).load() is False
+
+    db_writer.return_value.create_tables.assert_not_called()
+    db_writer.return_value.populate_unified_table.assert_not_called()
+    db_writer.return_value.abandon.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    ("load_kwargs", "table_set", "ufs"),
+    [
+        ({"force": True}, TableSetEnum.UNIFIED_CEP_ONLY, None),
+        ({}, TableSetEnum.ALL_TABLES, None),
+        ({"ufs": ["rj", "SP"]}, TableSetEnum.UNIFIED_CEP_ONLY, "RJ,SP"),
+    ],
+)
+def test_loader_loads_again_when_forced_or_table_set_changed(
+    load_kwargs, table_set, ufs, dne_resolver, db_writer, mocker
+):
+    mocker.patch("edne_correios_loader.loader.TableFilesReader")
+    db_writer.return_value.get_load_info.return_value = {
+        "table_set": TableSetEnum.UNIFIED_CEP_ONLY.value,
+        "ufs": None,
+        "cep_as_integer": False,
+        "partition_unified_table": False,
+        "materialized_view": False,
+        "dne_version": 2402,
+        "etag": None,
+        "last_modified": None,
+    }
+
+    loader = DneLoader(db_url, dne_source=dne_source)
+    assert loader.load(table_set=table_set, **load_kwargs) is True
+
+    assert dne_resolver.call_args.kwargs["validators"] == {}
+    db_writer.return_value.populate_unified_table.assert_called_once_with()
+    db_writer.return_value.drop_all_tables.assert_not_called()
+    db_writer.return_value.save_load_info.assert_called_once_with(
+        table_set.value,
+        2402,
+        {},
+        ufs=ufs,
+        options={
+            "cep_as_integer": False,
+            "partition_unified_table": False,
+            "materialized_view": False,
+        },
+    )
+
+
+def test_loader_loads_again_when_schema_options_changed(
+    dne_resolver, db_writer, mocker
+):
+    mocker.patch("edne_correios_loader.loader.TableFilesReader")
+    db_writer.return_value.get_load_info.return_value = {
+        "table_set": TableSetEnum.UNIFIED_CEP_ONLY.value,
+        "ufs": None,
+        "cep_as_integer": False,
+        "partition_unified_table": False,
+        "materialized_view": False,
+        "dne_version": 2402,
+        "etag": '"abc"',
+        "last_modified": None,
+    }
+
+    loader = DneLoader(db_url, dne_source=dne_source, cep_as_integer=True)
+    assert loader.load() is True
+
+    assert dne_resolver.call_args.kwargs["validators"] == {}
+    db_writer.return_value.drop_all_tables.assert_called_once_with()
+    assert db_writer.return_value.save_load_info.call_args.kwargs["options"] == {
+        "cep_as_integer": True,
+        "partition_unified_table": False,
+        "materialized_view": False,
+    }
+
+
+def test_loader_populates_unified_materialized_view(
+    dne_resolver,  # noqa: ARG001
+    db_writer,
+    mocker,
+):
+    mocker.patch("edne_correios_loader.loader.TableFilesReader")
+    db_writer.return_value.engine.dialect.name = "postgresql"
+
+    loader = DneLoader(db_url, dne_source=dne_source)
+    loader.load(table_set=TableSetEnum.CEP_TABLES, materialized_view=True)
+
+    tables = TableSetEnum.CEP_TABLES.to_populate(loader.metadata)
+    tables.remove("cep_unificado")
+    db_writer.return_value.create_tables.assert_called_once_with(tables)
+    db_writer.return_value.clean_tables.assert_called_once_with(
+        tables, CleanStrategyEnum.DELETE
+    )
+    db_writer.return_value.populate_unified_view.assert_called_once_with()
+    db_writer.return_value.populate_unified_table.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    ("table_set", "dialect", "error"),
+    [
+        (TableSetEnum.UNIFIED_CEP_ONLY, "postgresql", "needs the CEP tables"),
+        (TableSetEnum.CEP_TABLES, "sqlite", "only supported on PostgreSQL"),
+    ],
+)
+def test_loader_rejects_unsupported_materialized_view(
+    table_set,
+    dialect,
+    error,
+    dne_resolver,  # noqa: ARG001
+    db_writer,
+):
+    db_writer.return_value.engine.dialect.name = dialect
+
+    with pytest.raises(ValueError, match=error):
+        DneLoader(db_url, dne_source=dne_source).load(
+            table_set=table_set, materialized_view=True
+        )
+
+    db_writer.return_value.create_tables.assert_not_called()
+
+
+def test_loader_verifies_foreign_keys_when_relaxed(
+    dne_resolver,  # noqa: ARG001
+    db_writer,
+    mocker,
+):
+    mocker.patch("edne_correios_loader.loader.TableFilesReader")
+
+    def relax_foreign_keys():
+        db_writer.return_value.foreign_keys_relaxed = True
+
+    db_writer.return_value.relax_foreign_keys.side_effect = relax_foreign_keys
+
+    loader = DneLoader(db_url, dne_source=dne_source)
+    loader.load(relax_foreign_keys=True)
+
+    db_writer.return_value.verify_foreign_keys.assert_called_once_with(
+        TableSetEnum.UNIFIED_CEP_ONLY.to_populate(loader.metadata)
+    )
+
+
+def test_loader_uses_sqlite_bulk_writer(dne_resolver, db_writer, mocker):  # noqa: ARG001
+    bulk_writer = mocker.patch(
+        "edne_correios_loader.loader.DneLoader.SqliteBulkDatabaseWriter"
+    )
+    mocker.patch("edne_correios_loader.loader.TableFilesReader")
+
+    loader = DneLoader(db_url, dne_source=dne_source)
+    loader.load(sqlite_bulk=True)
+
+    bulk_writer.assert_called_once_with(db_url, loader.metadata)
+    db_writer.assert_not_called()
+
+    with pytest.raises(ValueError, match="can't be resumed"):
+        loader.load(sqlite_bulk=True, resume=True)
+
+
+def test_loader_makes_staging_tables_unlogged(dne_resolver, db_writer, mocker):  # noqa: ARG001
+    mocker.patch("edne_correios_loader.loader.TableFilesReader")
+
+    loader = DneLoader(db_url, dne_source=dne_source)
+    loader.load(unlogged_staging=True)
+
+    db_writer.return_value.make_tables_unlogged.assert_called_once_with(
+        TableSetEnum.UNIFIED_CEP_ONLY.to_drop(loader.metadata)
+    )
+
+    called = [name for name, *_ in db_writer.return_value.mock_calls]
+    assert called.index("make_tables_unlogged") > called.index("clean_tables")
+
+    with pytest.raises(ValueError, match="can't be resumed"):
+        loader.load(unlogged_staging=True, resume=True)
+
+
+def test_loader_pipelines_reads(dne_resolver, db_writer, mocker):  # noqa: ARG001
+    table_files_reader = mocker.patch("edne_correios_loader.loader.TableFilesReader")
+
+    DneLoader(db_url, dne_source=dne_source).load(pipelined=True)
+
+    data = db_writer.return_value.populate_table.call_args.args[1]
+    assert isinstance(data, PipelinedReader)
+    assert data.reader is table_files_reader.return_value
+
+
+def test_loader_loads_only_the_data_of_the_given_ufs(temporary_dne_dir, tmp_path):
+    temporary_dne_dir.populate_file(
+        "LOG_LOCALIDADE.TXT",
+        [
+            ["1", "SP", "São Paulo", None, "0", "M", None, "S Paulo", "3550308"],
+            ["2", "BA", "Salvador", None, "0", "M", None, "Salvador", "2927408"],
+            ["3", "SP", "Parelheiros", "04890000", "0", "D", "1", "Parelheiros", None],
+        ],
+    )
+    temporary_dne_dir.populate_file(
+        "LOG_VAR_LOC.TXT", [["1", "1", "Sampa"], ["2", "1", "Soterópolis"]]
+    )
+    temporary_dne_dir.populate_file(
+        "LOG_BAIRRO.TXT",
+        [["10", "SP", "1", "Sé", "Sé"], ["20", "BA", "2", "Barra", "Barra"]],
+    )
+    temporary_dne_dir.populate_file(
+        "LOG_LOGRADOURO_SP.TXT",
+        [
+            [
+                "100",
+                "SP",
+                "1",
+                "10",
+                None,
+                "da Sé",
+                None,
+                "01001000",
+                "Praça",
+                "S",
+                "Pç da Sé",
+            ],
+        ],
+    )
+    # files of other UFs aren't read
+    temporary_dne_dir.populate_file("LOG_LOGRADOURO_BA.TXT", [["invalid"]])
+
+    database_url = f"sqlite:///{tmp_path / 'dne.db'}"
+    loader = DneLoader(database_url, dne_source=str(temporary_dne_dir.innerdir))
+    assert loader.load(table_set=TableSetEnum.ALL_TABLES, ufs=["sp"]) is True
+
+    engine = sa.create_engine(database_url)
+    with engine.connect() as connection:
+
+        def select(table_name, column_name):
+            column = get_table(metadata, table_name).c[column_name]
+            return connection.execute(sa.select(column).order_by(column)).scalars()
+
+        assert list(select("log_localidade", "loc_nu")) == [1, 3]
+        assert list(select("log_var_loc", "val_tx")) == ["Sampa"]
+        assert list(select("log_bairro", "bai_nu")) == [10]
+        assert list(select("cep_unificado", "cep")) == ["01001000", "04890000"]
+    engine.dispose()
+
+
+def test_loader_resumes_a_failed_forced_load_of_the_same_version(
+    temporary_dne_dir, tmp_path, mocker
+):
+    temporary_dne_dir.populate_file(
+        "LOG_LOCALIDADE.TXT",
+        [["1", "SP", "Cajamar", "07750000", "0", "M", None, "Cajamar", "3509205"]],
+    )
+    (temporary_dne_dir.innerdir.parent / "LEIAME.TXT").write_text(
+        "DNE versão 24021", encoding="latin1"
+    )
+
+    database_url = f"sqlite:///{tmp_path / 'dne.db'}"
+    loader = DneLoader(database_url, dne_source=str(temporary_dne_dir.innerdir))
+    assert loader.load(resume=True) is True
+
+    # fails once the tables were cleaned and the cleaning committed
+    populate_unified_table = mocker.patch.object(
+        DneLoader.DneDatabaseWriter,
+        "populate_unified_table",
+        side_effect=RuntimeError("interrupted"),
+    )
+    with pytest.raises(RuntimeError, match="interrupted"):
+        loader.load(force=True, resume=True)
+    mocker.stop(populate_unified_table)
+
+    # the release isn't loaded anymore, it isn't skipped
+    assert loader.load(resume=True) is True
+
+    engine = sa.create_engine(database_url)
+    with engine.connect() as connection:
+        cep_unificado = get_table(metadata, "cep_unificado")
+        ceps = connection.execute(sa.select(cep_unificado.c.cep)).scalars()
+        assert list(ceps) == ["07750000"]
+    engine.dispose()
+
+
+def test_loader_creates_the_tables_again_when_the_cep_type_changes(
+    temporary_dne_dir, tmp_path
+):
+    temporary_dne_dir.populate_file(
+        "LOG_LOCALIDADE.TXT",
+        [
+            ["1", "SP", "São Paulo", "01001000", "0", "M", None, "S Paulo", "3550308"],
+            ["2", "SP", "Cajamar", "07750000", "0", "M", None, "Cajamar", "3509205"],
+        ],
+    )
+    database_url = f"sqlite:///{tmp_path / 'dne.db'}"
+    dne_path = str(temporary_dne_dir.innerdir)
+
+    assert DneLoader(database_url, dne_source=dne_path).load() is True
+    assert DneLoader(database_url, dne_source=dne_path, cep_as_integer=True).load()
+
+    engine = sa.create_engine(database_url)
+    with engine.connect() as connection:
+        columns = sa.inspect(connection).get_columns("cep_unificado")
+        cep_type = next(c["type"] for c in columns if c["name"] == "cep")
+        assert isinstance(cep_type, sa.Integer)
+    engine.dispose()
+
+    querier = CepQuerier(database_url, cep_as_integer=True)
+    assert querier.query("01001000")["cep"] == "01001000"
+    assert [c["cep"] for c in querier.list_ceps()] == ["01001000", "07750000"]
+
+
+def test_loader_creates_the_unified_table_again_when_partitioning_changes(
+    temporary_dne_dir, connection_url
+):
+    temporary_dne_dir.populate_file(
+        "LOG_LOCALIDADE.TXT",
+        [["1", "SP", "Cajamar", "07750000", "0", "M", None, "Cajamar", "3509205"]],
+    )
+    dne_path = str(temporary_dne_dir.innerdir)
+
+    assert DneLoader(connection_url, dne_source=dne_path).load() is True
+    loader = DneLoader(
+        connection_url, dne_source=dne_path, partition_unified_table=True
+    )
+    assert loader.load() is True
+
+    engine = sa.create_engine(connection_url)
+    with engine.connect() as connection:
+        if engine.dialect.name == "postgresql":
+            partitions = connection.execute(
+                sa.text(
+                    "SELECT count(*) FROM pg_inherits "
+                    "WHERE inhparent = 'cep_unificado'::regclass"
+                )
+            ).scalar()
+            assert partitions == 10
+
+        cep_unificado = get_table(metadata, "cep_unificado")
+        ceps = connection.execute(sa.select(cep_unificado.c.cep)).scalars()
+        assert list(ceps) == ["07750000"]
+    engine.dispose()
+
+    with loader.DneDatabaseWriter(connection_url) as db_writer:
+        assert db_writer.get_load_info()["partition_unified_table"] is True
+
+
+def test_loader_rebuilds_the_cep_bitmap(dne_resolver, db_writer, mocker):  # noqa: ARG001
+    build_cep_bitmap = mocker.patch("edne_correios_loader.loader.build_cep_bitmap")
+    loader = DneLoader(db_url, dne_source=dne_source)
+
+    loader.load(cep_bitmap_path="/some/ceps.bin")
+
+    build_cep_bitmap.assert_called_once_with(db_url, "/some/ceps.bin", loader.metadata)
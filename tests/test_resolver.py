@@ -9,8 +9,13 @@ from zipfile import ZipFile
 
 import pytest
 
-from edne_correios_loader.exc import DneResolverError
-from edne_correios_loader.resolver import LATEST_DNE_DOWNLOAD_URL, DneResolver
+from edne_correios_loader.exc import DneNotModifiedError, DneResolverError
+from edne_correios_loader.resolver import (
+    LATEST_DNE_DOWNLOAD_URL,
+    DneResolver,
+    extract_dne_version,
+)
+from edne_correios_loader.table_set import TableSetEnum, get_table_files_glob
 
 from .shared import create_inner_dne_zip_file
 
@@ -196,6 +201,33 @@ def test_resolver_returns_path_when_source_is_a_valid_dne_zip_file_inside_anothe
         assert has_a_dne_file(dne_dir)
 
 
+def test_resolver_extracts_only_the_files_needed_by_the_table_set(
+    inner_dne_zip_path,
+):
+    all_files = {
+        get_table_files_glob(t).replace("*", "SP")
+        for t in TableSetEnum.ALL_TABLES.to_populate()
+        if get_table_files_glob(t)
+    }
+    needed_files = {
+        get_table_files_glob(t).replace("*", "SP")
+        for t in TableSetEnum.CEP_TABLES.to_populate()
+        if get_table_files_glob(t)
+    }
+
+    with DneResolver(inner_dne_zip_path) as dne_dir:
+        assert all_files <= {f.name for f in dne_dir.iterdir()}
+
+    resolver = DneResolver(inner_dne_zip_path, table_set=TableSetEnum.CEP_TABLES)
+    resolver.extract_workers = 3
+
+    with resolver as dne_dir:
+        extracted_files = {f.name for f in dne_dir.iterdir()}
+
+    assert needed_files <= extracted_files
+    assert not (all_files - needed_files) & extracted_files
+
+
 # source is a URL
 
 
@@ -318,3 +350,131 @@ def test_resolver_removes_temporary_artifacts_if_inner_code_errors_out(
                 raise ValueError(msg)
 
             assert resolver._temp_dir is not None
+
+
+# cache
+
+
+def test_resolver_reuses_cached_release_when_url_validators_match(
+    http_server, outer_dne_zip_content, tmp_path
+):
+    http_server.content = outer_dne_zip_content
+    http_server.etag = '"release-1"'
+
+    with DneResolver(http_server.url, cache_dir=tmp_path) as dne_dir:
+        assert has_a_dne_file(dne_dir)
+        assert dne_dir.is_relative_to(tmp_path / "releases")
+
+    assert len(http_server.requested_ranges) == 1
+
+    # same release: nothing is downloaded
+    with DneResolver(http_server.url, cache_dir=tmp_path) as cached_dne_dir:
+        assert cached_dne_dir == dne_dir
+
+    assert len(http_server.requested_ranges) == 1
+
+    # the downloaded ZIP isn't kept, only the extracted files
+    assert list((tmp_path / "downloads").iterdir()) == []
+    assert list((tmp_path / "tmp").iterdir()) == []
+
+
+def test_resolver_reuses_cached_release_when_content_matches(
+    http_server, outer_dne_zip_content, tmp_path, mocker
+):
+    http_server.content = outer_dne_zip_content
+    http_server.etag = '"release-1"'
+
+    with DneResolver(http_server.url, cache_dir=tmp_path) as dne_dir:
+        pass
+
+    # the validators changed, but the content is the same: no extraction
+    http_server.etag = '"release-2"'
+    resolve_file_source = mocker.spy(DneResolver, "resolve_file_source")
+
+    with DneResolver(http_server.url, cache_dir=tmp_path) as cached_dne_dir:
+        assert cached_dne_dir == dne_dir
+
+    assert len(http_server.requested_ranges) == 2
+    resolve_file_source.assert_not_called()
+
+
+def test_resolver_caches_local_zip_files(outer_dne_zip_path, tmp_path, mocker):
+    with DneResolver(outer_dne_zip_path, cache_dir=tmp_path) as dne_dir:
+        assert has_a_dne_file(dne_dir)
+
+    resolve_file_source = mocker.spy(DneResolver, "resolve_file_source")
+
+    with DneResolver(outer_dne_zip_path, cache_dir=tmp_path) as cached_dne_dir:
+        assert cached_dne_dir == dne_dir
+
+    resolve_file_source.assert_not_called()
+    # the source file is kept
+    assert Path(outer_dne_zip_path).is_file()
+
+
+def test_resolver_does_not_cache_directories(temporary_dne_dir, tmp_path):
+    with DneResolver(temporary_dne_dir.outerdir, cache_dir=tmp_path) as dne_dir:
+        assert dne_dir == temporary_dne_dir.innerdir
+
+    assert list((tmp_path / "releases").iterdir()) == []
+
+
+# conditional fetch
+
+
+def test_resolver_raises_not_modified_for_unchanged_url(
+    http_server, outer_dne_zip_content
+):
+    http_server.content = outer_dne_zip_content
+    http_server.etag = '"release-1"'
+
+    resolver = DneResolver(http_server.url)
+    with resolver as dne_dir:
+        assert has_a_dne_file(dne_dir)
+
+    assert resolver.source_validators == {"etag": '"release-1"'}
+
+    with (
+        pytest.raises(DneNotModifiedError),
+        DneResolver(http_server.url, validators={"etag": '"release-1"'}),
+    ):
+        pass
+
+    # the server answered the conditional request without the content
+    assert len(http_server.requested_ranges) == 2
+
+    http_server.etag = '"release-2"'
+    with DneResolver(http_server.url, validators={"etag": '"release-1"'}) as dne_dir:
+        assert has_a_dne_file(dne_dir)
+
+
+def test_cached_resolver_raises_not_modified_before_downloading(
+    http_server, outer_dne_zip_content, tmp_path
+):
+    http_server.content = outer_dne_zip_content
+    http_server.etag = '"release-1"'
+
+    with (
+        pytest.raises(DneNotModifiedError),
+        DneResolver(
+            http_server.url, cache_dir=tmp_path, validators={"etag": '"release-1"'}
+        ),
+    ):
+        pass
+
+    assert http_server.head_requests == 1
+    assert http_server.requested_ranges == []
+
+
+def test_extract_dne_version(temporary_dne_dir):
+    dne_dir = temporary_dne_dir.innerdir
+    assert extract_dne_version(dne_dir) is None
+
+    (Path(temporary_dne_dir.outerdir) / "LEIAME.TXT").write_text(
+        "Banco de dados DNE versão 24021 - Fevereiro/2024", encoding="latin1"
+    )
+    assert extract_dne_version(dne_dir) == 24021
+
+    resolver = DneResolver(temporary_dne_dir.outerdir)
+    with resolver:
+        assert resolver.dne_version == 24021
@@ -0,0 +1,223 @@
+import pytest
+import sqlalchemy as sa
+
+from edne_correios_loader import CepSearcher
+from edne_correios_loader.search import build_search_rows, normalize_text
+from edne_correios_loader.tables import metadata
+
+sao_paulo = {
+    "complemento": None,
+    "bairro": None,
+    "municipio": "São Paulo",
+    "municipio_cod_ibge": 3550308,
+    "uf": "SP",
+    "nome": None,
+}
+
+ceps = [
+    {**sao_paulo, "cep": "01001000", "logradouro": "Praça da Sé"},
+    {
+        **sao_paulo,
+        "cep": "01310100",
+        "logradouro": "Avenida Paulista",
+        "complemento": "de 1 a 610 - lado par",
+    },
+    {
+        **sao_paulo,
+        "cep": "01310200",
+        "logradouro": "Avenida Paulista",
+        "complemento": "de 612 a 1510 - lado par",
+    },
+    {**sao_paulo, "cep": "01313000", "logradouro": "Brigadeiro Luís Antônio"},
+    {
+        **sao_paulo,
+        "cep": "20040002",
+        "logradouro": "Rua Paulista",
+        "municipio": "Rio de Janeiro",
+        "municipio_cod_ibge": 3304557,
+        "uf": "RJ",
+    },
+]
+
+
+@pytest.mark.parametrize(
+    ("texts", "expected"),
+    [
+        (["Praça da Sé"], "praca da se"),
+        (["Av. Brig. Luís Antônio", "Avenida"], "avenida brig luis antonio"),
+        (["R Mal Deodoro", None, ""], "rua marechal deodoro"),
+        (["Rodovia SP-055, km 12"], "rodovia sp 055 km 12"),
+    ],
+)
+def test_normalize_text(texts, expected):
+    assert normalize_text(*texts) == expected
+
+
+def test_build_search_rows_merges_the_texts_of_each_cep():
+    rows = [
+        ("01001000", "São Paulo", "SP", "Praça da Sé", None),
+        ("01001000", "São Paulo", "SP", "Praça", "Pç da Sé"),
+        ("01310100", "São Paulo", "SP", "Avenida Paulista", None),
+    ]
+
+    assert list(build_search_rows(rows)) == [
+        {
+            "cep": "01001000",
+            "municipio": "sao paulo",
+            "uf": "SP",
+            "texto": "praca da se",
+        },
+        {
+            "cep": "01310100",
+            "municipio": "sao paulo",
+            "uf": "SP",
+            "texto": "avenida paulista",
+        },
+    ]
+
+
+@pytest.fixture
+def cep_searcher(connection_url):
+    tables = [
+        metadata.tables[name]
+        for name in ["log_localidade", "log_bairro", "log_logradouro", "cep_unificado"]
+    ]
+
+    with sa.create_engine(connection_url).connect() as connection:
+        metadata.create_all(connection, tables=tables)
+
+        for table in reversed(tables):
+            connection.execute(table.delete())
+
+        connection.execute(metadata.tables["cep_unificado"].insert(), ceps)
+        # only searched through its street type and abbreviated name
+        connection.execute(
+            metadata.tables["log_logradouro"].insert(),
+            {
+                "log_nu": 1,
+                "ufe_sg": "SP",
+                "loc_nu": 1,
+                "bai_nu_ini": 1,
+                "log_no": "Brigadeiro Luís Antônio",
+                "cep": "01313000",
+                "tlo_tx": "Avenida",
+                "log_sta_tlo": "N",
+                "log_no_abrev": "Brg Luís Antônio",
+            },
+        )
+        connection.commit()
+
+    cep_searcher = CepSearcher(connection_url)
+    cep_searcher.build_index()
+
+    return cep_searcher
+
+
+def search_ceps(cep_searcher, *args, **kwargs):
+    return sorted(cep["cep"] for cep in cep_searcher.search(*args, **kwargs))
+
+
+def test_cep_searcher_finds_ceps_by_street(cep_searcher):
+    assert cep_searcher.search("PRACA DA SÉ") == [ceps[0]]
+    assert search_ceps(cep_searcher, "av paulist") == ["01310100", "01310200"]
+    assert search_ceps(cep_searcher, "avenida brg luis") == ["01313000"]
+    assert search_ceps(cep_searcher, "paulista") == ["01310100", "01310200", "20040002"]
+    assert search_ceps(cep_searcher, "rua da se") == []
+    assert cep_searcher.search(" - ") == []
+
+
+def test_cep_searcher_filters_by_municipio_and_uf(cep_searcher):
+    assert search_ceps(cep_searcher, "paulista", uf="rj") == ["20040002"]
+    assert search_ceps(cep_searcher, "paulista", municipio="SAO PAULO") == [
+        "01310100",
+        "01310200",
+    ]
+    assert search_ceps(cep_searcher, "paulista", municipio="Campinas") == []
+    assert len(cep_searcher.search("paulista", limit=2)) == 2
+
+
+def test_cep_searcher_finds_ceps_by_other_denominations(connection_url, cep_searcher):
+    tables = {
+        name: metadata.tables[name]
+        for name in ["log_var_loc", "log_var_bai", "log_var_log"]
+    }
+
+    with sa.create_engine(connection_url).connect() as connection:
+        metadata.create_all(connection, tables=tables.values())
+        connection.execute(
+            metadata.tables["cep_unificado"].insert(),
+            {
+                **sao_paulo,
+                "cep": "07750000",
+                "municipio": "Cajamar",
+                "municipio_cod_ibge": 3509205,
+            },
+        )
+        connection.execute(
+            metadata.tables["log_localidade"].insert(),
+            [
+                {
+                    "loc_nu": 1,
+                    "ufe_sg": "SP",
+                    "loc_no": "São Paulo",
+                    "cep": None,
+                    "loc_in_sit": "1",
+                    "loc_in_tipo_loc": "M",
+                    "mun_nu": 3550308,
+                },
+                {
+                    "loc_nu": 2,
+                    "ufe_sg": "SP",
+                    "loc_no": "Cajamar",
+                    "cep": "07750000",
+                    "loc_in_sit": "0",
+                    "loc_in_tipo_loc": "M",
+                    "mun_nu": 3509205,
+                },
+            ],
+        )
+        connection.execute(
+            metadata.tables["log_bairro"].insert(),
+            {"bai_nu": 1, "ufe_sg": "SP", "loc_nu": 1, "bai_no": "Bela Vista"},
+        )
+        connection.execute(
+            tables["log_var_loc"].insert(),
+            [
+                {"loc_nu": 2, "val_nu": 1, "val_tx": "Jordanésia"},
+                {"loc_nu": 1, "val_nu": 1, "val_tx": "Sampa"},
+            ],
+        )
+        connection.execute(
+            tables["log_var_bai"].insert(),
+            {"bai_nu": 1, "vdb_nu": 1, "vdb_tx": "Bixiga"},
+        )
+        connection.execute(
+            tables["log_var_log"].insert(),
+            {"log_nu": 1, "vlo_nu": 1, "tlo_tx": "Rua", "vlo_tx": "Caminho do Carro"},
+        )
+        connection.execute(
+            metadata.tables["cep_unificado"]
+            .update()
+            .where(metadata.tables["cep_unificado"].c.cep == "01313000")
+            .values(bairro="Bela Vista")
+        )
+        connection.commit()
+
+    cep_searcher.build_index()
+
+    assert search_ceps(cep_searcher, "rua caminho do carro") == ["01313000"]
+    assert search_ceps(cep_searcher, "brigadeiro bixiga") == ["01313000"]
+    assert search_ceps(cep_searcher, "jordanesia") == ["07750000"]
+    # the localidade has no CEP of its own, all the CEPs of its municipio have them
+    assert sorted(search_ceps(cep_searcher, "sampa")) == [
+        "01001000",
+        "01310100",
+        "01310200",
+        "01313000",
+    ]
+    assert search_ceps(cep_searcher, "sampa paulista") == ["01310100", "01310200"]
+    # the names of the streets are still searched
+    assert search_ceps(cep_searcher, "avenida brg luis") == ["01313000"]
+    # as well as the official names of the bairros and localidades
+    assert search_ceps(cep_searcher, "brigadeiro bela vista") == ["01313000"]
+    assert search_ceps(cep_searcher, "cajamar") == ["07750000"]
@@ -0,0 +1,165 @@
+import asyncio
+import datetime
+import json
+
+import pytest
+import sqlalchemy as sa
+
+from edne_correios_loader import CepQuerier
+from edne_correios_loader.server import CepServer
+from edne_correios_loader.state import load_info_table
+from edne_correios_loader.tables import metadata
+
+cep = {
+    "cep": "01001000",
+    "logradouro": "Praça da Sé",
+    "complemento": "lado ímpar",
+    "bairro": "Sé",
+    "municipio": "São Paulo",
+    "municipio_cod_ibge": 3550308,
+    "uf": "SP",
+    "nome": None,
+}
+
+
+@pytest.fixture
+def cep_server(connection_url):
+    cep_unificado = metadata.tables["cep_unificado"]
+
+    with sa.create_engine(connection_url).connect() as connection:
+        metadata.create_all(connection, tables=[cep_unificado])
+        connection.execute(cep_unificado.delete())
+        connection.execute(cep_unificado.insert(), cep)
+        connection.commit()
+
+    return CepServer(CepQuerier(connection_url), cache_size=2)
+
+
+async def request(server, *lines):
+    host, port = server.sockets[0].getsockname()[:2]
+    reader, writer = await asyncio.open_connection(host, port)
+
+    writer.write(b"".join(line + b"\n" for line in lines))
+    await writer.drain()
+    responses = [json.loads(await reader.readline()) for _ in lines]
+
+    writer.close()
+    await writer.wait_closed()
+
+    return responses
+
+
+def test_cep_server_answers_json_lines(cep_server):
+    async def run():
+        async with await cep_server.start(port=0) as server:
+            return await request(
+                server,
+                b"01001000",
+                b'{"cep": "01001-000"}',
+                b"99999999",
+                b'{"ce": "01001000"}',
+                b'{"cep": 1001000}',
+            )
+
+    assert asyncio.run(run()) == [
+        cep,
+        cep,
+        {"cep": "99999999", "error": "CEP not found"},
+        {"error": "Invalid request"},
+        {"error": "Invalid request"},
+    ]
+
+
+def test_cep_server_answers_concurrent_clients_over_unix_socket(cep_server, tmp_path):
+    socket_path = str(tmp_path / "cep.sock")
+
+    async def client():
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        writer.write(b"01001-000\n")
+        response = json.loads(await reader.readline())
+        writer.close()
+        await writer.wait_closed()
+        return response
+
+    async def run():
+        async with await cep_server.start(socket_path=socket_path):
+            return await asyncio.gather(*(client() for _ in range(10)))
+
+    assert asyncio.run(run()) == [cep] * 10
+
+
+def test_cep_server_rejects_long_requests(cep_server):
+    async def run():
+        async with await cep_server.start(port=0) as server:
+            return await request(server, b"0" * 2048)
+
+    assert asyncio.run(run()) == [{"error": "Request too long"}]
+
+
+def test_cep_server_caches_addresses_until_the_next_load(cep_server, mocker):
+    query = mocker.spy(cep_server.querier, "query")
+
+    async def run():
+        for c in ("01001000", "01001-000", "99999999", "88888888", "01001000"):
+            await cep_server.lookup(c)
+
+    asyncio.run(run())
+    # the first CEP is dropped from the cache by the last two
+    assert [c.args for c in query.call_args_list] == [
+        ("01001000",),
+        ("99999999",),
+        ("88888888",),
+        ("01001000",),
+    ]
+    assert list(cep_server.cache) == ["88888888", "01001000"]
+
+    with cep_server.querier.engine.connect() as connection:
+        load_info_table.create(connection)
+        connection.execute(
+            load_info_table.insert(),
+            {
+                "cep_table": "cep_unificado",
+                "table_set": "cep-tables",
+                "loaded_at": datetime.datetime(
+                    2024, 4, 1, tzinfo=datetime.timezone.utc
+                ),
+            },
+        )
+        connection.commit()
+
+    assert asyncio.run(cep_server.refresh()) is True
+    assert not cep_server.cache
+    assert asyncio.run(cep_server.refresh()) is False
+
+
+def test_cep_server_answers_lookup_errors(cep_server, mocker):
+    mocker.patch.object(
+        cep_server.querier, "query", side_effect=sa.exc.OperationalError("", {}, None)
+    )
+
+    async def run():
+        async with await cep_server.start(port=0) as server:
+            return await request(server, b"01001000", b"01001000")
+
+    # the connection is kept open for the next requests
+    assert asyncio.run(run()) == [{"cep": "01001000", "error": "Lookup failed"}] * 2
+    assert not cep_server.cache
+
+
+def test_cep_server_doesnt_cache_addresses_of_the_previous_load(cep_server, mocker):
+    def query(cep):
+        # the load finished while the CEP was looked up
+        cep_server.loaded_at = datetime.datetime(
+            2024, 4, 1, tzinfo=datetime.timezone.utc
+        )
+        return cep
+
+    mocker.patch.object(cep_server.querier, "query", side_effect=query)
+
+    assert asyncio.run(cep_server.lookup("01001000")) == "01001000"
+    assert not cep_server.cache
+
+
+def test_cep_server_rejects_negative_cache_sizes(connection_url):
+    with pytest.raises(ValueError, match="cache size can't be negative"):
+        CepServer(CepQuerier(connection_url), cache_size=-1)
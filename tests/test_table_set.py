@@ -4,6 +4,7 @@ from edne_correios_loader.table_set import (
     TableSetEnum,
     get_cep_tables,
     get_table_files_glob,
+    get_table_files_globs,
 )
 
 
@@ -25,6 +26,16 @@ def test_get_tables_files_glob():
     assert get_table_files_glob("cep_unificado") is None
 
 
+def test_get_tables_files_globs_restricted_to_ufs():
+    assert get_table_files_globs("log_logradouro") == ["LOG_LOGRADOURO_*.TXT"]
+    assert get_table_files_globs("log_logradouro", ufs=["RJ", "SP"]) == [
+        "LOG_LOGRADOURO_RJ.TXT",
+        "LOG_LOGRADOURO_SP.TXT",
+    ]
+    assert get_table_files_globs("log_bairro", ufs=["SP"]) == ["LOG_BAIRRO.TXT"]
+    assert get_table_files_globs("cep_unificado", ufs=["SP"]) == []
+
+
 @pytest.mark.parametrize(
     "table_set,tables_to_populate",
     [
@@ -0,0 +1,63 @@
+import pytest
+
+from edne_correios_loader.tables import get_table, metadata
+from edne_correios_loader.uf_filter import UfFilter, format_ufs, parse_ufs
+
+
+def test_parse_ufs_normalizes_and_sorts_ufs():
+    assert parse_ufs(["sp", " RJ", "SP", ""]) == ("RJ", "SP")
+    assert format_ufs(parse_ufs(["sp", "rj"])) == "RJ,SP"
+    assert format_ufs(None) is None
+
+
+@pytest.mark.parametrize(
+    ("ufs", "error"),
+    [(["SP", "XX"], "Unknown UF: XX"), ([""], "At least one UF")],
+)
+def test_parse_ufs_rejects_invalid_ufs(ufs, error):
+    with pytest.raises(ValueError, match=error):
+        parse_ufs(ufs)
+
+
+def test_uf_filter_cascades_through_the_referenced_rows():
+    uf_filter = UfFilter(["SP"])
+
+    keep_localidade = uf_filter.build_row_filter(get_table(metadata, "log_localidade"))
+    assert keep_localidade(["1", "SP", "São Paulo", None, "0", "M", None])
+    assert keep_localidade(["2", "SP", "Campinas", None, "0", "M", "1"])
+    assert not keep_localidade(["3", "RJ", "Rio de Janeiro", None, "0", "M", None])
+
+    keep_bairro = uf_filter.build_row_filter(get_table(metadata, "log_bairro"))
+    assert keep_bairro(["10", "SP", "1", "Centro"])
+    assert not keep_bairro(["11", "RJ", "3", "Centro"])
+
+    # rows without UF are kept when the rows they reference were kept
+    keep_var_loc = uf_filter.build_row_filter(get_table(metadata, "log_var_loc"))
+    assert keep_var_loc(["2", "1", "Campinas Velha"])
+    assert not keep_var_loc(["3", "1", "Rio"])
+
+    keep_faixa_bairro = uf_filter.build_row_filter(
+        get_table(metadata, "log_faixa_bairro")
+    )
+    assert keep_faixa_bairro(["10", "01000000", "01099999"])
+    assert not keep_faixa_bairro(["11", "20000000", "20099999"])
+
+    assert uf_filter.kept_keys["log_localidade", "loc_nu"] == {1, 2}
+    assert uf_filter.kept_keys["log_bairro", "bai_nu"] == {10}
+
+
+def test_uf_filter_keeps_rows_unrelated_to_ufs():
+    uf_filter = UfFilter(["SP"])
+
+    assert uf_filter.build_row_filter(get_table(metadata, "ect_pais")) is None
+
+
+def test_uf_filter_uses_the_keys_kept_by_a_previous_load():
+    uf_filter = UfFilter(["SP"])
+
+    uf_filter.build_row_filter(get_table(metadata, "log_localidade"))
+    assert uf_filter.get_kept_columns("log_localidade") == ["loc_nu"]
+    uf_filter.add_kept_keys("log_localidade", "loc_nu", [1])
+
+    keep_var_loc = uf_filter.build_row_filter(get_table(metadata, "log_var_loc"))
+    assert keep_var_loc(["1", "1", "Sampa"])
@@ -1,14 +1,67 @@
+import pytest
 import sqlalchemy as sa
 
 from edne_correios_loader.tables import (
     SituacaoLocalidadeEnum,
     TipoLocalidadeEnum,
-    metadata,
+    build_metadata,
+    create_cep_partitions,
 )
-from edne_correios_loader.unified_table import populate_unified_table
+from edne_correios_loader.tables import metadata as full_metadata
+from edne_correios_loader.unified_table import (
+    populate_unified_table,
+    project_metadata,
+    select_unified_ceps,
+)
+
+
+def test_project_metadata_keeps_only_the_columns_used():
+    metadata = project_metadata(full_metadata)
+
+    assert list(metadata.tables["log_bairro"].c.keys()) == ["bai_nu", "bai_no"]
+    assert list(metadata.tables["log_logradouro"].c.keys()) == [
+        "log_nu",
+        "ufe_sg",
+        "loc_nu",
+        "bai_nu_ini",
+        "log_no",
+        "cep",
+        "tlo_tx",
+        "log_sta_tlo",
+    ]
+    # tables which aren't used keep their primary keys only
+    assert list(metadata.tables["ect_pais"].c.keys()) == ["pai_sg"]
+    # the unified table and the relationships are kept
+    assert list(metadata.tables["cep_unificado"].c.keys()) == list(
+        full_metadata.tables["cep_unificado"].c.keys()
+    )
+    assert {
+        fk.target_fullname for fk in metadata.tables["log_localidade"].foreign_keys
+    } == {"log_localidade.loc_nu"}
+    assert metadata.info == full_metadata.info
+
+
+def test_project_metadata_keeps_the_unified_table_partitioning():
+    metadata = project_metadata(build_metadata(partition_unified_table=True))
+    cep_unificado = metadata.tables["cep_unificado"]
 
+    assert cep_unificado.dialect_options["postgresql"]["partition_by"] == "RANGE (cep)"
+    assert list(cep_unificado.dispatch.after_create) == [create_cep_partitions]
+
+
+def test_select_unified_ceps_has_the_unified_table_columns():
+    select = select_unified_ceps(full_metadata)
+
+    assert len(select.selects) == 6
+    assert list(select.selected_columns.keys()) == list(
+        full_metadata.tables["cep_unificado"].c.keys()
+    )
+
+
+@pytest.mark.parametrize("projected", [False, True])
+def test_populate_unified_table_populates_correctly(connection_url, projected):
+    metadata = project_metadata(full_metadata) if projected else full_metadata
 
-def test_populate_unified_table_populates_correctly(connection_url):
     # a municipality without a CEP (its logradouros have CEPs)
     localidade_sp = {
         "loc_nu": 123,
@@ -237,7 +290,10 @@ def test_populate_unified_table_populates_correctly(connection_url):
             ("log_unid_oper", unidades_operacionais),
         ):
             table = metadata.tables[table_name]
-            connection.execute(table.insert(), rows)
+            connection.execute(
+                table.insert(),
+                [{k: v for k, v in row.items() if k in table.c} for row in rows],
+            )
 
         populate_unified_table(connection, metadata, insert_batch_size=2)
 
@@ -363,3 +419,11 @@ def test_populate_unified_table_populates_correctly(connection_url):
                 "nome": uop_ba["uop_no"],
             },
         ]
+
+        if connection.dialect.name == "postgresql":
+            # the materialized view query normalizes the rows in SQL
+            view_rows = connection.execute(
+                select_unified_ceps(metadata).order_by("cep")
+            ).fetchall()
+
+            assert [r._mapping for r in view_rows] == rows